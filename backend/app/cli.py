@@ -0,0 +1,138 @@
+"""
+Command-line entry point for operational tasks, run from `backend/`:
+
+    python -m app.cli export rides --format csv --since 2026-01-01 --until 2026-02-01 -o rides.csv
+    python -m app.cli export queue --stand-id 3 > queue.ndjson
+    python -m app.cli queue-maintenance
+    python -m app.cli migrate [--dry-run]
+    python -m app.cli onboard drivers drivers.csv --batch-size 1000 2> rejected.ndjson
+"""
+import argparse
+import asyncio
+import csv
+import json
+import sys
+from datetime import datetime
+
+from app.services import export_service
+
+
+def _export(args) -> int:
+    out = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        for chunk in export_service.iter_export(args.kind, args.format, args.since, args.until,
+                                                args.stand_id, args.batch_size):
+            out.write(chunk)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+def _queue_maintenance(args) -> int:
+    from app.services import queue_maintenance
+    from app.services.event_bus import bus
+
+    async def run():
+        # the running workers learn about expired entries (queue caches, driver sockets) over the bus
+        await bus.start()
+        try:
+            expired = await queue_maintenance.expire_stale() if args.expire else 0
+            archived = await queue_maintenance.archive_history()
+        finally:
+            await bus.stop()
+        print(f"expired {expired} waiting entries, archived {archived} finished rows")
+
+    asyncio.run(run())
+    return 0
+
+
+def _migrate(args) -> int:
+    from app.services import migrations
+
+    applied = migrations.migrate(dry_run=args.dry_run)
+    verb = "would apply" if args.dry_run else "applied"
+    print(f"{verb}: {', '.join(applied)}" if applied else "schema is up to date")
+    return 0
+
+
+def _read_rows(path: str):
+    """CSV (header row; empty cells count as missing) or JSON lines, one object per line."""
+    with open(path, newline="") as f:
+        if path.endswith(".csv"):
+            for row in csv.DictReader(f):
+                yield {key: value for key, value in row.items() if value != ""}
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _onboard(args) -> int:
+    from app.database import db_session
+    from app.services import onboarding
+    from app.services.event_bus import bus
+
+    onboard = {"stands": onboarding.onboard_stands, "drivers": onboarding.onboard_drivers,
+               "users": onboarding.onboard_users}[args.kind]
+
+    async def run():
+        created = failed = 0
+        rows = list(_read_rows(args.file))
+        # new stands reach the running workers' stand index and response caches over the bus
+        await bus.start()
+        try:
+            for offset in range(0, len(rows), args.batch_size):
+                async with db_session() as db:
+                    result = await onboard(db, rows[offset:offset + args.batch_size])
+                created += len(result["created"])
+                failed += len(result["errors"])
+                for error in result["errors"]:
+                    error["index"] += offset  # row of the file (0 = first data row), not of the batch
+                    sys.stderr.write(json.dumps(error) + "\n")
+        finally:
+            await bus.stop()
+        print(f"created {created} {args.kind}, rejected {failed}")
+        return 1 if failed else 0
+
+    return asyncio.run(run())
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="stream ride or stand-queue history as NDJSON or CSV")
+    export.add_argument("kind", choices=sorted(export_service.EXPORTS))
+    export.add_argument("--format", choices=sorted(export_service.FORMATS), default="ndjson")
+    export.add_argument("--since", type=datetime.fromisoformat, help="inclusive, ISO 8601 (UTC if no offset)")
+    export.add_argument("--until", type=datetime.fromisoformat, help="exclusive, ISO 8601 (UTC if no offset)")
+    export.add_argument("--stand-id", type=int)
+    export.add_argument("--batch-size", type=int, default=export_service.DEFAULT_BATCH_SIZE,
+                        help="rows per server-side cursor fetch")
+    export.add_argument("-o", "--output", help="file to write (default: stdout)")
+    export.set_defaults(handler=_export)
+
+    maintenance = commands.add_parser("queue-maintenance",
+                                      help="expire stale waiting entries and archive finished queue rows once")
+    maintenance.add_argument("--no-expire", dest="expire", action="store_false", help="only archive")
+    maintenance.set_defaults(handler=_queue_maintenance)
+
+    migrate = commands.add_parser("migrate", help="create the schema or apply pending sql/migrations (before deploys)")
+    migrate.add_argument("--dry-run", action="store_true", help="only list what would be applied")
+    migrate.set_defaults(handler=_migrate)
+
+    onboard = commands.add_parser("onboard", help="bulk-create stands, drivers or users from CSV or JSON lines; "
+                                  "rejected rows go to stderr as JSON lines")
+    onboard.add_argument("kind", choices=["stands", "drivers", "users"])
+    onboard.add_argument("file", help="*.csv with a header row, anything else is read as JSON lines")
+    onboard.add_argument("--batch-size", type=int, default=1000, help="rows per validation pass and INSERT")
+    onboard.set_defaults(handler=_onboard)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,5 @@
 from pydantic_settings import BaseSettings
+from typing import Optional
 import os
 from dotenv import load_dotenv
 
@@ -11,4 +12,131 @@ class Settings(BaseSettings):
     JWT_ALGORITHM: str = os.getenv("JWT_ALGORITHM", "HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 60))
 
+    # Async DB stack (AsyncEngine + AsyncSession); the sync engine is always kept for scripts and the benches.
+    # ASYNC_DATABASE_URL defaults to DATABASE_URL with an async driver (asyncpg / aiosqlite).
+    ASYNC_DB: bool = os.getenv("ASYNC_DB", "false").lower() in ("1", "true", "yes")
+    ASYNC_DATABASE_URL: Optional[str] = os.getenv("ASYNC_DATABASE_URL")
+
+    # Connection pool (ignored for SQLite). Recycle below the pooler's idle timeout to avoid stale connections.
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", 5))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", 10))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", 30))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", 1800))
+    DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+    # Postgres statement_timeout in milliseconds, 0 = server default
+    DB_STATEMENT_TIMEOUT_MS: int = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 0))
+
+    # Render JSON responses with orjson (ORJSONResponse) instead of the stdlib json encoder
+    ORJSON_RESPONSES: bool = os.getenv("ORJSON_RESPONSES", "false").lower() in ("1", "true", "yes")
+
+    # Request profiling middleware (cheap enough to stay on): per-route latency, SQL statements per request
+    # and N+1 detection, i.e. one statement run at least PROFILING_N_PLUS_ONE_THRESHOLD times in a request.
+    # The stack sampler behind GET /metrics/profile is off unless enabled, runs capped at MAX_SECONDS.
+    PROFILING_ENABLED: bool = os.getenv("PROFILING_ENABLED", "true").lower() in ("1", "true", "yes")
+    PROFILING_N_PLUS_ONE_THRESHOLD: int = int(os.getenv("PROFILING_N_PLUS_ONE_THRESHOLD", 10))
+    PROFILING_SAMPLER_ENABLED: bool = os.getenv("PROFILING_SAMPLER_ENABLED", "false").lower() in ("1", "true", "yes")
+    PROFILING_SAMPLER_MAX_SECONDS: float = float(os.getenv("PROFILING_SAMPLER_MAX_SECONDS", 60))
+
+    # Authenticated principal cache (LRU + TTL), keyed by (role, subject)
+    AUTH_PRINCIPAL_CACHE_SIZE: int = int(os.getenv("AUTH_PRINCIPAL_CACHE_SIZE", 10000))
+    AUTH_PRINCIPAL_CACHE_TTL: float = float(os.getenv("AUTH_PRINCIPAL_CACHE_TTL", 60))
+    # Let id-only endpoints trust the signed token claims instead of loading the principal
+    AUTH_TRUST_TOKEN_CLAIMS: bool = os.getenv("AUTH_TRUST_TOKEN_CLAIMS", "false").lower() in ("1", "true", "yes")
+
+    # Rendered-response cache (LRU + TTL) for stand and driver profile reads; writes through the app
+    # invalidate entries explicitly, the TTL (seconds, 0 = no caching) bounds staleness for other writers
+    RESPONSE_CACHE_STAND_SIZE: int = int(os.getenv("RESPONSE_CACHE_STAND_SIZE", 2000))
+    RESPONSE_CACHE_STAND_TTL: float = float(os.getenv("RESPONSE_CACHE_STAND_TTL", 300))
+    RESPONSE_CACHE_DRIVER_SIZE: int = int(os.getenv("RESPONSE_CACHE_DRIVER_SIZE", 10000))
+    RESPONSE_CACHE_DRIVER_TTL: float = float(os.getenv("RESPONSE_CACHE_DRIVER_TTL", 60))
+
+    # Rate limits (token buckets per worker) per client: the JWT subject, or the client IP without a
+    # valid token and always on /auth. Each route draws on a budget (services/admission.py); RATE_LIMITS
+    # overrides budgets as "budget=rate/burst,..." in requests per second, e.g. "queue_read=1/5,auth=0.2/5"
+    RATE_LIMIT_ENABLED: bool = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+    RATE_LIMITS: str = os.getenv("RATE_LIMITS", "")
+    RATE_LIMIT_MAX_CLIENTS: int = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", 100000))
+    # Load shedding per worker: normal and low-priority requests get 503 beyond ADMISSION_MAX_IN_FLIGHT
+    # requests in flight (0 = no cap), and low-priority reads beyond ADMISSION_LOW_PRIORITY_IN_FLIGHT
+    # while the smoothed DB pool wait is above ADMISSION_SHED_POOL_WAIT_MS. Ride booking and queue
+    # pops/joins are never shed.
+    ADMISSION_MAX_IN_FLIGHT: int = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", 256))
+    ADMISSION_LOW_PRIORITY_IN_FLIGHT: int = int(os.getenv("ADMISSION_LOW_PRIORITY_IN_FLIGHT", 4))
+    ADMISSION_SHED_POOL_WAIT_MS: float = float(os.getenv("ADMISSION_SHED_POOL_WAIT_MS", 50))
+
+    # Argon2 cost (passlib defaults: time 2, memory 100 MiB, parallelism 8)
+    ARGON2_TIME_COST: int = int(os.getenv("ARGON2_TIME_COST", 2))
+    ARGON2_MEMORY_COST: int = int(os.getenv("ARGON2_MEMORY_COST", 102400))  # KiB
+    ARGON2_PARALLELISM: int = int(os.getenv("ARGON2_PARALLELISM", 8))
+    # Password hashing pool: "thread" (argon2 releases the GIL) or "process"
+    PASSWORD_HASH_EXECUTOR: str = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", max((os.cpu_count() or 2) // 2, 1)))
+    # Extra niceness for "process" workers so the OS favours request handling over hashing
+    PASSWORD_HASH_NICE: int = int(os.getenv("PASSWORD_HASH_NICE", 10))
+    # Jobs running + queued before /auth and sign-up return 503
+    PASSWORD_HASH_MAX_PENDING: int = int(os.getenv("PASSWORD_HASH_MAX_PENDING", 64))
+    # Bulk onboarding hashes outside that budget: at most BULK_WORKERS of its jobs on the pool at once
+    # (keep it below PASSWORD_HASH_WORKERS so logins always find a worker) and BULK_MAX_BATCHES batches
+    # running or waiting before another one gets 503
+    PASSWORD_HASH_BULK_WORKERS: int = int(os.getenv("PASSWORD_HASH_BULK_WORKERS", max((os.cpu_count() or 2) // 4, 1)))
+    PASSWORD_HASH_BULK_MAX_BATCHES: int = int(os.getenv("PASSWORD_HASH_BULK_MAX_BATCHES", 2))
+
+    # Bulk onboarding (POST .../bulk, `python -m app.cli onboard`): rows per request. The HTTP routes
+    # are admin-only: users whose email is in ADMIN_EMAILS (comma-separated)
+    ADMIN_EMAILS: str = os.getenv("ADMIN_EMAILS", "")
+    ONBOARDING_MAX_ROWS: int = int(os.getenv("ONBOARDING_MAX_ROWS", 10000))
+
+    # WebSocket push: per-connection outbox size, server ping interval and idle timeout (seconds),
+    # and channels per connection (its own plus the stand channels it subscribes to)
+    WS_SEND_QUEUE_SIZE: int = int(os.getenv("WS_SEND_QUEUE_SIZE", 100))
+    WS_HEARTBEAT_INTERVAL: float = float(os.getenv("WS_HEARTBEAT_INTERVAL", 20))
+    WS_HEARTBEAT_TIMEOUT: float = float(os.getenv("WS_HEARTBEAT_TIMEOUT", 60))
+    WS_MAX_SUBSCRIPTIONS: int = int(os.getenv("WS_MAX_SUBSCRIPTIONS", 50))
+
+    # Cross-worker event bus: "postgres" (LISTEN/NOTIFY) or "memory"; empty = postgres when DATABASE_URL is Postgres
+    EVENT_BUS_BACKEND: str = os.getenv("EVENT_BUS_BACKEND", "")
+    EVENT_BUS_CHANNEL: str = os.getenv("EVENT_BUS_CHANNEL", "heyauto_events")
+    # Batching window; events with the same key inside one window are coalesced
+    EVENT_BUS_FLUSH_MS: int = int(os.getenv("EVENT_BUS_FLUSH_MS", 20))
+
+    # Driver live locations: grid cell size of the in-memory index, how often (seconds) the latest
+    # points are bulk-written to the DB, max points per ingest request, and how old a point may be
+    # before the driver drops out of nearby queries
+    LOCATION_GRID_CELL_METRES: float = float(os.getenv("LOCATION_GRID_CELL_METRES", 500))
+    LOCATION_FLUSH_INTERVAL: float = float(os.getenv("LOCATION_FLUSH_INTERVAL", 2))
+    LOCATION_MAX_BATCH: int = int(os.getenv("LOCATION_MAX_BATCH", 500))
+    LOCATION_STALE_SECONDS: float = float(os.getenv("LOCATION_STALE_SECONDS", 120))
+
+    # Driver availability toggles and heartbeats: how often (seconds) the coalesced values are
+    # bulk-written to drivers.is_available / last_seen_at. Keep it well below QUEUE_HEARTBEAT_TIMEOUT.
+    AVAILABILITY_FLUSH_INTERVAL: float = float(os.getenv("AVAILABILITY_FLUSH_INTERVAL", 2))
+
+    # Ride assignment: how many stands to try (requested stand first, then nearest to the pickup)
+    # and how far from the pickup point a stand may be
+    ASSIGNMENT_MAX_STANDS: int = int(os.getenv("ASSIGNMENT_MAX_STANDS", 5))
+    ASSIGNMENT_MAX_RADIUS_M: float = float(os.getenv("ASSIGNMENT_MAX_RADIUS_M", 5000))
+    # Batched matching: collect ride requests for this many ms and assign each group sharing the
+    # same candidate stands in one transaction (0 = one transaction per ride), up to BATCH_MAX rides
+    ASSIGNMENT_BATCH_WINDOW_MS: int = int(os.getenv("ASSIGNMENT_BATCH_WINDOW_MS", 0))
+    ASSIGNMENT_BATCH_MAX: int = int(os.getenv("ASSIGNMENT_BATCH_MAX", 64))
+
+    # Idempotency-Key on ride creation and queue join/pop: how long (seconds) a key and its stored
+    # response are kept, how many recent responses each worker also keeps in memory, and how often /
+    # how many expired keys per transaction the scheduler deletes
+    IDEMPOTENCY_TTL: float = float(os.getenv("IDEMPOTENCY_TTL", 86400))
+    IDEMPOTENCY_CACHE_SIZE: int = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", 10000))
+    IDEMPOTENCY_PURGE_INTERVAL: float = float(os.getenv("IDEMPOTENCY_PURGE_INTERVAL", 300))
+    IDEMPOTENCY_PURGE_BATCH: int = int(os.getenv("IDEMPOTENCY_PURGE_BATCH", 5000))
+
+    # Background scheduler (services/scheduler.py). Waiting queue rows of drivers not heard from
+    # (availability change, queue join or location ping) for QUEUE_HEARTBEAT_TIMEOUT seconds are
+    # expired (0 = never); assigned/left/expired rows older than QUEUE_ARCHIVE_MIN_AGE seconds move
+    # to stand_queue_history, QUEUE_ARCHIVE_BATCH rows per transaction. Intervals in seconds.
+    SCHEDULER_ENABLED: bool = os.getenv("SCHEDULER_ENABLED", "true").lower() in ("1", "true", "yes")
+    QUEUE_HEARTBEAT_TIMEOUT: float = float(os.getenv("QUEUE_HEARTBEAT_TIMEOUT", 300))
+    QUEUE_EXPIRY_INTERVAL: float = float(os.getenv("QUEUE_EXPIRY_INTERVAL", 30))
+    QUEUE_ARCHIVE_INTERVAL: float = float(os.getenv("QUEUE_ARCHIVE_INTERVAL", 60))
+    QUEUE_ARCHIVE_MIN_AGE: float = float(os.getenv("QUEUE_ARCHIVE_MIN_AGE", 60))
+    QUEUE_ARCHIVE_BATCH: int = int(os.getenv("QUEUE_ARCHIVE_BATCH", 5000))
+
 settings = Settings()
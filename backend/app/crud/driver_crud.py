@@ -1,12 +1,21 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from datetime import datetime, timedelta
 from fastapi import HTTPException, status
+from sqlalchemy import bindparam, select, update
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
-from app.model import Driver, AutoStand
+from app.database import insert_skipping_conflicts
+from app.model import Driver, AutoStand, StandQueue
 from app.schemas import DriverCreate, DriverUpdate
 from app.utils.security import hash_password
+from app.utils.auth import invalidate_principal
+from app.utils.availability import driver_availability, share as share_availability
+from app.utils.locations import DriverLocation, driver_locations
+from app.utils.pagination import Page, paginate
+from app.utils.response_cache import invalidate_driver
 
 # ---------------- Create ----------------
-def create_driver(db: Session, driver_data: DriverCreate):
+def create_driver(db: Session, driver_data: DriverCreate, password_hash: Optional[str] = None):
     # check if auto stand exists
     stand = db.query(AutoStand).filter(AutoStand.id == driver_data.stand_id).first()
     if not stand:
@@ -22,7 +31,7 @@ def create_driver(db: Session, driver_data: DriverCreate):
         phone=driver_data.phone,
         stand_id=driver_data.stand_id,
         is_available=driver_data.is_available,
-        password=hash_password(driver_data.password)
+        password=password_hash or hash_password(driver_data.password)
     )
 
     db.add(new_driver)
@@ -35,6 +44,31 @@ def create_driver(db: Session, driver_data: DriverCreate):
     return new_driver
 
 
+def insert_drivers(db: Session, rows: List[dict]) -> list:
+    """
+    Bulk onboarding: multi-row INSERT ... RETURNING of validated rows (passwords already hashed).
+    A phone registered meanwhile skips its row instead of failing the batch; the caller
+    finds it missing from the result. Returns plain rows of the response columns, which
+    (unlike ORM objects) are not expired by the commit and reloaded one by one.
+    """
+    if not rows:
+        return []
+    stmt = insert_skipping_conflicts(db, Driver, Driver.phone).returning(
+        Driver.id, Driver.name, Driver.phone, Driver.stand_id, Driver.is_available)
+    try:
+        created = db.execute(stmt, rows).all()
+        db.commit()
+    except IntegrityError:
+        # a stand deleted since the batch was validated
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Could not create drivers (DB integrity error)")
+    return created
+
+
+def existing_phones(db: Session, phones: Iterable[str]) -> Set[str]:
+    return set(db.scalars(select(Driver.phone).where(Driver.phone.in_(set(phones)))))
+
+
 # ---------------- Read ----------------
 def get_driver_by_id(db: Session, driver_id: int):
     return db.query(Driver).filter(Driver.id == driver_id).first()
@@ -44,8 +78,12 @@ def get_driver_by_phone(db: Session, phone: str):
     return db.query(Driver).filter(Driver.phone == phone).first()
 
 
-def get_drivers(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(Driver).offset(skip).limit(limit).all()
+def get_drivers(db: Session, limit: int = 100, cursor: Optional[str] = None, skip: int = 0,
+                stand_id: Optional[int] = None) -> Page:
+    query = db.query(Driver)
+    if stand_id is not None:
+        query = query.filter(Driver.stand_id == stand_id)
+    return paginate(query, [Driver.id], (int,), limit, cursor=cursor, skip=skip)
 
 
 # ---------------- Update ----------------
@@ -54,6 +92,7 @@ def update_driver(db: Session, driver_id: int, driver_data: DriverUpdate):
     if not driver:
         raise HTTPException(status_code=404, detail="Driver not found")
 
+    old_phone = driver.phone
     driver.name = driver_data.name or driver.name
     driver.phone = driver_data.phone or driver.phone
     driver.stand_id = driver_data.stand_id or driver.stand_id
@@ -62,6 +101,11 @@ def update_driver(db: Session, driver_id: int, driver_data: DriverUpdate):
 
     db.commit()
     db.refresh(driver)
+    if driver_data.is_available is not None:
+        driver_availability.set(driver_id, driver.is_available, dirty=False)
+        share_availability(driver_id, driver.is_available)
+    invalidate_principal("driver", driver_id)
+    invalidate_driver(driver_id, old_phone, driver.phone)
     return driver
 
 
@@ -71,8 +115,14 @@ def delete_driver(db: Session, driver_id: int):
     if not driver:
         raise HTTPException(status_code=404, detail="Driver not found")
 
+    phone = driver.phone
     db.delete(driver)
     db.commit()
+    invalidate_principal("driver", driver_id)
+    invalidate_driver(driver_id, phone)
+    driver_locations.remove(driver_id)
+    driver_availability.remove(driver_id)
+    share_availability(driver_id, None)
     return {"status": "success", "message": f"Driver {driver_id} deleted"}
 
 
@@ -100,22 +150,103 @@ def delete_driver(db: Session, driver_id: int):
 
 # ---------------- Set availability ----------------
 def set_availability(db: Session, driver_id: int, available: bool) -> Driver:
+    """
+    Write availability straight through to the DB (scripts/admin use). Driver toggles and
+    heartbeats go through services/availability_service and are flushed in bulk.
+    """
     driver = db.query(Driver).filter(Driver.id == driver_id).first()
     if not driver:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Driver not found")
 
     driver.is_available = bool(available)
+    driver.last_seen_at = datetime.utcnow()
     db.add(driver)
     db.commit()
     db.refresh(driver)
+    driver_availability.set(driver_id, driver.is_available, dirty=False)
+    share_availability(driver_id, driver.is_available)
+    invalidate_driver(driver_id, driver.phone)
     return driver
 
 
+def bulk_update_availability(db: Session, available: Dict[int, bool], seen: Dict[int, datetime]) -> List[Tuple[int, str]]:
+    """
+    Persist coalesced availability toggles (one UPDATE per value) and heartbeats (one Core
+    executemany, as in bulk_update_locations). Returns (id, phone) of the drivers whose
+    availability was written, for cache invalidation.
+    """
+    drivers = Driver.__table__
+    written = []
+    for value in (True, False):
+        ids = [driver_id for driver_id, flag in available.items() if flag is value]
+        if ids:
+            written += db.execute(update(drivers).where(drivers.c.id.in_(ids)).values(is_available=value)
+                                  .returning(drivers.c.id, drivers.c.phone)).all()
+    if seen:
+        stmt = update(drivers).where(drivers.c.id == bindparam("driver_id")).values(last_seen_at=bindparam("seen_at"))
+        db.execute(stmt, [{"driver_id": driver_id, "seen_at": seen_at} for driver_id, seen_at in seen.items()])
+    db.commit()
+    for driver_id, phone in written:
+        invalidate_driver(driver_id, phone)
+    return written
+
+
+def load_availability_cache(db: Session) -> int:
+    """Rebuild the set of waiting drivers that pops pass over (waiting, but not available)."""
+    rows = db.scalars(
+        select(StandQueue.driver_id)
+        .join(Driver, Driver.id == StandQueue.driver_id)
+        .where(StandQueue.status == "waiting", Driver.is_available.isnot(True))
+    ).all()
+    driver_availability.rebuild(rows)
+    return len(rows)
+
+
 # ---------------- Update location ----------------
 def update_location(db: Session, driver_id: int, lat: float, lng: float) -> Driver:
     """
-    Currently not implemented because  Driver model doesn't have latitude/longitude columns.
+    Write one position straight through to the DB (scripts/admin use).
+    Live GPS pings go through services/location_service.ingest and are flushed in bulk.
+    """
+    driver = db.query(Driver).filter(Driver.id == driver_id).first()
+    if not driver:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Driver not found")
+
+    driver.latitude = lat
+    driver.longitude = lng
+    driver.location_updated_at = driver.last_seen_at = datetime.utcnow()
+    db.commit()
+    db.refresh(driver)
+    driver_locations.update(DriverLocation(driver_id, lat, lng, driver.location_updated_at), dirty=False)
+    return driver
+
 
+def bulk_update_locations(db: Session, locations: List[DriverLocation]) -> int:
     """
-    raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED,
-                        detail="Location tracking not implemented. Add latitude/longitude to Driver model and DB migration first.")
+    Persist many latest positions as a single Core executemany. Not the ORM bulk UPDATE:
+    that one raises StaleDataError when a driver was deleted since its last ping.
+    """
+    if not locations:
+        return 0
+    drivers = Driver.__table__
+    # a ping is also a heartbeat; flush time is close enough to when it arrived
+    stmt = (update(drivers)
+            .where(drivers.c.id == bindparam("driver_id"))
+            .values(latitude=bindparam("lat"), longitude=bindparam("lng"),
+                    location_updated_at=bindparam("recorded_at"), last_seen_at=datetime.utcnow()))
+    db.execute(stmt, [
+        {"driver_id": loc.driver_id, "lat": loc.lat, "lng": loc.lng, "recorded_at": loc.recorded_at}
+        for loc in locations
+    ])
+    db.commit()
+    return len(locations)
+
+
+def load_location_cache(db: Session, max_age_seconds: float) -> int:
+    """Rebuild the in-memory location index from positions newer than `max_age_seconds`."""
+    cutoff = datetime.utcnow() - timedelta(seconds=max_age_seconds)
+    rows = (db.query(Driver.id, Driver.latitude, Driver.longitude, Driver.location_updated_at)
+            .filter(Driver.location_updated_at >= cutoff, Driver.latitude.isnot(None))
+            .all())
+    driver_locations.rebuild(DriverLocation(*row) for row in rows)
+    return len(rows)
@@ -0,0 +1,105 @@
+"""
+Idempotency keys, stored in the transaction of the request they belong to.
+
+A CRUD function given an IdempotentRequest calls `claim()` first: it inserts the key
+(ON CONFLICT DO NOTHING) and, if the key exists, returns its stored response, which
+the caller hands back after rolling back. Otherwise the function does its work and calls
+`record()` with the result just before its commit, so the key and its response commit
+or roll back together with the ride, join or pop:
+
+  - a retry that arrives after the commit finds the stored response
+  - a concurrent retry on another worker waits on the key's primary key until the first
+    transaction ends, then finds the response (or, if it rolled back, runs itself)
+  - a failed request leaves no key behind, so its retry runs again
+
+services/idempotency.py adds the in-memory layer in front of this.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Optional
+
+from fastapi import HTTPException, status
+from pydantic import BaseModel
+from sqlalchemy import delete, select, tuple_
+from sqlalchemy.orm import Session
+
+from app.database import insert_skipping_conflicts, try_advisory_xact_lock
+from app.model import IdempotencyKey
+
+# advisory lock key of the purge, next to the queue maintenance keys in stand_crud
+PURGE_LOCK_KEY = 0x48410004
+
+
+@dataclass(frozen=True)
+class StoredResponse:
+    fingerprint: str
+    status_code: int
+    body: bytes
+
+
+class IdempotentRequest:
+    """A keyed request: where its key lives, what it asked for, and how its result renders."""
+
+    def __init__(self, scope: str, key: str, fingerprint: str, render: Callable[[Any], BaseModel],
+                 status_code: int = 200):
+        self.scope = scope
+        self.key = key
+        self.fingerprint = fingerprint
+        self.render = render
+        self.status_code = status_code
+        self.response: Optional[StoredResponse] = None  # set by record()
+
+    def check(self, stored: StoredResponse) -> StoredResponse:
+        if stored.fingerprint != self.fingerprint:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                                detail="Idempotency-Key was already used with a different request")
+        return stored
+
+
+def claim(db: Session, request: IdempotentRequest) -> Optional[StoredResponse]:
+    """Take the key in the current transaction; returns the stored response if it was already used."""
+    stmt = (insert_skipping_conflicts(db, IdempotencyKey, IdempotencyKey.scope, IdempotencyKey.key)
+            .values(scope=request.scope, key=request.key, fingerprint=request.fingerprint,
+                    created_at=datetime.utcnow())
+            .returning(IdempotencyKey.key))
+    if db.execute(stmt).first() is not None:
+        return None
+    row = db.execute(
+        select(IdempotencyKey.fingerprint, IdempotencyKey.status_code, IdempotencyKey.body)
+        .where(IdempotencyKey.scope == request.scope, IdempotencyKey.key == request.key)
+    ).first()
+    if row.body is None:
+        # committed without a response: only a caller that commits before record() leaves this
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail="A request with this Idempotency-Key is still being processed")
+    return request.check(StoredResponse(row.fingerprint, row.status_code, row.body.encode()))
+
+
+def record(db: Session, request: IdempotentRequest, result) -> None:
+    """Store the rendered response of `result` with the claimed key (before the caller commits)."""
+    body = request.render(result).model_dump_json()
+    db.query(IdempotencyKey).filter(
+        IdempotencyKey.scope == request.scope, IdempotencyKey.key == request.key
+    ).update({"status_code": request.status_code, "body": body}, synchronize_session=False)
+    request.response = StoredResponse(request.fingerprint, request.status_code, body.encode())
+
+
+def purge_expired(db: Session, older_than: datetime, batch_size: int) -> int:
+    """
+    Delete up to `batch_size` keys created before `older_than`. Returns the number deleted;
+    call again until it is below `batch_size`.
+    """
+    if not try_advisory_xact_lock(db, PURGE_LOCK_KEY):
+        db.rollback()
+        return 0
+    expired = (select(IdempotencyKey.scope, IdempotencyKey.key)
+               .where(IdempotencyKey.created_at < older_than)
+               .order_by(IdempotencyKey.created_at)
+               .limit(batch_size))
+    count = db.execute(
+        delete(IdempotencyKey)
+        .where(tuple_(IdempotencyKey.scope, IdempotencyKey.key).in_(expired))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    return count
@@ -1,41 +1,232 @@
-from fastapi import HTTPException
+from typing import List, Optional
+from fastapi import HTTPException, status
+from sqlalchemy import DateTime, Float, Integer, bindparam, null, func, select, update, insert, literal, case, exists
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from app.model import Ride, User, Driver
+from app.model import ACTIVE_RIDE_STATUSES, Ride, User, Driver, AutoStand, StandQueue
 from app.schemas import RideCreate, RideUpdate
-from app.crud import stand_crud
+from app.crud import idempotency_crud, stand_crud
+from app.crud.idempotency_crud import IdempotentRequest
+from app.database import violated_constraint
+from app.services import notification_service, ride_assignment
+from app.utils.pagination import Page, paginate
 from datetime import datetime
 
 # ---------------- Create Ride ----------------
-def create_ride(db: Session, ride: RideCreate):
-    # Optional: check if user exists
+# Postgres' default name for the rides.user_id foreign key (schema.sql and create_all alike)
+USER_FK = "rides_user_id_fkey"
+
+def create_ride(db: Session, ride: RideCreate, idempotency: Optional[IdempotentRequest] = None):
+    """
+    Create a ride and assign the next waiting driver in the same transaction. Candidate
+    stands come from services/ride_assignment.py (the requested stand first, then the
+    nearest ones to the pickup point); the first candidate with a waiting driver wins.
+    A ride is never committed with a popped driver lost.
+
+    With `idempotency` the key is claimed in that transaction too: a key already used
+    returns its StoredResponse instead, without creating (or assigning) anything.
+    """
+    stand_ids = ride_assignment.candidate_stands(ride.stand_id, ride.pickup_lat, ride.pickup_lng)
+    if idempotency is not None:
+        stored = idempotency_crud.claim(db, idempotency)
+        if stored is not None:
+            db.rollback()
+            return stored
+    if stand_ids and db.get_bind().dialect.name == "postgresql":
+        new_ride = _create_ride_with_pop(db, ride, stand_ids, idempotency)
+    else:
+        new_ride = _create_ride_sequential(db, ride, stand_ids, idempotency)
+
+    if new_ride.driver_id:
+        # the claimed row joined before the ride was accepted; a rejoin since then is newer
+        stand_crud.cache_remove(new_ride.driver_id, new_ride.accepted_at)
+        notification_service.ride_assigned(new_ride)
+        # the driver may have come from a fallback stand; ride.stand_id says which
+        notification_service.queue_changed(new_ride.stand_id)
+    return new_ride
+
+
+def _create_ride_with_pop(db: Session, ride: RideCreate, stand_ids: List[int],
+                          idempotency: Optional[IdempotentRequest]) -> Ride:
+    # One statement, one round-trip:
+    #   WITH popped AS (UPDATE stand_queue ... WHERE id = (oldest waiting across the candidate
+    #                   stands in preference order, FOR UPDATE SKIP LOCKED) RETURNING driver_id, stand_id)
+    #   INSERT INTO rides SELECT ..., (SELECT driver_id FROM popped), ... [WHERE <stand exists>] RETURNING *
+    # The user FK makes the whole statement (including the pop) fail for an unknown user.
+    popped = (
+        update(StandQueue)
+        .where(StandQueue.id == stand_crud.next_waiting_id_across(stand_ids), StandQueue.status == "waiting")
+        .values(status="assigned")
+        .returning(StandQueue.id, StandQueue.driver_id, StandQueue.stand_id)
+        .cte("popped")
+    )
+    now = datetime.utcnow()
+    assigned = exists(select(popped.c.id))
+    source = select(
+        literal(ride.user_id),
+        select(popped.c.driver_id).scalar_subquery(),
+        literal(ride.start_location),
+        literal(ride.end_location),
+        literal(ride.pickup_lat, Float),
+        literal(ride.pickup_lng, Float),
+        func.coalesce(select(popped.c.stand_id).scalar_subquery(), literal(ride.stand_id, Integer)),
+        case((assigned, "accepted"), else_="pending"),
+        literal(now, DateTime),
+        case((assigned, literal(now, DateTime)), else_=null()),
+    )
+    if ride.stand_id:
+        source = source.where(exists(select(AutoStand.id).where(AutoStand.id == ride.stand_id)))
+    stmt = (
+        insert(Ride)
+        .from_select(["user_id", "driver_id", "start_location", "end_location", "pickup_lat", "pickup_lng",
+                      "stand_id", "status", "requested_at", "accepted_at"], source)
+        .returning(Ride)
+        .add_cte(popped)
+    )
+    try:
+        new_ride = db.scalars(select(Ride).from_statement(stmt)).first()
+    except IntegrityError as exc:
+        db.rollback()
+        if violated_constraint(exc) == USER_FK:
+            raise HTTPException(status_code=404, detail="User not found")
+        # the stand or the popped driver was deleted while the ride was being booked
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail="Ride could not be booked, please retry") from exc
+    if not new_ride:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Stand not found")
+    # keep the RETURNING values as-is instead of expiring and re-selecting the row after COMMIT
+    db.expunge(new_ride)
+    if idempotency is not None:
+        idempotency_crud.record(db, idempotency, new_ride)
+    db.commit()
+    return new_ride
+
+
+def _create_ride_sequential(db: Session, ride: RideCreate, stand_ids: List[int],
+                            idempotency: Optional[IdempotentRequest]) -> Ride:
+    # Portable path (SQLite, or no candidate stand): same single transaction, statement by statement.
     user = db.query(User).filter(User.id == ride.user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    
+
     new_ride = Ride(
         user_id=ride.user_id,
         start_location=ride.start_location,
         end_location=ride.end_location,
+        pickup_lat=ride.pickup_lat,
+        pickup_lng=ride.pickup_lng,
+        stand_id=ride.stand_id,
         status="pending",
         requested_at=datetime.utcnow()
     )
 
+    if ride.stand_id:
+        stand = db.query(AutoStand).filter(AutoStand.id == ride.stand_id).first()
+        if not stand:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Stand not found")
+    if stand_ids:
+        entry = db.execute(
+            update(StandQueue)
+            .where(StandQueue.id == stand_crud.next_waiting_id_across(stand_ids), StandQueue.status == "waiting")
+            .values(status="assigned")
+            .returning(StandQueue.driver_id, StandQueue.stand_id)
+            .execution_options(synchronize_session=False)
+        ).first()
+        if entry:
+            new_ride.driver_id = entry.driver_id
+            new_ride.stand_id = entry.stand_id
+            new_ride.status = "accepted"
+            new_ride.accepted_at = new_ride.requested_at
+
     db.add(new_ride)
+    if idempotency is not None:
+        db.flush()  # the ride id goes into the stored response
+        idempotency_crud.record(db, idempotency, new_ride)
     db.commit()
     db.refresh(new_ride)
-
-    # Try to auto-assign if stand_id provided
-    if getattr(ride, "stand_id", None):
-        popped = stand_crud.pop_next_driver(db, ride.stand_id)
-        if popped:
-            new_ride.driver_id = popped.driver_id
-            new_ride.status = "accepted"
-            db.add(new_ride)
-            db.commit()
-            db.refresh(new_ride)
-            # TODO: notify driver via websocket/push
     return new_ride
 
+# ---------------- Create Rides (batch) ----------------
+def create_rides_batch(db: Session, rides: List[RideCreate], stand_ids: List[int],
+                       idempotency: Optional[List[Optional[IdempotentRequest]]] = None) -> list:
+    """
+    Create a burst of rides that share the same candidate stands (in arrival order) and assign
+    them in one transaction: one UPDATE claims as many waiting drivers as there are rides, in
+    the order single pops would take them, and one multi-row INSERT ... RETURNING stores the
+    rides with the i-th oldest driver on the i-th ride. Used by the batch matcher in
+    services/ride_assignment.py.
+
+    `idempotency` holds the key of each ride, if any (see create_ride); keys are claimed
+    only for rides that pass validation, so a rejected ride leaves no key behind.
+
+    Returns one entry per input ride: the Ride, the StoredResponse of a key already used,
+    or the HTTPException that ride would have raised.
+    """
+    results: list = [None] * len(rides)
+    known_users = set(db.scalars(select(User.id).where(User.id.in_({r.user_id for r in rides}))))
+    requested_stands = {r.stand_id for r in rides if r.stand_id}
+    known_stands = set(db.scalars(select(AutoStand.id).where(AutoStand.id.in_(requested_stands)))) if requested_stands else set()
+    valid = []
+    for i, ride in enumerate(rides):
+        if ride.user_id not in known_users:
+            results[i] = HTTPException(status_code=404, detail="User not found")
+        elif ride.stand_id and ride.stand_id not in known_stands:
+            results[i] = HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Stand not found")
+        else:
+            valid.append(i)
+    if idempotency is not None:
+        valid = [i for i in valid if not _replayed(db, idempotency[i], results, i)]
+    if not valid:
+        db.rollback()
+        return results
+
+    claimed = stand_crud.claim_waiting_across(db, stand_ids, len(valid)) if stand_ids else []
+    now = datetime.utcnow()
+    params = []
+    for n, i in enumerate(valid):
+        ride = rides[i]
+        entry = claimed[n] if n < len(claimed) else None
+        params.append({
+            "user_id": ride.user_id, "driver_id": entry.driver_id if entry else None,
+            "start_location": ride.start_location, "end_location": ride.end_location,
+            "pickup_lat": ride.pickup_lat, "pickup_lng": ride.pickup_lng,
+            "stand_id": entry.stand_id if entry else ride.stand_id,
+            "status": "accepted" if entry else "pending", "requested_at": now,
+            "accepted_at": now if entry else None,
+        })
+    new_rides = db.scalars(insert(Ride).returning(Ride, sort_by_parameter_order=True), params).all()
+    db.expunge_all()
+    if idempotency is not None:
+        for i, new_ride in zip(valid, new_rides):
+            if idempotency[i] is not None:
+                idempotency_crud.record(db, idempotency[i], new_ride)
+    db.commit()
+
+    for i, new_ride in zip(valid, new_rides):
+        results[i] = new_ride
+    for entry, new_ride in zip(claimed, new_rides):
+        stand_crud.cache_remove(entry.driver_id, entry.joined_at)
+        notification_service.ride_assigned(new_ride)
+    for stand_id in {entry.stand_id for entry in claimed}:
+        notification_service.queue_changed(stand_id)
+    return results
+
+
+def _replayed(db: Session, request: Optional[IdempotentRequest], results: list, i: int) -> bool:
+    """Claim the key of ride `i`; False if the ride is to be created, else its result is set."""
+    if request is None:
+        return False
+    try:
+        stored = idempotency_crud.claim(db, request)
+    except HTTPException as exc:
+        results[i] = exc
+        return True
+    if stored is None:
+        return False
+    results[i] = stored
+    return True
+
 # ---------------- Get Ride by ID ----------------
 def get_ride_by_id(db: Session, ride_id: int):
     ride = db.query(Ride).filter(Ride.id == ride_id).first()
@@ -43,15 +234,132 @@ def get_ride_by_id(db: Session, ride_id: int):
         raise HTTPException(status_code=404, detail="Ride not found")
     return ride
 
-# ---------------- Update Ride ----------------
-def update_ride(db: Session, ride_id: int, ride_data: RideUpdate):
-    ride = get_ride_by_id(db, ride_id)
-    for key, value in ride_data.dict(exclude_unset=True).items():
-        setattr(ride, key, value)
+# ---------------- Ride lifecycle ----------------
+# target status -> (statuses it may be entered from, timestamp column it records)
+RIDE_TRANSITIONS = {
+    "accepted": (("pending",), "accepted_at"),
+    "ongoing": (("accepted",), "started_at"),
+    "completed": (("ongoing",), "completed_at"),
+    "cancelled": (("pending", "accepted"), "cancelled_at"),
+}
+
+# rendered inline so the planner can match the partial indexes ix_rides_*_active even for prepared statements
+_ACTIVE = Ride.status.in_(bindparam("active_statuses", ACTIVE_RIDE_STATUSES, expanding=True, literal_execute=True))
+
+
+def transition_ride(db: Session, ride_id: int, target: str, driver_id: Optional[int] = None,
+                    user_id: Optional[int] = None, acting_driver_id: Optional[int] = None) -> Ride:
+    """
+    Move a ride to `target` with one conditional UPDATE ... WHERE status IN (<allowed sources>)
+    RETURNING. Concurrent transitions race inside that statement instead of behind a read
+    lock: of two conflicting requests exactly one matches the row, the other gets 409.
+
+    `driver_id` is the driver to assign on accept; that driver also leaves any queue. `user_id`
+    and `acting_driver_id` restrict the update to rides of that user / assigned driver (403).
+    """
+    if target not in RIDE_TRANSITIONS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Cannot move a ride to {target}")
+    if (target == "accepted") != (driver_id is not None):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="driver_id is required to accept a ride and only allowed then")
+    sources, stamp = RIDE_TRANSITIONS[target]
+    conditions = [Ride.id == ride_id, Ride.status.in_(sources)]
+    if user_id is not None:
+        conditions.append(Ride.user_id == user_id)
+    if acting_driver_id is not None:
+        conditions.append(Ride.driver_id == acting_driver_id)
+    values = {"status": target, stamp: datetime.utcnow()}
+    if driver_id is not None:
+        values["driver_id"] = driver_id
+
+    # default synchronize_session: a Ride already loaded in this session gets the new values too
+    stmt = update(Ride).where(*conditions).values(**values).returning(Ride)
+    try:
+        ride = db.execute(stmt).scalars().first()
+        left_queue = _leave_queue_on_accept(db, driver_id) if ride and driver_id else None
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Driver not found")
+    if ride is None:
+        db.rollback()
+        _raise_transition_error(db, ride_id, target, user_id, acting_driver_id)
+    db.expunge(ride)
     db.commit()
-    db.refresh(ride)
+
+    if target == "accepted":
+        if left_queue:
+            stand_crud.cache_remove(driver_id, left_queue.joined_at)
+            notification_service.queue_changed(left_queue.stand_id)
+        notification_service.ride_assigned(ride)
+    else:
+        notification_service.ride_updated(ride)
     return ride
 
+
+def _leave_queue_on_accept(db: Session, driver_id: int):
+    # a driver who takes a ride by hand must not also be popped for the next one;
+    # returns the (stand_id, joined_at) of the row taken off the queue, if any
+    return db.execute(
+        update(StandQueue)
+        .where(StandQueue.driver_id == driver_id, StandQueue.status == "waiting")
+        .values(status="assigned")
+        .returning(StandQueue.stand_id, StandQueue.joined_at)
+        .execution_options(synchronize_session=False)
+    ).first()
+
+
+def _raise_transition_error(db: Session, ride_id: int, target: str,
+                            user_id: Optional[int], acting_driver_id: Optional[int]):
+    # only reached when the conditional UPDATE matched nothing: find out why
+    ride = db.query(Ride.status, Ride.user_id, Ride.driver_id).filter(Ride.id == ride_id).first()
+    db.rollback()
+    if not ride:
+        raise HTTPException(status_code=404, detail="Ride not found")
+    if (user_id is not None and ride.user_id != user_id) or \
+            (acting_driver_id is not None and ride.driver_id != acting_driver_id):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not your ride")
+    raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Cannot move a {ride.status} ride to {target}")
+
+# ---------------- Update Ride ----------------
+def update_ride(db: Session, ride_id: int, ride_data: RideUpdate, user_id: Optional[int] = None,
+                acting_driver_id: Optional[int] = None):
+    """
+    Status changes go through the state machine with the caller's rights, as on the lifecycle
+    routes: a rider (`user_id`) may only cancel their own ride, a driver (`acting_driver_id`)
+    accepts for themselves (a driver_id alone means accept) and moves only rides assigned to them.
+    """
+    data = ride_data.dict(exclude_unset=True)
+    driver_id = data.get("driver_id")
+    target = data.get("status") or ("accepted" if driver_id is not None else None)
+    if target is None:
+        return get_ride_by_id(db, ride_id)
+    if user_id is not None and target != "cancelled":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Riders can only cancel a ride")
+    if target == "accepted":
+        if acting_driver_id is None or driver_id not in (None, acting_driver_id):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="A driver can only accept a ride for themselves")
+        return transition_ride(db, ride_id, target, driver_id=acting_driver_id)
+    return transition_ride(db, ride_id, target, driver_id=driver_id, user_id=user_id,
+                           acting_driver_id=acting_driver_id)
+
+# ---------------- Active Rides ----------------
+def get_active_rides(db: Session, user_id: Optional[int] = None, driver_id: Optional[int] = None) -> List[Ride]:
+    """In-flight rides of a user or driver, newest first; served by ix_rides_user_active / ix_rides_driver_active."""
+    column, value = (Ride.user_id, user_id) if user_id is not None else (Ride.driver_id, driver_id)
+    return (db.query(Ride)
+              .filter(column == value, _ACTIVE)
+              .order_by(Ride.requested_at.desc(), Ride.id.desc())
+              .all())
+
 # ---------------- List Rides ----------------
-def get_rides(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(Ride).offset(skip).limit(limit).all()
+def get_rides(db: Session, limit: int = 100, cursor: Optional[str] = None, skip: int = 0,
+              status: Optional[str] = None, user_id: Optional[int] = None,
+              driver_id: Optional[int] = None, stand_id: Optional[int] = None) -> Page:
+    """Newest first, keyset-paginated on (requested_at, id); each filter has a matching index."""
+    query = db.query(Ride)
+    for column, value in ((Ride.status, status), (Ride.user_id, user_id),
+                          (Ride.driver_id, driver_id), (Ride.stand_id, stand_id)):
+        if value is not None:
+            query = query.filter(column == value)
+    return paginate(query, [Ride.requested_at, Ride.id], (datetime.fromisoformat, int), limit,
+                    cursor=cursor, descending=True, skip=skip)
@@ -1,19 +1,58 @@
 from fastapi import HTTPException, status
-from sqlalchemy import select
-from sqlalchemy.orm import Session
+from typing import Iterable, List, Optional, Set
+from sqlalchemy import select, update, delete, insert, func, and_, or_, case
+from sqlalchemy.orm import Session, aliased
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from datetime import datetime
-from app.model import AutoStand, Driver, StandQueue
+from app.crud import idempotency_crud
+from app.crud.idempotency_crud import IdempotentRequest
+from app.database import try_advisory_xact_lock
+from app.model import AutoStand, Driver, StandQueue, StandQueueHistory
 from app.schemas import AutoStandCreate, AutoStandUpdate
+from app.utils.availability import driver_availability, share as share_availability
+from app.utils.pagination import Page, paginate
+from app.utils.queue import QueueEntry, stand_queues
+from app.utils.response_cache import invalidate_stand
+from app.utils.stand_index import stand_index
+from app.services import notification_service
+from app.services.event_bus import bus
+
+
+def _queue_entry(row: StandQueue) -> QueueEntry:
+    return QueueEntry(id=row.id, stand_id=row.stand_id, driver_id=row.driver_id,
+                      joined_at=row.joined_at, status=row.status)
 
 # ---------------- Create Stand ----------------
 def create_stand(db: Session, stand: AutoStandCreate):
-    new_stand = AutoStand(name=stand.name, location=stand.location)
+    new_stand = AutoStand(name=stand.name, location=stand.location,
+                          latitude=stand.latitude, longitude=stand.longitude)
     db.add(new_stand)
     db.commit()
     db.refresh(new_stand)
+    index_stand(new_stand)
+    invalidate_stand(new_stand.id)
     return new_stand
 
+def insert_stands(db: Session, rows: List[dict]) -> list:
+    """
+    Bulk onboarding: multi-row INSERT ... RETURNING, in the order given. Returns plain
+    rows, see driver_crud.insert_drivers.
+    """
+    if not rows:
+        return []
+    stmt = insert(AutoStand).returning(AutoStand.id, AutoStand.name, AutoStand.location, AutoStand.latitude,
+                                       AutoStand.longitude, sort_by_parameter_order=True)
+    created = db.execute(stmt, rows).all()
+    db.commit()
+    for stand in created:
+        index_stand(stand)
+    invalidate_stand()
+    return created
+
+
+def existing_stand_ids(db: Session, stand_ids: Iterable[int]) -> Set[int]:
+    return set(db.scalars(select(AutoStand.id).where(AutoStand.id.in_(set(stand_ids)))))
+
 # ---------------- Get Stand ----------------
 def get_stand(db: Session, stand_id: int):
     stand = db.query(AutoStand).filter(AutoStand.id == stand_id).first()
@@ -28,14 +67,94 @@ def update_stand(db: Session, stand_id: int, stand_data: AutoStandUpdate):
         setattr(stand, key, value)
     db.commit()
     db.refresh(stand)
+    index_stand(stand)
+    invalidate_stand(stand_id)
     return stand
 
 # ---------------- List Stands ----------------
-def get_stands(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(AutoStand).offset(skip).limit(limit).all()
+def get_stands(db: Session, limit: int = 100, cursor: Optional[str] = None, skip: int = 0) -> Page:
+    return paginate(db.query(AutoStand), [AutoStand.id], (int,), limit, cursor=cursor, skip=skip)
+
+# ---------------- Stand Index ----------------
+def load_stand_index(db: Session) -> int:
+    """Rebuild the in-memory stand index from every stand (those with coordinates go on the grid)."""
+    rows = db.query(AutoStand.id, AutoStand.latitude, AutoStand.longitude).all()
+    stand_index.rebuild(rows)
+    return len(rows)
+
+
+def index_stand(stand: AutoStand) -> None:
+    stand_index.upsert(stand.id, stand.latitude, stand.longitude)
+    bus.publish("stand", [stand.id, stand.latitude, stand.longitude], key=stand.id)
+
+
+def _apply_remote_stand(row: list, local: bool) -> None:
+    if not local:
+        stand_index.upsert(*row)
+
+
+bus.subscribe("stand", _apply_remote_stand)
+
+# ---------------- Queue Cache ----------------
+def load_queue_cache(db: Session) -> int:
+    """Rebuild the in-memory stand queues from all `waiting` rows. Returns the number of entries loaded."""
+    since = stand_queues.begin_rebuild()
+    try:
+        rows = db.query(StandQueue).filter(StandQueue.status == "waiting").all()
+    except Exception:
+        stand_queues.abort_rebuild()
+        raise
+    stand_queues.rebuild((_queue_entry(r) for r in rows), since)
+    return len(rows)
+
+
+# Every committed queue change is applied to this worker's cache right away and
+# broadcast on the event bus so the other workers' caches follow.
+def cache_push(entry: QueueEntry) -> None:
+    stand_queues.push(entry)
+    bus.publish("queue", {"op": "push", "id": entry.id, "stand_id": entry.stand_id,
+                          "driver_id": entry.driver_id, "joined_at": entry.joined_at.isoformat()})
+
+
+def cache_remove(driver_id: int, joined_before: Optional[datetime] = None) -> Optional[QueueEntry]:
+    """Drop the driver's cached entry; pass the removed row's joined_at so a newer rejoin survives."""
+    entry = stand_queues.remove(driver_id, joined_before)
+    bus.publish("queue", {"op": "remove", "driver_id": driver_id,
+                          "joined_before": joined_before.isoformat() if joined_before else None})
+    return entry
+
+
+def _apply_remote_queue_op(op: dict, local: bool) -> None:
+    if local:
+        return
+    if op["op"] == "push":
+        stand_queues.push(QueueEntry(id=op["id"], stand_id=op["stand_id"], driver_id=op["driver_id"],
+                                     joined_at=datetime.fromisoformat(op["joined_at"])))
+    else:
+        joined_before = op.get("joined_before")
+        stand_queues.remove(op["driver_id"], datetime.fromisoformat(joined_before) if joined_before else None)
+
+
+bus.subscribe("queue", _apply_remote_queue_op)
 
 # ---------------- Add Driver to Queue ----------------
-def add_driver_to_queue(db: Session, stand_id: int, driver_id: int) -> StandQueue:
+def _mark_available(driver_id: int) -> None:
+    # committed with the join; supersedes a toggle still waiting in the store for its flush
+    driver_availability.set(driver_id, True, dirty=False)
+    share_availability(driver_id, True)
+
+def add_driver_to_queue(db: Session, stand_id: int, driver_id: int,
+                        idempotency: Optional[IdempotentRequest] = None):
+    """
+    Put the driver at the back of the stand's queue (or return their waiting row). With
+    `idempotency`, a key already used returns its StoredResponse instead (see ride_crud.create_ride).
+    """
+    if idempotency is not None:
+        stored = idempotency_crud.claim(db, idempotency)
+        if stored is not None:
+            db.rollback()
+            return stored
+
     # ensure stand exists
     stand = db.query(AutoStand).filter(AutoStand.id == stand_id).first()
     if not stand:
@@ -52,10 +171,18 @@ def add_driver_to_queue(db: Session, stand_id: int, driver_id: int) -> StandQueu
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Driver does not belong to this stand"
         )
+    # joining counts as a heartbeat (see queue expiry) and makes the driver available to pops
+    driver.last_seen_at = datetime.utcnow()
+    driver.is_available = True
     
     # check if already in queue and still waiting
     existing = db.query(StandQueue).filter(StandQueue.driver_id == driver_id, StandQueue.status == "waiting").first()
     if existing:
+        if idempotency is not None:
+            idempotency_crud.record(db, idempotency, existing)
+        db.commit()
+        _mark_available(driver_id)
+        cache_push(_queue_entry(existing))
         return existing
     
     entry = StandQueue(
@@ -67,37 +194,170 @@ def add_driver_to_queue(db: Session, stand_id: int, driver_id: int) -> StandQueu
 
     db.add(entry)
     try:
+        if idempotency is not None:
+            db.flush()
+            idempotency_crud.record(db, idempotency, entry)
         db.commit()
     except IntegrityError:
         db.rollback()
+        # lost a race against a concurrent join: uq_stand_queue_driver_waiting kept the other row
+        # (the key went with the rollback; a retry finds that row again)
+        existing = db.query(StandQueue).filter(StandQueue.driver_id == driver_id, StandQueue.status == "waiting").first()
+        if existing:
+            cache_push(_queue_entry(existing))
+            return existing
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Could not join queue")
     db.refresh(entry)
+    _mark_available(driver_id)
+    cache_push(_queue_entry(entry))
+    notification_service.queue_changed(stand_id)
     return entry
 
 # ---------------- Remove Driver from Queue ----------------
 def remove_driver_from_queue(db: Session, driver_id: int) -> None:
-    entry = db.query(StandQueue).filter(StandQueue.driver_id == driver_id, StandQueue.status == "waiting").first()
+    # conditional UPDATE: a pop or booking that assigned the row first wins, and the
+    # driver gets a 404 instead of silently undoing that assignment
+    entry = db.execute(
+        update(StandQueue)
+        .where(StandQueue.driver_id == driver_id, StandQueue.status == "waiting")
+        .values(status="left")
+        .returning(StandQueue)
+        .execution_options(synchronize_session=False)
+    ).scalars().first()
+    db.commit()
+    cache_remove(driver_id, entry.joined_at if entry else None)
     if not entry:
         return None
-    entry.status = "left"
-    db.add(entry)
-    db.commit()
-    db.refresh(entry)
+    notification_service.queue_changed(entry.stand_id)
     return entry
 
 # ---------------- Get Queue ----------------
 def get_queue(db: Session, stand_id: int):
+    # served from the in-memory queue once it has been loaded at startup
+    if stand_queues.ready:
+        return stand_queues.entries(stand_id)
     entries = (db.query(StandQueue)
                  .filter(StandQueue.stand_id == stand_id, StandQueue.status == "waiting")
                  .order_by(StandQueue.joined_at.asc())
                  .all())
     return entries
 
+# ---------------- Queue Position ----------------
+def get_queue_position(db: Session, stand_id: int, driver_id: int):
+    """1-based rank of a waiting driver in the stand queue, or None if not waiting there."""
+    if stand_queues.ready:
+        return stand_queues.position(stand_id, driver_id)
+
+    # count the waiting rows ahead of the driver; an index-only scan on ix_stand_queue_waiting
+    me = aliased(StandQueue)
+    ahead = aliased(StandQueue)
+    stmt = (
+        select(func.count(ahead.id))
+        .select_from(me)
+        .outerjoin(ahead, and_(
+            ahead.stand_id == me.stand_id,
+            ahead.status == "waiting",
+            or_(ahead.joined_at < me.joined_at,
+                and_(ahead.joined_at == me.joined_at, ahead.id < me.id)),
+        ))
+        .where(me.stand_id == stand_id, me.driver_id == driver_id, me.status == "waiting")
+        .group_by(me.id)
+    )
+    ahead_count = db.execute(stmt).scalar()
+    return None if ahead_count is None else ahead_count + 1
+
 # ---------------- Pop Driver ----------------
-def pop_next_driver(db: Session, stand_id: int):
+def _skip_unavailable(stmt):
+    # drivers who went unavailable keep their place but are passed over; read from the
+    # availability store, not drivers.is_available (the statement is unchanged when nobody is)
+    unavailable = driver_availability.unavailable()
+    return stmt.where(StandQueue.driver_id.notin_(unavailable)) if unavailable else stmt
+
+
+def next_waiting_id(stand_id: int):
+    """
+    Scalar subquery: id of the oldest waiting row of a stand whose driver is available,
+    row-locked, skipping rows other pops hold.
     """
-    Transaction-safe pop: selects the oldest waiting StandQueue row for the given stand,
-    locks it (FOR UPDATE SKIP LOCKED), marks it as 'assigned' and returns the entry.
+    return _skip_unavailable(
+        select(StandQueue.id)
+        .where(StandQueue.stand_id == stand_id, StandQueue.status == "waiting")
+        .order_by(StandQueue.joined_at.asc(), StandQueue.id.asc())
+        .with_for_update(skip_locked=True)
+        .limit(1)
+    ).scalar_subquery()
+
+
+def _waiting_across(stand_ids: List[int]):
+    # waiting rows of several stands: by stand preference (position in `stand_ids`), then FIFO
+    preference = case({sid: rank for rank, sid in enumerate(stand_ids)}, value=StandQueue.stand_id)
+    return _skip_unavailable(
+        select(StandQueue.id)
+        .where(StandQueue.stand_id.in_(stand_ids), StandQueue.status == "waiting")
+        .order_by(preference, StandQueue.joined_at.asc(), StandQueue.id.asc())
+        .with_for_update(skip_locked=True)
+    )
+
+
+def next_waiting_id_across(stand_ids: List[int]):
+    """
+    Like next_waiting_id, over several stands in preference order: the oldest waiting row
+    of the first stand in `stand_ids` that has an unlocked one.
+    """
+    if len(stand_ids) == 1:
+        return next_waiting_id(stand_ids[0])
+    return _waiting_across(stand_ids).limit(1).scalar_subquery()
+
+
+def claim_waiting_across(db: Session, stand_ids: List[int], limit: int) -> list:
+    """
+    Mark up to `limit` waiting rows as assigned in one UPDATE ... RETURNING, taking them in the
+    same order pops would (stand preference, then FIFO). Returns (id, driver_id, stand_id,
+    joined_at) rows in that order. Does not commit.
+    """
+    rank = {sid: i for i, sid in enumerate(stand_ids)}
+    rows = db.execute(
+        update(StandQueue)
+        .where(StandQueue.id.in_(_waiting_across(stand_ids).limit(limit)), StandQueue.status == "waiting")
+        .values(status="assigned")
+        .returning(StandQueue.id, StandQueue.driver_id, StandQueue.stand_id, StandQueue.joined_at)
+        .execution_options(synchronize_session=False)
+    ).all()
+    # RETURNING order is unspecified
+    return sorted(rows, key=lambda r: (rank[r.stand_id], r.joined_at, r.id))
+
+
+def warm_pop_claims(db: Session) -> None:
+    """Run both pop claims (cached head by id, DB fallback) with ids that match nothing, then roll back; for warm-up."""
+    _claim_entry(db, 0)
+    _claim_entry(db, next_waiting_id(0))
+    db.rollback()
+
+
+def _claim_entry(db: Session, entry_id: int):
+    # conditional UPDATE: only succeeds if nobody else assigned/removed the row first
+    stmt = (
+        update(StandQueue)
+        .where(StandQueue.id == entry_id, StandQueue.status == "waiting")
+        .values(status="assigned")
+        .returning(StandQueue)
+        .execution_options(synchronize_session=False)
+    )
+    return db.execute(stmt).scalars().first()
+
+
+def pop_next_driver(db: Session, stand_id: int, idempotency: Optional[IdempotentRequest] = None):
+    """
+    Transaction-safe pop of the oldest waiting StandQueue row for the given stand
+    whose driver is available (per the in-memory availability store).
+
+    The in-memory queue supplies the candidate head in O(1); it is claimed with a
+    conditional UPDATE so concurrent pops (or another worker) can never assign the
+    same row twice. If the cache has no candidate, falls back to the locked
+    SELECT (FOR UPDATE SKIP LOCKED).
+
+    With `idempotency`, a key already used returns its StoredResponse instead of popping
+    another driver (see ride_crud.create_ride); an empty queue stores nothing.
 
     Returns None if no waiting driver exists.
     """
@@ -106,33 +366,117 @@ def pop_next_driver(db: Session, stand_id: int):
     stand = db.query(AutoStand).filter(AutoStand.id == stand_id).first()
     if not stand:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Stand not found")
+    if idempotency is not None:
+        stored = idempotency_crud.claim(db, idempotency)
+        if stored is not None:
+            db.rollback()
+            return stored
 
     try:
-        # Use a transaction context so the SELECT FOR UPDATE and update happen atomically.
-        with db.begin():
-            stmt = (
-                select(StandQueue)
-                .where(StandQueue.stand_id == stand_id, StandQueue.status == "waiting")
-                .order_by(StandQueue.joined_at.asc())
-                .with_for_update(skip_locked=True)
-                .limit(1)
-            )
-            result = db.execute(stmt).scalars().first()
+        result = None
+        unavailable = driver_availability.unavailable()
+        candidate = stand_queues.peek(stand_id, skip=unavailable)
+        while candidate:
+            result = _claim_entry(db, candidate.id)
+            if result:
+                break
+            # stale head (already popped / left through another session): drop it and retry
+            cache_remove(candidate.driver_id, candidate.joined_at)
+            candidate = stand_queues.peek(stand_id, skip=unavailable)
+
+        if not result:
+            # claimed with the same conditional UPDATE: without row locks (SQLite) two
+            # sessions can read the same head, and only one of them may assign it
+            result = _claim_entry(db, next_waiting_id(stand_id))
 
             if not result:
                 # no waiting drivers (or all waiting rows locked by other transactions)
+                db.rollback()
                 return None
 
-            # mark as assigned within the same transaction
-            result.status = "assigned"
-            result.assigned_at = datetime.utcnow()
-            db.add(result)
-            # leaving the with db.begin() block will commit --> When the with block ends: If there is NO error → SQLAlchemy runs COMMIT, If there IS an error → SQLAlchemy runs ROLLBACK automatically
-      
+        if idempotency is not None:
+            idempotency_crud.record(db, idempotency, result)
+        db.commit()
         db.refresh(result)
+        cache_remove(result.driver_id, result.joined_at)
+        notification_service.queue_changed(stand_id)
         return result
 
     except SQLAlchemyError as exc:
-        # Rollback handled by the context manager, but we still raise an HTTP error
+        db.rollback()
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail="Database error when popping next driver") from exc
+
+
+# ---------------- Queue Expiry ----------------
+# advisory lock keys: one worker per round does the work, the others skip it
+EXPIRY_LOCK_KEY = 0x48410001
+ARCHIVE_LOCK_KEY = 0x48410002
+
+
+def expire_stale_waiting(db: Session, cutoff: datetime) -> int:
+    """
+    Expire the waiting rows of drivers not seen since `cutoff` (driver.last_seen_at), so pops
+    stop handing rides to drivers whose app has died. One conditional UPDATE: a row popped or
+    left concurrently no longer matches status = 'waiting' and is left alone.
+    """
+    if not try_advisory_xact_lock(db, EXPIRY_LOCK_KEY):
+        db.rollback()
+        return 0
+    stale_drivers = select(Driver.id).where(or_(Driver.last_seen_at.is_(None), Driver.last_seen_at < cutoff))
+    rows = db.execute(
+        update(StandQueue)
+        .where(StandQueue.status == "waiting", StandQueue.joined_at < cutoff,
+               StandQueue.driver_id.in_(stale_drivers))
+        .values(status="expired")
+        .returning(StandQueue.driver_id, StandQueue.stand_id, StandQueue.joined_at)
+        .execution_options(synchronize_session=False)
+    ).all()
+    db.commit()
+
+    for row in rows:
+        cache_remove(row.driver_id, row.joined_at)
+        notification_service.queue_expired(row.driver_id, row.stand_id)
+    for stand_id in {row.stand_id for row in rows}:
+        notification_service.queue_changed(stand_id)
+    return len(rows)
+
+# ---------------- Queue Archive ----------------
+_ARCHIVED_COLUMNS = ("id", "stand_id", "driver_id", "joined_at", "status")
+
+
+def archive_finished(db: Session, older_than: datetime, batch_size: int) -> int:
+    """
+    Move up to `batch_size` finished (assigned / left / expired) rows that joined before
+    `older_than` into stand_queue_history, in one transaction. Returns the number moved;
+    call again until it is below `batch_size`.
+    """
+    if not try_advisory_xact_lock(db, ARCHIVE_LOCK_KEY):
+        db.rollback()
+        return 0
+    finished = (select(StandQueue.id)
+                .where(StandQueue.status != "waiting", StandQueue.joined_at < older_than)
+                .order_by(StandQueue.id)
+                .limit(batch_size))
+    queue = StandQueue.__table__
+    history = StandQueueHistory.__table__
+    if db.get_bind().dialect.name == "postgresql":
+        # WITH moved AS (DELETE ... RETURNING *) INSERT INTO stand_queue_history SELECT ... FROM moved
+        moved = (delete(queue)
+                 .where(queue.c.id.in_(finished.with_for_update(skip_locked=True)))
+                 .returning(*(queue.c[name] for name in _ARCHIVED_COLUMNS))
+                 .cte("moved"))
+        stmt = (insert(history)
+                .from_select(_ARCHIVED_COLUMNS, select(*(moved.c[name] for name in _ARCHIVED_COLUMNS)))
+                .add_cte(moved))
+        count = db.execute(stmt).rowcount
+    else:
+        ids = db.scalars(finished).all()
+        if ids:
+            db.execute(insert(history).from_select(
+                _ARCHIVED_COLUMNS,
+                select(*(queue.c[name] for name in _ARCHIVED_COLUMNS)).where(queue.c.id.in_(ids))))
+            db.execute(delete(queue).where(queue.c.id.in_(ids)))
+        count = len(ids)
+    db.commit()
+    return count
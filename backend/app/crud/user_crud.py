@@ -1,11 +1,16 @@
+from typing import Iterable, List, Optional, Set
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from app.database import insert_skipping_conflicts
 from app.model import User
 from app.schemas import UserCreate, UserUpdate
 from app.utils.security import hash_password
+from app.utils.auth import invalidate_principal
+from app.utils.pagination import Page, paginate
 from fastapi import HTTPException
 
 # ---------------- Create ----------------
-def create_user(db: Session, user_data: UserCreate):
+def create_user(db: Session, user_data: UserCreate, password_hash: Optional[str] = None):
     existing_user = db.query(User).filter(User.email == user_data.email).first()
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
@@ -13,7 +18,7 @@ def create_user(db: Session, user_data: UserCreate):
     new_user = User(
         name=user_data.name,
         email=user_data.email,
-        password=hash_password(user_data.password)  
+        password=password_hash or hash_password(user_data.password)
     )
     db.add(new_user)
     db.commit()
@@ -21,6 +26,23 @@ def create_user(db: Session, user_data: UserCreate):
     return new_user
 
 
+def insert_users(db: Session, rows: List[dict]) -> list:
+    """
+    Bulk onboarding: multi-row INSERT ... RETURNING; an email registered meanwhile skips its row.
+    Returns plain rows (id, name, email), see driver_crud.insert_drivers.
+    """
+    if not rows:
+        return []
+    stmt = insert_skipping_conflicts(db, User, User.email).returning(User.id, User.name, User.email)
+    created = db.execute(stmt, rows).all()
+    db.commit()
+    return created
+
+
+def existing_emails(db: Session, emails: Iterable[str]) -> Set[str]:
+    return set(db.scalars(select(User.email).where(User.email.in_(set(emails)))))
+
+
 # ---------------- Read ----------------
 def get_user_by_id(db: Session, user_id: int):
     return db.query(User).filter(User.id == user_id).first()
@@ -30,22 +52,24 @@ def get_user_by_email(db: Session, email: str):
     return db.query(User).filter(User.email == email).first()
 
 
-def get_users(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(User).offset(skip).limit(limit).all()
+def get_users(db: Session, limit: int = 100, cursor: Optional[str] = None, skip: int = 0) -> Page:
+    return paginate(db.query(User), [User.id], (int,), limit, cursor=cursor, skip=skip)
 
 
 # ---------------- Update ----------------
-def update_user(db: Session, user_id: int, user_data: UserUpdate):
+def update_user(db: Session, user_id: int, user_data: UserUpdate, password_hash: Optional[str] = None):
     user = get_user_by_id(db, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
     user.name = user_data.name or user.name
     user.email = user_data.email or user.email
-    user.password = user_data.password or user.password  
+    if user_data.password:
+        user.password = password_hash or hash_password(user_data.password)
 
     db.commit()
     db.refresh(user)
+    invalidate_principal("user", user_id)
     return user
 
 
@@ -57,4 +81,5 @@ def delete_user(db: Session, user_id: int):
 
     db.delete(user)
     db.commit()
+    invalidate_principal("user", user_id)
     return {"status": "success", "message": f"User {user_id} deleted"}
@@ -1,20 +1,216 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from contextlib import asynccontextmanager
+from time import perf_counter
+from typing import Optional, Union
+
+from sqlalchemy import create_engine, event, insert, text
+from sqlalchemy.exc import IntegrityError, TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+from starlette.concurrency import run_in_threadpool
 from app.config import settings
+from app.utils.limits import load_shedder
+from app.utils.metrics import REGISTRY
+from app.utils.profiling import instrument_engine
 
 # SQLAlchemy base
 Base = declarative_base()
 
+# ---------------- Pool metrics ----------------
+POOL_WAIT = REGISTRY.histogram("db_pool_wait_seconds", "Time spent acquiring a pooled DB connection",
+                               buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+POOL_CONNECTS = REGISTRY.counter("db_pool_connects_total", "New DBAPI connections opened")
+POOL_INVALIDATED = REGISTRY.counter("db_pool_invalidated_total", "Connections invalidated (stale / disconnect)")
+POOL_TIMEOUTS = REGISTRY.counter("db_pool_timeouts_total", "Checkouts that timed out waiting for a connection")
+
+
+class _TimedPoolMixin:
+    metrics_label = "sync"
+
+    def connect(self):
+        start = perf_counter()
+        try:
+            return super().connect()
+        except PoolTimeoutError:
+            POOL_TIMEOUTS.inc(engine=self.metrics_label)
+            raise
+        finally:
+            waited = perf_counter() - start
+            POOL_WAIT.observe(waited, engine=self.metrics_label)
+            load_shedder.observe_wait(waited)  # low-priority reads are shed while this stays high
+
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    metrics_label = "sync"
+
+
+class TimedAsyncQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    metrics_label = "async"
+
+
+def _engine_kwargs(url: str, is_async: bool = False) -> dict:
+    if url.startswith("sqlite"):
+        return {}
+    kwargs = dict(
+        poolclass=TimedAsyncQueuePool if is_async else TimedQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+    )
+    if settings.DB_STATEMENT_TIMEOUT_MS:
+        timeout = str(settings.DB_STATEMENT_TIMEOUT_MS)
+        if is_async:
+            kwargs["connect_args"] = {"server_settings": {"statement_timeout": timeout}}
+        else:
+            kwargs["connect_args"] = {"options": f"-c statement_timeout={timeout}"}
+    return kwargs
+
+
+def _instrument(target_engine, label: str) -> None:
+    @event.listens_for(target_engine, "connect")
+    def _on_connect(dbapi_conn, conn_record):
+        POOL_CONNECTS.inc(engine=label)
+
+    @event.listens_for(target_engine, "invalidate")
+    def _on_invalidate(dbapi_conn, conn_record, exc):
+        POOL_INVALIDATED.inc(engine=label)
+
+    if settings.PROFILING_ENABLED:
+        instrument_engine(target_engine)
+
+
+def pool_status() -> dict:
+    """Current pool occupancy per engine: size, checked-out, idle and overflow connections."""
+    status = {}
+    for label, eng in (("sync", engine), ("async", async_engine and async_engine.sync_engine)):
+        pool = getattr(eng, "pool", None)
+        if not isinstance(pool, QueuePool):
+            continue
+        status[label] = {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "idle": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+        }
+    return status
+
+
+def _pool_gauge(field: str):
+    return lambda: {(("engine", label),): values[field] for label, values in pool_status().items()}
+
+
+REGISTRY.gauge("db_pool_size", "Configured pool size", _pool_gauge("size"))
+REGISTRY.gauge("db_pool_checked_out", "Connections currently checked out", _pool_gauge("checked_out"))
+REGISTRY.gauge("db_pool_idle", "Idle connections held in the pool", _pool_gauge("idle"))
+REGISTRY.gauge("db_pool_overflow", "Connections open beyond pool_size", _pool_gauge("overflow"))
+
+
 # Database engine
-engine = create_engine(settings.DATABASE_URL)
+engine = create_engine(settings.DATABASE_URL, **_engine_kwargs(settings.DATABASE_URL))
+_instrument(engine, "sync")
 
 # Session
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine / session (only built when ASYNC_DB is on)
+def _async_url(url: str) -> str:
+    for prefix, async_prefix in (("postgresql+psycopg2://", "postgresql+asyncpg://"),
+                                 ("postgresql://", "postgresql+asyncpg://"),
+                                 ("postgres://", "postgresql+asyncpg://"),
+                                 ("sqlite://", "sqlite+aiosqlite://")):
+        if url.startswith(prefix):
+            return async_prefix + url[len(prefix):]
+    return url
+
+
+async_engine = None
+AsyncSessionLocal = None
+if settings.ASYNC_DB:
+    _url = settings.ASYNC_DATABASE_URL or _async_url(settings.DATABASE_URL)
+    async_engine = create_async_engine(_url, **_engine_kwargs(_url, is_async=True))
+    _instrument(async_engine.sync_engine, "async")
+    # expire_on_commit=False: routers read attributes after the CRUD call has committed,
+    # outside of the greenlet, where a lazy reload is not allowed
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+DBSession = Union[Session, AsyncSession]
+
+
 # Dependency: get DB session
-def get_db():
+def get_sync_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+get_db = get_async_db if settings.ASYNC_DB else get_sync_db
+
+
+@asynccontextmanager
+async def db_session():
+    """Short-lived session for code outside a request (WebSockets, background jobs)."""
+    if settings.ASYNC_DB:
+        async with AsyncSessionLocal() as db:
+            yield db
+    else:
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            await run_in_threadpool(db.close)
+
+
+def try_advisory_xact_lock(db: Session, key: int) -> bool:
+    """
+    Postgres transaction-level advisory lock, without waiting: lets one worker run a periodic
+    job while the others skip that round. Released at commit/rollback. Always True elsewhere.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return True
+    return bool(db.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": key}).scalar())
+
+
+def insert_skipping_conflicts(db: Session, model, *columns):
+    """
+    INSERT into `model` that skips rows violating the unique `columns` (ON CONFLICT DO NOTHING)
+    instead of failing the statement; those rows are simply missing from RETURNING.
+    Postgres and SQLite; elsewhere a plain INSERT.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return insert(model)
+    return dialect_insert(model).on_conflict_do_nothing(index_elements=list(columns))
+
+
+def violated_constraint(exc: IntegrityError) -> Optional[str]:
+    """Name of the constraint an IntegrityError reports (Postgres, psycopg2 or asyncpg); None elsewhere."""
+    diag = getattr(exc.orig, "diag", None)  # psycopg2
+    if diag is not None:
+        return diag.constraint_name
+    # asyncpg through SQLAlchemy's adapter: the driver's own exception is the cause
+    return getattr(exc.orig.__cause__, "constraint_name", None)
+
+
+async def run_db(db: DBSession, fn, *args, **kwargs):
+    """
+    Run sync CRUD code `fn(session, *args, **kwargs)` without blocking the event loop.
+
+    With an AsyncSession the function runs on the async driver through `run_sync`
+    (no thread involved); with a plain Session it runs in the threadpool as before.
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
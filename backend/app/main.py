@@ -1,15 +1,53 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI
+from fastapi.responses import JSONResponse, ORJSONResponse
 from app.config import settings
-from app.database import Base, engine
-from app.routers import users, drivers, rides, stands, auth
-from app import model
+from app.routers import users, drivers, rides, stands, auth, metrics, ws, exports, health
+from app.utils.profiling import ProfilingMiddleware
+from app.utils.security import shutdown_password_pool
+from app.utils.websocket_manager import manager as ws_manager
+from app.services.event_bus import bus
+from app.services import admission, availability_service, idempotency, location_service, queue_maintenance, warmup
+from app.services.scheduler import scheduler
 
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+# No I/O at import: the schema is managed by `python -m app.cli migrate`, and the DB work a
+# worker needs before taking traffic (bus, pool, caches, hot queries) runs in the background
+# warm-up; /health/ready reports it.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Sync CRUD code publishes events from threadpool threads; both need the loop
+    ws_manager.bind_loop(asyncio.get_running_loop())
+    warmup.start()
+    await location_service.start()
+    await availability_service.start()
+    if settings.SCHEDULER_ENABLED:
+        queue_maintenance.schedule(scheduler)
+        idempotency.schedule(scheduler)
+        await scheduler.start()
+    yield
+    await warmup.stop()
+    # final location and availability flushes publish on the bus, so they go first
+    await scheduler.stop()
+    await location_service.stop()
+    await availability_service.stop()
+    await bus.stop()
+    shutdown_password_pool()
 
-# FastAPI app instance
-app = FastAPI(title=settings.PROJECT_NAME)
+
+# FastAPI app instance; response models are validated/dumped by pydantic-core either way,
+# ORJSON_RESPONSES only swaps the final json.dumps for orjson. Every route first passes
+# admission control (rate limits and load shedding, services/admission.py).
+app = FastAPI(title=settings.PROJECT_NAME, lifespan=lifespan,
+              default_response_class=ORJSONResponse if settings.ORJSON_RESPONSES else JSONResponse,
+              dependencies=[Depends(admission.admit)])
+
+app.add_middleware(admission.AdmissionMiddleware)
+
+# Per-route timing and SQL statement counts, exported on /metrics
+if settings.PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
 
 # Include routers
 app.include_router(users.router, prefix="/users", tags=["Users"])
@@ -17,6 +55,10 @@ app.include_router(drivers.router, prefix="/drivers", tags=["Drivers"])
 app.include_router(rides.router, prefix="/rides", tags=["Rides"])
 app.include_router(stands.router, prefix="/stands", tags=["AutoStands"])
 app.include_router(auth.router, prefix="/auth", tags=["Auth"])
+app.include_router(exports.router, prefix="/exports", tags=["Exports"])
+app.include_router(metrics.router)
+app.include_router(ws.router)
+app.include_router(health.router)
 
 
 @app.get("/")
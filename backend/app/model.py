@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime
+from sqlalchemy import CheckConstraint, Column, Integer, String, Boolean, Float, ForeignKey, DateTime, Index, Text, text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.database import Base
@@ -27,10 +27,21 @@ class Driver(Base):
     is_available = Column(Boolean, default=False)
     stand_id = Column(Integer, ForeignKey("autostands.id"))
     created_at = Column(DateTime, default=datetime.utcnow)
+    # last known position, written in bulk by services/location_service.py (not on every ping)
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    location_updated_at = Column(DateTime, nullable=True)
+    # last sign of life (availability change, queue join, location ping); stale drivers drop out of queues
+    last_seen_at = Column(DateTime, nullable=True)
     
     stand = relationship("AutoStand", back_populates="drivers")
     rides = relationship("Ride", back_populates="driver")
 
+    __table_args__ = (
+        # GET /drivers?stand_id=: keyset pages of one stand's drivers
+        Index("ix_drivers_stand_id_id", "stand_id", "id"),
+    )
+
 
 # ---------------- AutoStand ----------------
 class AutoStand(Base):
@@ -39,11 +50,17 @@ class AutoStand(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
     location = Column(String, nullable=False)
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
     
     drivers = relationship("Driver", back_populates="stand")
 
 
 # ---------------- Ride ----------------
+RIDE_STATUSES = ("pending", "accepted", "ongoing", "completed", "cancelled")
+ACTIVE_RIDE_STATUSES = ("pending", "accepted", "ongoing")
+ACTIVE_RIDE_WHERE = "status IN ('pending', 'accepted', 'ongoing')"
+
 class Ride(Base):
     __tablename__ = "rides"
     
@@ -52,12 +69,37 @@ class Ride(Base):
     driver_id = Column(Integer, ForeignKey("drivers.id"), nullable=True) # nullable=True → a ride may exist before a driver is assigned.
     start_location = Column(String, nullable=False)
     end_location = Column(String, nullable=False)
-    status = Column(String, default="pending")  # pending, accepted, completed, cancelled
+    pickup_lat = Column(Float, nullable=True)
+    pickup_lng = Column(Float, nullable=True)
+    # stand the driver was dispatched from (the requested stand while the ride is pending)
+    stand_id = Column(Integer, ForeignKey("autostands.id"), nullable=True)
+    # pending -> accepted -> ongoing -> completed, or cancelled before the trip starts;
+    # only changed through ride_crud.transition_ride
+    status = Column(String, default="pending")
     requested_at = Column(DateTime, default=datetime.utcnow)
+    accepted_at = Column(DateTime, nullable=True)
+    started_at = Column(DateTime, nullable=True)
+    completed_at = Column(DateTime, nullable=True)
+    cancelled_at = Column(DateTime, nullable=True)
     
     user = relationship("User", back_populates="rides")
     driver = relationship("Driver", back_populates="rides")
 
+    __table_args__ = (
+        # GET /rides keyset pages, newest first: (requested_at, id) after the equality filter
+        Index("ix_rides_requested_at_id", "requested_at", "id"),
+        Index("ix_rides_status_requested_at_id", "status", "requested_at", "id"),
+        Index("ix_rides_user_id_requested_at_id", "user_id", "requested_at", "id"),
+        Index("ix_rides_driver_id_requested_at_id", "driver_id", "requested_at", "id"),
+        Index("ix_rides_stand_id_requested_at_id", "stand_id", "requested_at", "id"),
+        CheckConstraint("status IN ('pending', 'accepted', 'ongoing', 'completed', 'cancelled')", name="ck_rides_status"),
+        # "my current ride": only in-flight rides are indexed, so lookups stay small however long the history
+        Index("ix_rides_user_active", "user_id",
+              postgresql_where=text(ACTIVE_RIDE_WHERE), sqlite_where=text(ACTIVE_RIDE_WHERE)),
+        Index("ix_rides_driver_active", "driver_id",
+              postgresql_where=text(ACTIVE_RIDE_WHERE), sqlite_where=text(ACTIVE_RIDE_WHERE)),
+    )
+
 
 # ---------------- Stand Queue ----------------
 class StandQueue(Base):
@@ -67,4 +109,52 @@ class StandQueue(Base):
     stand_id = Column(Integer, ForeignKey("autostands.id"), nullable=False)
     driver_id = Column(Integer, ForeignKey("drivers.id"), nullable=False)
     joined_at = Column(DateTime, default=datetime.utcnow)
-    status = Column(String, default="waiting")  # waiting, assigned, left
\ No newline at end of file
+    status = Column(String, default="waiting")  # waiting, assigned, left, expired
+
+    __table_args__ = (
+        # pop_next_driver / get_queue / position: waiting rows of a stand in FIFO order
+        Index("ix_stand_queue_waiting", "stand_id", "joined_at", "id",
+              postgresql_where=text("status = 'waiting'"), sqlite_where=text("status = 'waiting'")),
+        # a driver can only hold one waiting row; also serves join/leave lookups by driver
+        Index("uq_stand_queue_driver_waiting", "driver_id", unique=True,
+              postgresql_where=text("status = 'waiting'"), sqlite_where=text("status = 'waiting'")),
+    )
+
+
+# ---------------- Stand Queue History ----------------
+class StandQueueHistory(Base):
+    """Finished stand_queue rows (assigned, left, expired), moved here in batches by the scheduler."""
+    __tablename__ = "stand_queue_history"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)  # the original stand_queue id
+    stand_id = Column(Integer, nullable=False)
+    driver_id = Column(Integer, nullable=False)
+    joined_at = Column(DateTime)
+    status = Column(String, nullable=False)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # exports: time range, optionally of one stand
+        Index("ix_stand_queue_history_joined_at_id", "joined_at", "id"),
+        Index("ix_stand_queue_history_stand_joined_at", "stand_id", "joined_at", "id"),
+    )
+
+
+# ---------------- Idempotency Keys ----------------
+class IdempotencyKey(Base):
+    """
+    Responses of requests sent with an Idempotency-Key header (crud/idempotency_crud.py), stored
+    in the transaction that did the work; purged by the scheduler after IDEMPOTENCY_TTL.
+    """
+    __tablename__ = "idempotency_keys"
+
+    scope = Column(String, primary_key=True)  # caller and operation, e.g. "user:7:create_ride"
+    key = Column(String, primary_key=True)
+    fingerprint = Column(String, nullable=False)  # hash of the request; the same key with another request is a 422
+    status_code = Column(Integer)
+    body = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_idempotency_keys_created_at", "created_at"),
+    )
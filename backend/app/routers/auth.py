@@ -1,8 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
 
-from app.database import get_db
+from app.database import get_db, DBSession
 from app.schemas import Token, DriverLogin
 from app.utils.auth import create_access_token, authenticate_user_by_email, authenticate_driver_by_phone
 from app.config import settings
@@ -13,8 +12,8 @@ router = APIRouter(tags=["Auth"])
 # This endpoint accepts form data: username and password
 # username will be the user's email
 @router.post("/token", response_model=Token)
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = authenticate_user_by_email(db, form_data.username, form_data.password)
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: DBSession = Depends(get_db)):
+    user = await authenticate_user_by_email(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect email or password")
     access_token = create_access_token({"sub": str(user.id), "role": "user"})
@@ -23,8 +22,8 @@ def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db:
 
 # ---------- Driver login (JSON) ----------
 @router.post("/driver/token", response_model=Token)
-def driver_login(login: DriverLogin, db: Session = Depends(get_db)):
-    driver = authenticate_driver_by_phone(db, login.phone, login.password)
+async def driver_login(login: DriverLogin, db: DBSession = Depends(get_db)):
+    driver = await authenticate_driver_by_phone(db, login.phone, login.password)
     if not driver:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect phone or password")
     access_token = create_access_token({"sub": str(driver.id), "role": "driver"})
@@ -1,66 +1,119 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from typing import Dict, List, Optional, Union
 
+from app.config import settings
 from app.crud import driver_crud
-from app.schemas import AvailabilityPayload
-from app.schemas import DriverCreate, DriverUpdate
-from app.database import get_db
-from app.utils.auth import get_current_driver
+from app.schemas import AvailabilityPayload, LocationPayload, MessageResponse, NearbyDriverResponse
+from app.schemas import DriverCreate, DriverUpdate, DriverResponse, DriverStatusResponse, DriverMeResponse
+from app.schemas import BulkDriverResponse, DriverAvailabilityResponse
+from app.database import get_db, run_db, DBSession
+from app.services import availability_service, location_service, onboarding
+from app.utils.security import hash_password_async
+from app.utils.auth import get_current_admin, get_current_driver, get_current_driver_id, get_current_user_id
+from app.utils.availability import driver_availability
+from app.utils.serialization import page_response
+from app.utils.response_cache import cached_response, driver_responses, render
 
 router = APIRouter(prefix="/drivers", tags=["Drivers"])
 
 # ---------------- Create ----------------
-@router.post("/", response_model=dict)
-def create_driver_endpoint(driver: DriverCreate, db: Session = Depends(get_db)):
-    new_driver = driver_crud.create_driver(db, driver)
-    return {"status": "success", "driver": {"id": new_driver.id, "name": new_driver.name, "phone": new_driver.phone, "stand_id": new_driver.stand_id, "is_available": new_driver.is_available}}
+@router.post("/", response_model=DriverStatusResponse)
+async def create_driver_endpoint(driver: DriverCreate, db: DBSession = Depends(get_db)):
+    password_hash = await hash_password_async(driver.password)
+    new_driver = await run_db(db, driver_crud.create_driver, driver, password_hash)
+    return {"status": "success", "driver": new_driver}
+
+
+# Bulk onboarding (admins only): each row is validated on its own, failed rows are reported by index
+@router.post("/bulk", response_model=BulkDriverResponse)
+async def bulk_create_drivers(rows: List[Dict], admin = Depends(get_current_admin), db: DBSession = Depends(get_db)):
+    onboarding.check_batch_size(rows)
+    return await onboarding.onboard_drivers(db, rows)
+
+
+# ---------------- Live location ----------------
+# Pings never touch the DB: they update the in-memory index and are flushed in bulk.
+# Body is a single point or a list of buffered points (only the newest one is kept).
+@router.post("/me/location", response_model=dict, status_code=status.HTTP_202_ACCEPTED)
+async def ingest_location(payload: Union[LocationPayload, List[LocationPayload]], current_driver = Depends(get_current_driver_id)):
+    points = payload if isinstance(payload, list) else [payload]
+    if not points:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="No points given")
+    if len(points) > settings.LOCATION_MAX_BATCH:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f"At most {settings.LOCATION_MAX_BATCH} points per request")
+    stored = location_service.ingest(current_driver.id, points)
+    return {"status": "accepted", "points": len(points), "stored": stored}
+
+
+# riders only: these are live driver positions. Declared before /{driver_id} so "nearby" is not parsed as an id
+@router.get("/nearby", response_model=List[NearbyDriverResponse])
+async def nearby_drivers(lat: float = Query(..., ge=-90, le=90), lng: float = Query(..., ge=-180, le=180),
+                         radius: float = Query(1000, gt=0, le=50000), limit: int = Query(50, ge=1, le=500),
+                         current_user = Depends(get_current_user_id)):
+    return [
+        NearbyDriverResponse(driver_id=loc.driver_id, lat=loc.lat, lng=loc.lng,
+                             distance_m=round(distance, 1), recorded_at=loc.recorded_at)
+        for distance, loc in location_service.nearby(lat, lng, radius, limit)
+    ]
 
 
 # ---------------- Read ----------------
-@router.get("/{driver_id}", response_model=dict)
-def get_driver_by_id_endpoint(driver_id: int, db: Session = Depends(get_db)):
-    driver = driver_crud.get_driver_by_id(db, driver_id)
+async def _load_profile(db: DBSession, fn, arg):
+    driver = await run_db(db, fn, arg)
     if not driver:
         raise HTTPException(status_code=404, detail="Driver not found")
-    return {"id": driver.id, "name": driver.name, "phone": driver.phone, "stand_id": driver.stand_id, "is_available": driver.is_available}
+    profile = DriverResponse.model_validate(driver).model_dump()
+    # a toggle not flushed yet is newer than the row
+    pending = driver_availability.pending(driver.id)
+    if pending is not None:
+        profile["is_available"] = pending
+    return render(profile)
 
 
-@router.get("/", response_model=List[dict])
-def get_drivers_endpoint(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    drivers = driver_crud.get_drivers(db, skip, limit)
-    return [{"id": d.id, "name": d.name, "phone": d.phone, "stand_id": d.stand_id, "is_available": d.is_available} for d in drivers]
+# Profiles are served from the response cache (ETag / If-None-Match aware); driver_crud invalidates them on writes
+@router.get("/{driver_id}", response_model=DriverResponse)
+async def get_driver_by_id_endpoint(driver_id: int, request: Request, db: DBSession = Depends(get_db)):
+    return await cached_response(request, driver_responses, ("driver", driver_id),
+                                 lambda: _load_profile(db, driver_crud.get_driver_by_id, driver_id))
 
 
-@router.get("/by-phone/", response_model=dict)
-def get_driver_by_phone_endpoint(phone: str, db: Session = Depends(get_db)):
-    driver = driver_crud.get_driver_by_phone(db, phone)
-    if not driver:
-        raise HTTPException(status_code=404, detail="Driver not found")
-    return {"id": driver.id, "name": driver.name, "phone": driver.phone, "stand_id": driver.stand_id, "is_available": driver.is_available}
+# keyset pages by id, optionally of one stand; the next page's cursor is in the X-Next-Cursor header
+@router.get("/", response_model=List[DriverResponse])
+async def get_drivers_endpoint(limit: int = Query(100, ge=1, le=1000), cursor: Optional[str] = None,
+                               stand_id: Optional[int] = None, skip: int = Query(0, ge=0, deprecated=True),
+                               db: DBSession = Depends(get_db)):
+    page = await run_db(db, driver_crud.get_drivers, limit, cursor, skip, stand_id)
+    return page_response(DriverResponse, page)
+
+
+@router.get("/by-phone/", response_model=DriverResponse)
+async def get_driver_by_phone_endpoint(phone: str, request: Request, db: DBSession = Depends(get_db)):
+    return await cached_response(request, driver_responses, ("phone", phone),
+                                 lambda: _load_profile(db, driver_crud.get_driver_by_phone, phone))
 
 
 # ---------------- Update ----------------
-@router.put("/{driver_id}", response_model=dict)
-def update_driver_endpoint(driver_id: int, driver_data: DriverUpdate, current_driver = Depends(get_current_driver), db: Session = Depends(get_db)):
+@router.put("/{driver_id}", response_model=DriverStatusResponse)
+async def update_driver_endpoint(driver_id: int, driver_data: DriverUpdate, current_driver = Depends(get_current_driver_id), db: DBSession = Depends(get_db)):
     if current_driver.id != driver_id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not allowed")
-    updated_driver = driver_crud.update_driver(db, driver_id, driver_data)
-    return {"status": "success", "driver": {"id": updated_driver.id, "name": updated_driver.name, "phone": updated_driver.phone, "stand_id": updated_driver.stand_id, "is_available": updated_driver.is_available}}
+    updated_driver = await run_db(db, driver_crud.update_driver, driver_id, driver_data)
+    return {"status": "success", "driver": updated_driver}
 
 
 # ---------------- Delete ----------------
-@router.delete("/{driver_id}", response_model=dict)
-def delete_driver_endpoint(driver_id: int, current_driver = Depends(get_current_driver), db: Session = Depends(get_db)):
+@router.delete("/{driver_id}", response_model=MessageResponse)
+async def delete_driver_endpoint(driver_id: int, current_driver = Depends(get_current_driver_id), db: DBSession = Depends(get_db)):
     if current_driver.id != driver_id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not allowed")
-    return driver_crud.delete_driver(db, driver_id)
+    return await run_db(db, driver_crud.delete_driver, driver_id)
 
 
 # ---------------- Testing endpoint ----------------
-@router.get("/me", response_model=dict)
-def read_current_driver(current_driver = Depends(get_current_driver)):
-    return {"id": current_driver.id, "name": current_driver.name, "phone": current_driver.phone, "stand_id": current_driver.stand_id}
+@router.get("/me", response_model=DriverMeResponse)
+async def read_current_driver(current_driver = Depends(get_current_driver)):
+    return current_driver
 
 
 # @router.post("/me/mark_presence", response_model=dict)
@@ -69,7 +122,15 @@ def read_current_driver(current_driver = Depends(get_current_driver)):
 #     return {"status": "success", "driver": {"id": updated.id, "is_present": getattr(updated, "is_present", None), "stand_id": updated.stand_id}}
 
 
-@router.post("/me/set_available", response_model=dict)
-def set_available(payload: AvailabilityPayload, current_driver = Depends(get_current_driver), db: Session = Depends(get_db)):
-    updated = driver_crud.set_availability(db, current_driver.id, payload.available)
-    return {"status": "success", "driver": {"id": updated.id, "is_available": updated.is_available}}
+# Toggles and heartbeats never touch the DB: they update the in-memory availability store,
+# which is flushed in bulk (services/availability_service.py)
+@router.post("/me/set_available", response_model=DriverAvailabilityResponse)
+async def set_available(payload: AvailabilityPayload, current_driver = Depends(get_current_driver_id)):
+    availability_service.set_available(current_driver.id, payload.available)
+    return {"status": "success", "driver": {"id": current_driver.id, "is_available": payload.available}}
+
+
+@router.post("/me/heartbeat", status_code=status.HTTP_204_NO_CONTENT)
+async def heartbeat(current_driver = Depends(get_current_driver_id)):
+    availability_service.heartbeat(current_driver.id)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
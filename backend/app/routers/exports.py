@@ -0,0 +1,22 @@
+from datetime import datetime
+from typing import Literal, Optional
+from fastapi import APIRouter, Query
+from fastapi.responses import StreamingResponse
+from app.config import settings
+from app.services import export_service
+
+router = APIRouter(tags=["Exports"])
+
+# ---------------- Bulk export ----------------
+# Streams the whole range through a server-side cursor; memory use does not grow with the range.
+# ?since= is inclusive, ?until= exclusive; kind "queue" is the stand_queue history.
+@router.get("/{kind}")
+async def export(kind: Literal["rides", "queue"], fmt: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+                 since: Optional[datetime] = None, until: Optional[datetime] = None,
+                 stand_id: Optional[int] = None):
+    iter_export = export_service.aiter_export if settings.ASYNC_DB else export_service.iter_export
+    return StreamingResponse(
+        iter_export(kind, fmt, since, until, stand_id),
+        media_type=export_service.FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{kind}.{fmt}"'},
+    )
@@ -0,0 +1,19 @@
+from fastapi import APIRouter, Response, status
+
+from app.services import warmup
+
+router = APIRouter(prefix="/health", tags=["Health"])
+
+
+# ---------------- Liveness: the process is up and serving ----------------
+@router.get("/live", response_model=dict)
+def live():
+    return {"status": "alive"}
+
+
+# ---------------- Readiness: warm-up finished, not shutting down ----------------
+@router.get("/ready", response_model=dict)
+def ready(response: Response):
+    if not warmup.state.ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return warmup.state.as_dict()
@@ -0,0 +1,50 @@
+from fastapi import APIRouter, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
+
+from app.database import pool_status
+from app.services import admission
+from app.utils.auth import principal_cache
+from app.utils.metrics import REGISTRY
+from app.utils.profiling import folded, sampler
+from app.utils.response_cache import CACHES
+
+router = APIRouter(tags=["Metrics"])
+
+# ---------------- Prometheus scrape ----------------
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return REGISTRY.render()
+
+# ---------------- Pool snapshot (JSON) ----------------
+@router.get("/metrics/pool", response_model=dict)
+def pool_metrics():
+    return pool_status()
+
+
+# ---------------- Cache stats (JSON) ----------------
+@router.get("/metrics/cache", response_model=dict)
+def cache_metrics():
+    return {cache.name: cache.stats() for cache in (principal_cache, *CACHES)}
+
+
+# ---------------- Admission control (JSON) ----------------
+@router.get("/metrics/admission", response_model=dict)
+def admission_metrics():
+    return admission.stats()
+
+
+# ---------------- Stack sampling profile (folded stacks) ----------------
+@router.get("/metrics/profile", response_class=PlainTextResponse)
+async def sample_profile(seconds: float = Query(10, gt=0), interval_ms: float = Query(5, ge=1, le=1000)):
+    """Sample every thread's stack for `seconds`; the output feeds flamegraph.pl or speedscope."""
+    if not settings.PROFILING_SAMPLER_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profiler disabled")
+    seconds = min(seconds, settings.PROFILING_SAMPLER_MAX_SECONDS)
+    try:
+        stacks = await run_in_threadpool(sampler.sample, seconds, interval_ms / 1000)
+    except RuntimeError as exc:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(exc))
+    return folded(stacks)
@@ -1,34 +1,82 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from app.database import get_db
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, Query
+from app.database import get_db, run_db, DBSession
+from app.config import settings
 from app.crud import ride_crud
+from app.services import idempotency, ride_assignment
 from app.schemas import RideCreate, RideUpdate, RideResponse
-from app.utils.auth import get_current_user
+from app.utils.auth import get_current_driver_id, get_current_principal, get_current_user_id
+from app.utils.serialization import page_response
 
 router = APIRouter(prefix="/rides", tags=["Rides"])
 
 # ---------------- Create Ride ----------------
+# a retry with the same Idempotency-Key returns the first ride instead of booking another (services/idempotency.py)
 @router.post("/", response_model=RideResponse)
-def create_ride(ride: RideCreate, current_user = Depends(get_current_user), db: Session = Depends(get_db)):
-    # build payload using server-side user id
-    ride_payload = RideCreate(
-        user_id=current_user.id,
-        start_location=ride.start_location,
-        end_location=ride.end_location
-    )
-    return ride_crud.create_ride(db, ride_payload)
+async def create_ride(ride: RideCreate, current_user = Depends(get_current_user_id), db: DBSession = Depends(get_db),
+                      idempotency_key: Optional[str] = Header(None, alias=idempotency.KEY_HEADER)):
+    # same payload (stand_id, pickup point included) with the server-side user id
+    ride_payload = ride.model_copy(update={"user_id": current_user.id})
+    request = idempotency.request_for(idempotency_key, f"user:{current_user.id}:create_ride",
+                                      ride_payload.model_dump(), RideResponse.model_validate)
+
+    async def create():
+        if settings.ASSIGNMENT_BATCH_WINDOW_MS > 0:
+            return await ride_assignment.batch_matcher.submit(ride_payload, request)
+        return await run_db(db, ride_crud.create_ride, ride_payload, request)
+    return await idempotency.run(request, create)
+
+# ---------------- Active Rides ----------------
+# the caller's in-flight rides (pending/accepted/ongoing) as rider or driver; declared before /{ride_id}
+@router.get("/active", response_model=list[RideResponse])
+async def active_rides(principal = Depends(get_current_principal), db: DBSession = Depends(get_db)):
+    role, who = principal
+    if role == "user":
+        return await run_db(db, ride_crud.get_active_rides, user_id=who.id)
+    return await run_db(db, ride_crud.get_active_rides, driver_id=who.id)
 
 # ---------------- Get Ride ----------------
 @router.get("/{ride_id}", response_model=RideResponse)
-def get_ride(ride_id: int, db: Session = Depends(get_db)):
-    return ride_crud.get_ride_by_id(db, ride_id)
+async def get_ride(ride_id: int, db: DBSession = Depends(get_db)):
+    return await run_db(db, ride_crud.get_ride_by_id, ride_id)
 
 # ---------------- Update Ride ----------------
+# same rights as the lifecycle routes below: riders cancel their own rides, drivers move theirs
 @router.put("/{ride_id}", response_model=RideResponse)
-def update_ride(ride_id: int, ride_data: RideUpdate, db: Session = Depends(get_db)):
-    return ride_crud.update_ride(db, ride_id, ride_data)
+async def update_ride(ride_id: int, ride_data: RideUpdate, principal = Depends(get_current_principal),
+                      db: DBSession = Depends(get_db)):
+    role, who = principal
+    if role == "user":
+        return await run_db(db, ride_crud.update_ride, ride_id, ride_data, user_id=who.id)
+    return await run_db(db, ride_crud.update_ride, ride_id, ride_data, acting_driver_id=who.id)
+
+# ---------------- Lifecycle ----------------
+# Each is one conditional UPDATE; a transition the ride's current status does not allow is a 409.
+@router.post("/{ride_id}/accept", response_model=RideResponse)
+async def accept_ride(ride_id: int, current_driver = Depends(get_current_driver_id), db: DBSession = Depends(get_db)):
+    return await run_db(db, ride_crud.transition_ride, ride_id, "accepted", driver_id=current_driver.id)
+
+@router.post("/{ride_id}/start", response_model=RideResponse)
+async def start_ride(ride_id: int, current_driver = Depends(get_current_driver_id), db: DBSession = Depends(get_db)):
+    return await run_db(db, ride_crud.transition_ride, ride_id, "ongoing", acting_driver_id=current_driver.id)
+
+@router.post("/{ride_id}/complete", response_model=RideResponse)
+async def complete_ride(ride_id: int, current_driver = Depends(get_current_driver_id), db: DBSession = Depends(get_db)):
+    return await run_db(db, ride_crud.transition_ride, ride_id, "completed", acting_driver_id=current_driver.id)
+
+@router.post("/{ride_id}/cancel", response_model=RideResponse)
+async def cancel_ride(ride_id: int, principal = Depends(get_current_principal), db: DBSession = Depends(get_db)):
+    role, who = principal
+    if role == "user":
+        return await run_db(db, ride_crud.transition_ride, ride_id, "cancelled", user_id=who.id)
+    return await run_db(db, ride_crud.transition_ride, ride_id, "cancelled", acting_driver_id=who.id)
 
 # ---------------- List Rides ----------------
+# newest first, keyset pages on (requested_at, id); the next page's cursor is in the X-Next-Cursor header
 @router.get("/", response_model=list[RideResponse])
-def list_rides(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return ride_crud.get_rides(db, skip, limit)
+async def list_rides(limit: int = Query(100, ge=1, le=1000), cursor: Optional[str] = None,
+                     status: Optional[str] = None, user_id: Optional[int] = None,
+                     driver_id: Optional[int] = None, stand_id: Optional[int] = None,
+                     skip: int = Query(0, ge=0, deprecated=True), db: DBSession = Depends(get_db)):
+    page = await run_db(db, ride_crud.get_rides, limit, cursor, skip, status, user_id, driver_id, stand_id)
+    return page_response(RideResponse, page)
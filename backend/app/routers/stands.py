@@ -1,64 +1,122 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from app.database import get_db
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, status
+from app.database import get_db, run_db, DBSession
 from app.crud import stand_crud
-from app.schemas import AutoStandCreate, AutoStandUpdate, AutoStandResponse
-from app.utils.auth import get_current_driver
+from app.schemas import AutoStandCreate, AutoStandUpdate, AutoStandResponse, BulkStandResponse, NearestStandResponse
+from app.schemas import QueueEntryResponse, QueueJoinResponse, QueueLeaveResponse, QueuePopResponse, QueuePositionResponse
+from app.utils.auth import get_current_admin, get_current_driver_id
+from app.utils.pagination import NEXT_CURSOR_HEADER
+from app.utils.response_cache import cached_response, render, stand_responses
+from app.services import idempotency, onboarding, ride_assignment
+from app.utils.queue import stand_queues
+from app.utils.stand_index import stand_index
 
 router = APIRouter()
 
 # ---------------- Create Stand ----------------
 @router.post("/", response_model=AutoStandResponse)
-def create_stand(stand: AutoStandCreate, db: Session = Depends(get_db)):
-    return stand_crud.create_stand(db, stand)
+async def create_stand(stand: AutoStandCreate, db: DBSession = Depends(get_db)):
+    return await run_db(db, stand_crud.create_stand, stand)
+
+# Bulk onboarding (admins only): each row is validated on its own, failed rows are reported by index
+@router.post("/bulk", response_model=BulkStandResponse)
+async def bulk_create_stands(rows: list[dict], admin = Depends(get_current_admin), db: DBSession = Depends(get_db)):
+    onboarding.check_batch_size(rows)
+    return await onboarding.onboard_stands(db, rows)
+
+# ---------------- Nearest Stands ----------------
+# Served from the in-memory stand index; declared before /{stand_id} so "nearest" is not parsed as an id
+@router.get("/nearest", response_model=list[NearestStandResponse])
+async def nearest_stands(lat: float = Query(..., ge=-90, le=90), lng: float = Query(..., ge=-180, le=180),
+                         limit: int = Query(5, ge=1, le=50), radius: float = Query(5000, gt=0, le=50000),
+                         waiting_only: bool = False):
+    results = []
+    for distance, stand_id in ride_assignment.nearest_stands(lat, lng, limit, radius, waiting_only):
+        stand_lat, stand_lng = stand_index.location(stand_id) or (None, None)
+        results.append(NearestStandResponse(stand_id=stand_id, latitude=stand_lat, longitude=stand_lng,
+                                            distance_m=round(distance, 1), waiting=stand_queues.size(stand_id)))
+    return results
+
+def _stand_out(stand) -> dict:
+    return AutoStandResponse.model_validate(stand).model_dump()
 
 # ---------------- Get Stand ----------------
+# Served from the response cache (ETag / If-None-Match aware); stand_crud invalidates it on writes
 @router.get("/{stand_id}", response_model=AutoStandResponse)
-def get_stand(stand_id: int, db: Session = Depends(get_db)):
-    return stand_crud.get_stand(db, stand_id)
+async def get_stand(stand_id: int, request: Request, db: DBSession = Depends(get_db)):
+    async def load():
+        return render(_stand_out(await run_db(db, stand_crud.get_stand, stand_id)))
+    return await cached_response(request, stand_responses, ("stand", stand_id), load)
 
 # ---------------- Update Stand ----------------
 @router.put("/{stand_id}", response_model=AutoStandResponse)
-def update_stand(stand_id: int, stand_data: AutoStandUpdate, db: Session = Depends(get_db)):
-    return stand_crud.update_stand(db, stand_id, stand_data)
+async def update_stand(stand_id: int, stand_data: AutoStandUpdate, db: DBSession = Depends(get_db)):
+    return await run_db(db, stand_crud.update_stand, stand_id, stand_data)
 
 # ---------------- List Stands ----------------
+# keyset pages by id; the next page's cursor is in the X-Next-Cursor header. Pages are cached like single stands.
 @router.get("/", response_model=list[AutoStandResponse])
-def list_stands(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return stand_crud.get_stands(db, skip, limit)
+async def list_stands(request: Request, limit: int = Query(100, ge=1, le=1000), cursor: Optional[str] = None,
+                      skip: int = Query(0, ge=0, deprecated=True), db: DBSession = Depends(get_db)):
+    async def load():
+        page = await run_db(db, stand_crud.get_stands, limit, cursor, skip)
+        headers = {NEXT_CURSOR_HEADER: page.next_cursor} if page.next_cursor else None
+        return render([_stand_out(s) for s in page.items], headers)
+    return await cached_response(request, stand_responses, ("list", limit, cursor, skip), load)
 
 # ---------------- Add Driver to Queue ----------------
-@router.post("/{stand_id}/join", response_model=dict)
-def join_queue(stand_id: int, current_driver = Depends(get_current_driver), db: Session = Depends(get_db)):
-    entry = stand_crud.add_driver_to_queue(db, stand_id, current_driver.id)
-    return {"status": "success", "queue_id": entry.id, "driver_id": entry.driver_id, "joined_at": entry.joined_at.isoformat()}
+def _join_response(entry) -> QueueJoinResponse:
+    return QueueJoinResponse(queue_id=entry.id, driver_id=entry.driver_id, joined_at=entry.joined_at)
+
+# join and pop accept an Idempotency-Key: a retry gets the first response back (services/idempotency.py)
+@router.post("/{stand_id}/join", response_model=QueueJoinResponse)
+async def join_queue(stand_id: int, current_driver = Depends(get_current_driver_id), db: DBSession = Depends(get_db),
+                     idempotency_key: Optional[str] = Header(None, alias=idempotency.KEY_HEADER)):
+    request = idempotency.request_for(idempotency_key, f"driver:{current_driver.id}:join",
+                                      {"stand_id": stand_id}, _join_response)
+
+    async def join():
+        entry = await run_db(db, stand_crud.add_driver_to_queue, stand_id, current_driver.id, request)
+        return entry if isinstance(entry, idempotency.StoredResponse) else _join_response(entry)
+    return await idempotency.run(request, join)
 
 # ---------------- Remove Driver from Queue ----------------
-@router.post("/me/leave", response_model=dict)
-def leave_queue(current_driver = Depends(get_current_driver), db: Session = Depends(get_db)):
-    entry = stand_crud.remove_driver_from_queue(db, current_driver.id)
+@router.post("/me/leave", response_model=QueueLeaveResponse)
+async def leave_queue(current_driver = Depends(get_current_driver_id), db: DBSession = Depends(get_db)):
+    entry = await run_db(db, stand_crud.remove_driver_from_queue, current_driver.id)
     if not entry:
         raise HTTPException(status_code=404, detail="You are not in a queue")
-    return {"status": "success", "driver_id": entry.driver_id}
+    return QueueLeaveResponse(driver_id=entry.driver_id)
 
 # ---------------- Get Queue ----------------
-@router.get("/{stand_id}/queue", response_model=list)
-def get_queue(stand_id: int, db: Session = Depends(get_db)):
-    entries = stand_crud.get_queue(db, stand_id)
-    # return a simple list of driver ids and joined_at
-    return [{"id": e.id, "driver_id": e.driver_id, "joined_at": e.joined_at.isoformat()} for e in entries]
+@router.get("/{stand_id}/queue", response_model=list[QueueEntryResponse])
+async def get_queue(stand_id: int, db: DBSession = Depends(get_db)):
+    # a simple list of queue ids, driver ids and joined_at
+    return await run_db(db, stand_crud.get_queue, stand_id)
+
+# ---------------- Queue Position ----------------
+@router.get("/{stand_id}/queue/position", response_model=QueuePositionResponse)
+async def get_queue_position(stand_id: int, current_driver = Depends(get_current_driver_id), db: DBSession = Depends(get_db)):
+    position = await run_db(db, stand_crud.get_queue_position, stand_id, current_driver.id)
+    if position is None:
+        raise HTTPException(status_code=404, detail="You are not in this queue")
+    return QueuePositionResponse(stand_id=stand_id, driver_id=current_driver.id, position=position)
 
 # ---------------- Pop Driver ----------------
-@router.post("/{stand_id}/pop", response_model=dict)
-def pop_driver_endpoint(stand_id: int, db: Session = Depends(get_db)):
-    # Pop the next waiting driver for this stand and mark them 'assigned'.
-    entry = stand_crud.pop_next_driver(db, stand_id)
-    if not entry:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No waiting drivers")
-    return {
-        "status": "success",
-        "queue_id": entry.id,
-        "driver_id": entry.driver_id,
-        "joined_at": entry.joined_at.isoformat(),
-        "status_in_queue": entry.status
-    }
\ No newline at end of file
+def _pop_response(entry) -> QueuePopResponse:
+    return QueuePopResponse(queue_id=entry.id, driver_id=entry.driver_id, joined_at=entry.joined_at,
+                            status_in_queue=entry.status)
+
+@router.post("/{stand_id}/pop", response_model=QueuePopResponse)
+async def pop_driver_endpoint(stand_id: int, http_request: Request, db: DBSession = Depends(get_db),
+                              idempotency_key: Optional[str] = Header(None, alias=idempotency.KEY_HEADER)):
+    request = idempotency.request_for(idempotency_key, f"{idempotency.caller(http_request)}:stand:{stand_id}:pop",
+                                      {"stand_id": stand_id}, _pop_response)
+
+    async def pop():
+        # Pop the next waiting driver for this stand and mark them 'assigned'.
+        entry = await run_db(db, stand_crud.pop_next_driver, stand_id, request)
+        if not entry:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No waiting drivers")
+        return entry if isinstance(entry, idempotency.StoredResponse) else _pop_response(entry)
+    return await idempotency.run(request, pop)
\ No newline at end of file
@@ -1,60 +1,73 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Dict, List, Optional
 
 from app.crud import user_crud
-from app.schemas import UserCreate, UserUpdate
-from app.database import get_db
-from app.utils.auth import get_current_user
+from app.schemas import BulkUserResponse, MessageResponse, UserCreate, UserResponse, UserStatusResponse, UserUpdate
+from app.database import get_db, run_db, DBSession
+from app.services import onboarding
+from app.utils.security import hash_password_async
+from app.utils.auth import get_current_admin, get_current_user, get_current_user_id
+from app.utils.serialization import page_response
 
 router = APIRouter(tags=["Users"])
 
 # ---------------- Create ----------------
-@router.post("/", response_model=dict)
-def create_user_endpoint(user: UserCreate, db: Session = Depends(get_db)):
-    new_user = user_crud.create_user(db, user)
-    return {"status": "success", "user": {"id": new_user.id, "name": new_user.name, "email": new_user.email}}
+@router.post("/", response_model=UserStatusResponse)
+async def create_user_endpoint(user: UserCreate, db: DBSession = Depends(get_db)):
+    password_hash = await hash_password_async(user.password)
+    new_user = await run_db(db, user_crud.create_user, user, password_hash)
+    return {"status": "success", "user": new_user}
+
+
+# Bulk onboarding (admins only): each row is validated on its own, failed rows are reported by index
+@router.post("/bulk", response_model=BulkUserResponse)
+async def bulk_create_users(rows: List[Dict], admin = Depends(get_current_admin), db: DBSession = Depends(get_db)):
+    onboarding.check_batch_size(rows)
+    return await onboarding.onboard_users(db, rows)
 
 
 # ---------------- Read ----------------
-@router.get("/{user_id}", response_model=dict)
-def get_user_by_id_endpoint(user_id: int, db: Session = Depends(get_db)):
-    user = user_crud.get_user_by_id(db, user_id)
+@router.get("/{user_id}", response_model=UserResponse)
+async def get_user_by_id_endpoint(user_id: int, db: DBSession = Depends(get_db)):
+    user = await run_db(db, user_crud.get_user_by_id, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    return {"id": user.id, "name": user.name, "email": user.email}
+    return user
 
 
-@router.get("/", response_model=List[dict])
-def get_users_endpoint(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    users = user_crud.get_users(db, skip, limit)
-    return [{"id": u.id, "name": u.name, "email": u.email} for u in users]
+# keyset pages by id; the next page's cursor is in the X-Next-Cursor header
+@router.get("/", response_model=List[UserResponse])
+async def get_users_endpoint(limit: int = Query(100, ge=1, le=1000), cursor: Optional[str] = None,
+                             skip: int = Query(0, ge=0, deprecated=True), db: DBSession = Depends(get_db)):
+    page = await run_db(db, user_crud.get_users, limit, cursor, skip)
+    return page_response(UserResponse, page)
 
 
-@router.get("/by-email/", response_model=dict)
-def get_user_by_email_endpoint(email: str, db: Session = Depends(get_db)):
-    user = user_crud.get_user_by_email(db, email)
+@router.get("/by-email/", response_model=UserResponse)
+async def get_user_by_email_endpoint(email: str, db: DBSession = Depends(get_db)):
+    user = await run_db(db, user_crud.get_user_by_email, email)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    return {"id": user.id, "name": user.name, "email": user.email}
+    return user
 
 
 # ---------------- Update ----------------
-@router.put("/{user_id}", response_model=dict)
-def update_user_endpoint(user_id: int, user_data: UserUpdate, current_user = Depends(get_current_user), db: Session = Depends(get_db)):
+@router.put("/{user_id}", response_model=UserStatusResponse)
+async def update_user_endpoint(user_id: int, user_data: UserUpdate, current_user = Depends(get_current_user_id), db: DBSession = Depends(get_db)):
     if current_user.id != user_id:
         raise HTTPException(status_code=403, detail="Not allowed")
-    updated_user = user_crud.update_user(db, user_id, user_data)
-    return {"status": "success", "user": {"id": updated_user.id, "name": updated_user.name, "email": updated_user.email}}
+    password_hash = await hash_password_async(user_data.password) if user_data.password else None
+    updated_user = await run_db(db, user_crud.update_user, user_id, user_data, password_hash)
+    return {"status": "success", "user": updated_user}
 
 
 # ---------------- Delete ----------------
-@router.delete("/{user_id}", response_model=dict)
-def delete_user_endpoint(user_id: int, db: Session = Depends(get_db)):
-    return user_crud.delete_user(db, user_id)
+@router.delete("/{user_id}", response_model=MessageResponse)
+async def delete_user_endpoint(user_id: int, db: DBSession = Depends(get_db)):
+    return await run_db(db, user_crud.delete_user, user_id)
 
 
 # ---------------- Test endpoints ----------------
-@router.get("/me", response_model=dict)
-def read_current_user(current_user = Depends(get_current_user)):
-    return {"id": current_user.id, "name": current_user.name, "email": current_user.email}
+@router.get("/me", response_model=UserResponse)
+async def read_current_user(current_user = Depends(get_current_user)):
+    return current_user
@@ -0,0 +1,34 @@
+from fastapi import APIRouter, HTTPException, WebSocket, status
+
+from app.utils.auth import principal_from_token
+from app.utils.websocket_manager import manager
+
+router = APIRouter(tags=["WebSocket"])
+
+# ---------------- Real-time events ----------------
+# Connect with ws://.../ws?token=<access token>.
+#   driver: subscribed to driver:<id> (ride assignments) and stand:<stand_id> (queue changes)
+#   user:   subscribed to user:<id> (ride updates)
+# Clients may send {"action": "subscribe"|"unsubscribe", "channel": "stand:<id>"} (an existing
+# stand, up to WS_MAX_SUBSCRIPTIONS channels per connection) and {"action": "ping"}; the server
+# sends {"type": "ping"} every WS_HEARTBEAT_INTERVAL seconds and drops connections that stay
+# silent for WS_HEARTBEAT_TIMEOUT. Anything else gets {"type": "error"} back and the connection
+# stays open.
+@router.websocket("/ws")
+async def events(websocket: WebSocket, token: str):
+    # no request-scoped session: it would pin a pooled connection for the socket's lifetime
+    try:
+        role, principal = await principal_from_token(token)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    if role == "driver":
+        channels = [f"driver:{principal.id}"]
+        if principal.stand_id:
+            channels.append(f"stand:{principal.stand_id}")
+    else:
+        channels = [f"user:{principal.id}"]
+
+    conn = await manager.connect(websocket, principal.id, role, channels)
+    await manager.serve(conn)
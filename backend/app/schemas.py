@@ -1,6 +1,6 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional
-from uuid import UUID
+from datetime import datetime
+from pydantic import BaseModel, ConfigDict, EmailStr, Field
+from typing import List, Literal, Optional
 
 # ---------------- User Schemas ----------------
 class UserCreate(BaseModel):
@@ -15,15 +15,19 @@ class UserUpdate(BaseModel):
     password: Optional[str] = None
     phone_number: Optional[str] = None
 
+# Response models read ORM rows (and auth principals) directly through from_attributes,
+# so routers return them as they are instead of building dicts by hand.
 class UserResponse(BaseModel):
-    id: UUID
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
     name: str
-    email: EmailStr
-    phone_number: Optional[str] = None
+    # plain str on the way out: stored addresses are not re-validated on every read
+    email: Optional[str] = None
 
-    class Config:
-        orm_mode = True
-        from_attributes = True
+class UserStatusResponse(BaseModel):
+    status: str = "success"
+    user: UserResponse
 
 
 # ---------------- Driver Schemas ----------------
@@ -40,19 +44,60 @@ class DriverUpdate(BaseModel):
     stand_id: Optional[int] = None
     is_available: Optional[bool] = None
 
+class DriverResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    name: str
+    phone: Optional[str] = None
+    stand_id: Optional[int] = None
+    is_available: Optional[bool] = None
+
+class DriverStatusResponse(BaseModel):
+    status: str = "success"
+    driver: DriverResponse
+
+# GET /drivers/me: the authenticated principal (no availability)
+class DriverMeResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    name: Optional[str] = None
+    phone: Optional[str] = None
+    stand_id: Optional[int] = None
+
+class DriverAvailability(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    is_available: bool
+
+class DriverAvailabilityResponse(BaseModel):
+    status: str = "success"
+    driver: DriverAvailability
+
+class NearbyDriverResponse(BaseModel):
+    driver_id: int
+    lat: float
+    lng: float
+    distance_m: float
+    recorded_at: datetime
 
-# ---------------- Ride Schemas ----------------
-from datetime import datetime
 
+# ---------------- Ride Schemas ----------------
 class RideCreate(BaseModel):
     user_id: int
     start_location: str
     end_location: str
     stand_id: Optional[int] = None
+    # pickup point; lets the ride fall back to the nearest stands with waiting drivers
+    pickup_lat: Optional[float] = Field(None, ge=-90, le=90)
+    pickup_lng: Optional[float] = Field(None, ge=-180, le=180)
 
 class RideUpdate(BaseModel):
     driver_id: Optional[int] = None
-    status: Optional[str] = None  # pending, accepted, completed, cancelled
+    # target of a lifecycle transition (see ride_crud.RIDE_TRANSITIONS); rides start as pending
+    status: Optional[Literal["accepted", "ongoing", "completed", "cancelled"]] = None
 
 class RideResponse(BaseModel):
     id: int
@@ -60,29 +105,99 @@ class RideResponse(BaseModel):
     driver_id: Optional[int]
     start_location: str
     end_location: str
+    pickup_lat: Optional[float] = None
+    pickup_lng: Optional[float] = None
+    stand_id: Optional[int] = None
     status: str
     requested_at: datetime
+    accepted_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+    cancelled_at: Optional[datetime] = None
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # ---------------- AutoStand Schemas ----------------
 class AutoStandCreate(BaseModel):
     name: str
     location: str
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
 
 class AutoStandUpdate(BaseModel):
     name: Optional[str] = None
     location: Optional[str] = None
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
 
 class AutoStandResponse(BaseModel):
     id: int
     name: str
     location: str
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+class NearestStandResponse(BaseModel):
+    stand_id: int
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    distance_m: float
+    waiting: int
+
+
+# ---------------- Queue Schemas ----------------
+class QueueEntryResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    driver_id: int
+    joined_at: datetime
+
+class QueueJoinResponse(BaseModel):
+    status: str = "success"
+    queue_id: int
+    driver_id: int
+    joined_at: datetime
 
-    class Config:
-        orm_mode = True
+class QueuePopResponse(QueueJoinResponse):
+    status_in_queue: str
+
+class QueuePositionResponse(BaseModel):
+    stand_id: int
+    driver_id: int
+    position: int
+
+class QueueLeaveResponse(BaseModel):
+    status: str = "success"
+    driver_id: int
+
+
+# ---------------- Bulk onboarding ----------------
+# Rows that fail are reported by their index in the request body; the rest are created.
+class BulkRowError(BaseModel):
+    index: int
+    detail: str
+
+class BulkUserResponse(BaseModel):
+    created: List[UserResponse]
+    errors: List[BulkRowError]
+
+class BulkDriverResponse(BaseModel):
+    created: List[DriverResponse]
+    errors: List[BulkRowError]
+
+class BulkStandResponse(BaseModel):
+    created: List[AutoStandResponse]
+    errors: List[BulkRowError]
+
+
+# ---------------- Generic ----------------
+class MessageResponse(BaseModel):
+    status: str
+    message: str
 
 
 # -----------------Token / Auth schemas-------------
@@ -105,5 +220,6 @@ class AvailabilityPayload(BaseModel):
     available: bool
 
 class LocationPayload(BaseModel):
-    lat: float
-    lng: float
\ No newline at end of file
+    lat: float = Field(..., ge=-90, le=90)
+    lng: float = Field(..., ge=-180, le=180)
+    recorded_at: Optional[datetime] = None  # device time of the fix; server time when omitted
\ No newline at end of file
@@ -0,0 +1,181 @@
+"""
+Admission control: per-client rate limits and load shedding, run for every HTTP route as an
+app-level dependency (main.py), before the route's own dependencies (auth, DB session). The
+in-flight slot it takes is released by AdmissionMiddleware once the response has been sent
+in full, streamed exports included.
+
+Each route has a policy, the budget it draws on and its priority (ROUTES; other GETs are
+("read", low), other writes ("write", normal); health and metrics routes are exempt):
+
+  1. rate limit: one token from the client's bucket for that budget, the client being the
+     JWT subject ("driver:3") or, without a valid token and always for "auth", the client
+     IP. An empty bucket is a 429 with Retry-After. A client polling /stands/{id}/queue in
+     a loop drains its own "queue_read" bucket and nothing else.
+  2. load shedding (utils/limits.LoadShedder): a 503 with Retry-After for low-priority reads
+     while the DB pool wait is high, and for anything but ride booking and queue pops/joins
+     beyond ADMISSION_MAX_IN_FLIGHT requests in flight.
+
+Rejections are counted per budget / priority on /metrics; GET /metrics/admission shows the
+current state for tuning.
+"""
+from functools import lru_cache
+from math import ceil
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException, status
+from starlette.requests import HTTPConnection
+
+from app.config import settings
+from app.utils.auth import token_rate_key
+from app.utils.cache import TTLCache
+from app.utils.limits import CRITICAL, LOW, NORMAL, PRIORITIES, load_shedder, rate_limiter
+from app.utils.metrics import REGISTRY
+
+# budget -> (requests per second, burst) per client; RATE_LIMITS overrides
+BUDGETS: Dict[str, Tuple[float, float]] = {
+    "auth": (0.5, 10),        # logins per IP: each one is an Argon2 verify
+    "signup": (0.2, 5),       # sign-ups per IP (no token yet)
+    "bulk": (0.1, 2),
+    "booking": (1, 5),
+    "queue_write": (5, 20),   # join / leave / pop
+    "queue_read": (2, 10),    # queue listing and position, what driver apps poll
+    "presence": (2, 10),      # location pings, heartbeats, availability toggles
+    "export": (0.1, 2),
+    "read": (20, 50),
+    "write": (5, 20),
+}
+# budgets keyed by client IP even for a valid token
+IP_BUDGETS = {"auth"}
+
+# (method, route path) -> (budget, priority)
+ROUTES: Dict[Tuple[str, str], Tuple[str, str]] = {
+    ("POST", "/auth/token"): ("auth", NORMAL),
+    ("POST", "/auth/driver/token"): ("auth", NORMAL),
+    ("POST", "/users/"): ("signup", NORMAL),
+    ("POST", "/drivers/drivers/"): ("signup", NORMAL),
+    ("POST", "/users/bulk"): ("bulk", NORMAL),
+    ("POST", "/drivers/drivers/bulk"): ("bulk", NORMAL),
+    ("POST", "/stands/bulk"): ("bulk", NORMAL),
+    ("POST", "/rides/rides/"): ("booking", CRITICAL),
+    ("POST", "/stands/{stand_id}/pop"): ("queue_write", CRITICAL),
+    ("POST", "/stands/{stand_id}/join"): ("queue_write", CRITICAL),
+    ("POST", "/stands/me/leave"): ("queue_write", NORMAL),
+    ("GET", "/stands/{stand_id}/queue"): ("queue_read", LOW),
+    ("GET", "/stands/{stand_id}/queue/position"): ("queue_read", LOW),
+    ("POST", "/drivers/drivers/me/location"): ("presence", NORMAL),
+    ("POST", "/drivers/drivers/me/heartbeat"): ("presence", NORMAL),
+    ("POST", "/drivers/drivers/me/set_available"): ("presence", NORMAL),
+    ("GET", "/exports/{kind}"): ("export", LOW),
+}
+# probes and scrapes must get through an overloaded worker
+EXEMPT_PREFIXES = ("/health", "/metrics")
+# request scope key: the priority whose in-flight slot the request holds
+SCOPE_KEY = "admission.priority"
+
+RATE_LIMITED = REGISTRY.counter("rate_limited_total", "Requests rejected with 429 by a client's token bucket")
+ADMITTED = REGISTRY.counter("admission_admitted_total", "Requests admitted by the load shedder")
+SHED = REGISTRY.counter("admission_shed_total", "Requests shed with 503 (reason: in_flight or pool_wait)")
+REGISTRY.gauge("admission_in_flight", "Requests in flight by priority",
+               callback=lambda: {(("priority", p),): n for p, n in load_shedder.in_flight.items()})
+REGISTRY.gauge("admission_pool_wait_seconds", "Smoothed DB pool checkout wait the load shedder acts on",
+               callback=lambda: {(): load_shedder.pool_wait()})
+REGISTRY.gauge("rate_limit_clients", "Token buckets held (client x budget)",
+               callback=lambda: {(): len(rate_limiter)})
+
+# bearer token -> rate-limit key; the auth dependencies still verify every token themselves
+_subjects = TTLCache(maxsize=settings.RATE_LIMIT_MAX_CLIENTS, ttl=300, name="rate_limit_subjects")
+
+
+def _budgets() -> Dict[str, Tuple[float, float]]:
+    budgets = dict(BUDGETS)
+    for item in filter(None, (part.strip() for part in settings.RATE_LIMITS.split(","))):
+        name, _, limits = item.partition("=")
+        rate, _, burst = limits.partition("/")
+        budgets[name.strip()] = (float(rate), float(burst or rate))
+    for name, (rate, burst) in budgets.items():
+        # a bucket that never refills (or never holds a whole token) would reject every request
+        if not rate > 0 or not burst >= 1:
+            raise ValueError(f"RATE_LIMITS: budget {name!r} needs a rate above 0 and a burst of at least 1, "
+                             f"got {rate:g}/{burst:g}")
+    return budgets
+
+
+budgets = _budgets()
+
+
+@lru_cache(maxsize=None)
+def policy(method: str, path: str) -> Optional[Tuple[str, str]]:
+    if path.startswith(EXEMPT_PREFIXES):
+        return None
+    return ROUTES.get((method, path)) or (("read", LOW) if method in ("GET", "HEAD") else ("write", NORMAL))
+
+
+def _client(connection: HTTPConnection, budget: str) -> str:
+    if budget not in IP_BUDGETS:
+        scheme, _, token = connection.headers.get("authorization", "").partition(" ")
+        if token and scheme.lower() == "bearer":
+            key = _subjects.get_or_set(token, lambda: token_rate_key(token))
+            if key is not None:
+                return key
+    return "ip:" + (connection.client.host if connection.client else "unknown")
+
+
+def _check_rate(connection: HTTPConnection, budget: str) -> None:
+    rate, burst = budgets[budget]
+    retry_after = rate_limiter.take((budget, _client(connection, budget)), rate, burst)
+    if retry_after:
+        RATE_LIMITED.inc(budget=budget)
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Rate limit exceeded",
+                            headers={"Retry-After": str(ceil(retry_after))})
+
+
+async def admit(connection: HTTPConnection) -> None:
+    route = connection.scope.get("route")
+    found = policy(connection.scope["method"], route.path) if connection.scope["type"] == "http" and route else None
+    if found is None:
+        return
+    budget, priority = found
+    if settings.RATE_LIMIT_ENABLED:
+        _check_rate(connection, budget)
+    reason = load_shedder.acquire(priority)
+    if reason is not None:
+        SHED.inc(priority=priority, reason=reason)
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Server busy, retry shortly",
+                            headers={"Retry-After": "1"})
+    ADMITTED.inc(priority=priority)
+    # released by AdmissionMiddleware: a yield dependency's exit runs before a streamed body is sent
+    connection.scope[SCOPE_KEY] = priority
+
+
+class AdmissionMiddleware:
+    """Releases the in-flight slot `admit` took once the response is sent (or the request fails)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            priority = scope.pop(SCOPE_KEY, None)
+            if priority is not None:
+                load_shedder.release(priority)
+
+
+def stats() -> dict:
+    pool_wait = load_shedder.pool_wait()
+    return {
+        "in_flight": dict(load_shedder.in_flight),
+        "pool_wait_ms": round(pool_wait * 1000, 3),
+        "shedding_reads": pool_wait >= load_shedder.shed_wait,
+        "max_in_flight": load_shedder.max_in_flight,
+        "low_priority_in_flight": load_shedder.low_in_flight,
+        "shed_pool_wait_ms": load_shedder.shed_wait * 1000,
+        "rate_limit_enabled": settings.RATE_LIMIT_ENABLED,
+        "rate_limit_clients": len(rate_limiter),
+        "budgets": {name: {"rate": rate, "burst": burst} for name, (rate, burst) in budgets.items()},
+        "admitted": {p: ADMITTED.value(priority=p) for p in PRIORITIES},
+    }
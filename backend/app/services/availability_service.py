@@ -0,0 +1,104 @@
+"""
+Driver availability and heartbeat pipeline (write-behind).
+
+    POST /drivers/me/set_available -> set_available() -> driver_availability (memory, utils/availability.py)
+                                                     -> the toggle to other workers over the bus
+    POST /drivers/me/heartbeat     -> heartbeat()     -> driver_availability
+    every AVAILABILITY_FLUSH_INTERVAL s -> flush() -> one UPDATE per availability value and one
+                                                      executemany of last_seen_at
+
+A toggle or heartbeat costs a dict update; no DB round trip. Pops and ride
+assignment read availability from memory, and the queue expiry job reads
+`last_seen_at`, which trails a heartbeat by at most one flush interval. Values
+not yet flushed are lost if the worker dies; the driver app re-sends on its
+next heartbeat or toggle.
+"""
+import asyncio
+import logging
+from datetime import datetime
+from time import perf_counter
+from typing import Optional
+
+from app.config import settings
+from app.crud import driver_crud
+from app.database import db_session, run_db
+from app.utils.availability import driver_availability, share
+from app.utils.metrics import REGISTRY
+from app.utils.queue import stand_queues
+from app.utils.response_cache import invalidate_driver
+
+logger = logging.getLogger(__name__)
+
+TOGGLES = REGISTRY.counter("availability_toggles_total", "Driver availability changes received")
+HEARTBEATS = REGISTRY.counter("driver_heartbeats_total", "Driver heartbeats received")
+ROWS_FLUSHED = REGISTRY.counter("availability_rows_flushed_total", "Availability and last-seen values written to the DB")
+FLUSH_SECONDS = REGISTRY.histogram("availability_flush_seconds", "Duration of one bulk availability flush")
+REGISTRY.gauge("availability_dirty_values", "Availability and last-seen values not yet flushed to the DB",
+               callback=lambda: {(): driver_availability.dirty_count()})
+REGISTRY.gauge("availability_passed_over_drivers", "Waiting drivers that pops pass over as unavailable",
+               callback=lambda: {(): len(driver_availability.unavailable())})
+
+_flush_task: Optional[asyncio.Task] = None
+
+
+# ---------------- Ingest ----------------
+def set_available(driver_id: int, available: bool) -> None:
+    TOGGLES.inc(available=str(available).lower())
+    driver_availability.set(driver_id, available)
+    driver_availability.touch(driver_id, datetime.utcnow())
+    share(driver_id, available)
+    # the rendered profile (by id) goes now, lookups by phone once the flush knows the phone
+    invalidate_driver(driver_id)
+
+
+def heartbeat(driver_id: int) -> None:
+    HEARTBEATS.inc()
+    driver_availability.touch(driver_id, datetime.utcnow())
+
+
+# ---------------- Flush ----------------
+async def flush() -> int:
+    """Write every pending toggle and heartbeat in bulk."""
+    available, seen = driver_availability.drain_dirty()
+    if not available and not seen:
+        return 0
+    start = perf_counter()
+    try:
+        async with db_session() as db:
+            await run_db(db, driver_crud.bulk_update_availability, available, seen)
+    except Exception:
+        driver_availability.restore_dirty(available, seen)
+        logger.exception("availability flush failed for %d drivers; will retry", len(available) + len(seen))
+        return 0
+    FLUSH_SECONDS.observe(perf_counter() - start)
+    ROWS_FLUSHED.inc(len(available), kind="available")
+    ROWS_FLUSHED.inc(len(seen), kind="last_seen")
+    return len(available) + len(seen)
+
+
+async def _flush_loop(interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await flush()
+            if stand_queues.ready:
+                driver_availability.prune(lambda driver_id: stand_queues.get(driver_id) is not None)
+        except Exception:
+            logger.exception("availability flush loop iteration failed")
+
+
+# ---------------- Lifecycle ----------------
+async def start() -> None:
+    global _flush_task
+    if _flush_task is None:
+        _flush_task = asyncio.ensure_future(_flush_loop(settings.AVAILABILITY_FLUSH_INTERVAL))
+
+
+async def stop() -> None:
+    """Stop the flush loop and write whatever is still pending."""
+    global _flush_task
+    if _flush_task is not None:
+        _flush_task.cancel()
+        await asyncio.gather(_flush_task, return_exceptions=True)
+        _flush_task = None
+    await flush()
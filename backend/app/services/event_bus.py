@@ -0,0 +1,256 @@
+"""
+Cross-worker pub/sub for ride/queue events.
+
+Every uvicorn worker runs one bus. `publish(topic, payload, key)` may be called
+from any thread; events are buffered and flushed every EVENT_BUS_FLUSH_MS as a
+single batch, and events sharing a (topic, key) within one window collapse into
+the latest one. Each batch is delivered to the handlers registered with
+`subscribe(topic, handler)` in every worker, including the publishing one;
+handlers receive `(payload, local)` where `local` says whether the batch came
+from this worker. Events sent while a worker's listener connection is down never
+reach it; the coroutines registered with `on_reconnect(handler)` run once it is
+back, so the caches the bus feeds can be read again.
+
+Backends:
+  - "postgres": LISTEN/NOTIFY on the application database (asyncpg connection)
+  - "memory":   in-process only, for single-worker runs and the benches
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import uuid
+from collections import OrderedDict
+from threading import Lock
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional
+
+from app.config import settings
+from app.utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+BUS_PUBLISHED = REGISTRY.counter("event_bus_published_total", "Events handed to the bus")
+BUS_COALESCED = REGISTRY.counter("event_bus_coalesced_total", "Events replaced by a newer one with the same key before flush")
+BUS_BATCHES = REGISTRY.counter("event_bus_batches_total", "Batches sent (one NOTIFY each for the postgres backend)")
+BUS_RECEIVED = REGISTRY.counter("event_bus_received_total", "Events received and dispatched")
+BUS_RECONNECTS = REGISTRY.counter("event_bus_reconnects_total", "Listener connections re-established after a drop")
+
+# NOTIFY payloads must stay below 8000 bytes
+MAX_PAYLOAD_BYTES = 7500
+
+Handler = Callable[[object, bool], None]
+ReconnectHandler = Callable[[], Awaitable[None]]
+
+
+class EventBus:
+    def __init__(self, flush_interval: float = 0.02):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.flush_interval = flush_interval
+        self._handlers: Dict[str, List[Handler]] = {}
+        self._reconnect_handlers: List[ReconnectHandler] = []
+        self._pending: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._pending_lock = Lock()
+        self._seq = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._send_lock: Optional[asyncio.Lock] = None
+        self._flush_scheduled = False
+
+    # ---------------- Subscribing ----------------
+    def subscribe(self, topic: str, handler: Handler) -> None:
+        self._handlers.setdefault(topic, []).append(handler)
+
+    def on_reconnect(self, handler: ReconnectHandler) -> None:
+        """Run `await handler()` after the bus reconnects (events sent meanwhile are lost)."""
+        self._reconnect_handlers.append(handler)
+
+    # ---------------- Publishing ----------------
+    def publish(self, topic: str, payload, key: Optional[Hashable] = None) -> None:
+        """Buffer an event for the next flush. No-op until the bus is started."""
+        if self._loop is None:
+            return
+        BUS_PUBLISHED.inc(topic=topic)
+        with self._pending_lock:
+            if key is None:
+                self._seq += 1
+                slot = ("seq", self._seq)
+            else:
+                slot = (topic, key)
+                if slot in self._pending:
+                    BUS_COALESCED.inc(topic=topic)
+                    # the latest event goes out after everything published before it
+                    self._pending.move_to_end(slot)
+            self._pending[slot] = (topic, payload)
+            schedule = not self._flush_scheduled
+            self._flush_scheduled = True
+        if schedule:
+            self._loop.call_soon_threadsafe(self._schedule_flush)
+
+    def _schedule_flush(self) -> None:
+        self._loop.call_later(self.flush_interval, lambda: asyncio.ensure_future(self._flush()))
+
+    async def _flush(self) -> None:
+        with self._pending_lock:
+            events = [list(e) for e in self._pending.values()]
+            self._pending.clear()
+            self._flush_scheduled = False
+        if not events:
+            return
+        try:
+            # one batch at a time keeps per-worker ordering (and asyncpg allows one query per connection)
+            async with self._send_lock:
+                await self._send(events)
+        except Exception:
+            logger.exception("event bus: failed to send %d events", len(events))
+
+    def _dispatch(self, events: List[list], origin: str) -> None:
+        local = origin == self.worker_id
+        for topic, payload in events:
+            BUS_RECEIVED.inc(topic=topic)
+            for handler in self._handlers.get(topic, ()):
+                try:
+                    handler(payload, local)
+                except Exception:
+                    logger.exception("event bus: handler for %r failed", topic)
+
+    async def _reconnected(self) -> None:
+        BUS_RECONNECTS.inc()
+        for handler in self._reconnect_handlers:
+            try:
+                await handler()
+            except Exception:
+                logger.exception("event bus: reconnect handler %r failed", handler)
+
+    # ---------------- Backend hooks ----------------
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._send_lock = asyncio.Lock()
+
+    async def stop(self) -> None:
+        if self._loop is not None:
+            await self._flush()
+        self._loop = None
+
+    async def _send(self, events: List[list]) -> None:
+        raise NotImplementedError
+
+
+class InProcessEventBus(EventBus):
+    async def _send(self, events: List[list]) -> None:
+        BUS_BATCHES.inc()
+        self._dispatch(events, self.worker_id)
+
+
+class PostgresEventBus(EventBus):
+    # how long a flush waits for a reconnect before dropping its batch
+    SEND_RECONNECT_TIMEOUT = 5.0
+
+    def __init__(self, dsn: str, channel: str, flush_interval: float = 0.02, max_backoff: float = 30.0):
+        super().__init__(flush_interval)
+        self.dsn = dsn
+        self.channel = channel
+        self.max_backoff = max_backoff
+        self._conn = None
+        self._reconnecting: Optional[asyncio.Task] = None
+        self._after_reconnect: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        await super().start()
+        await self._connect()
+
+    async def stop(self) -> None:
+        await super().stop()
+        for task in (self._reconnecting, self._after_reconnect):
+            if task is not None:
+                task.cancel()
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
+    async def _connect(self) -> None:
+        import asyncpg
+
+        conn = await asyncpg.connect(self.dsn)
+        conn.add_termination_listener(self._on_terminated)
+        await conn.add_listener(self.channel, self._on_notify)
+        self._conn = conn
+
+    # ---------------- Reconnecting ----------------
+    def _connected(self) -> bool:
+        return self._conn is not None and not self._conn.is_closed()
+
+    def _on_terminated(self, connection) -> None:
+        # the listener connection died (DB restart, pooler recycle): nothing reaches this worker until it is back
+        if self._loop is not None and connection is self._conn:
+            logger.warning("event bus: listener connection lost, reconnecting")
+            self._reconnect_soon()
+
+    def _reconnect_soon(self) -> asyncio.Task:
+        if self._reconnecting is None or self._reconnecting.done():
+            self._reconnecting = asyncio.ensure_future(self._reconnect())
+        return self._reconnecting
+
+    async def _reconnect(self) -> None:
+        backoff = 0.5
+        while not self._connected():
+            try:
+                await self._connect()
+            except Exception as exc:
+                logger.warning("event bus: reconnect failed, retrying in %.1fs: %r", backoff, exc)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+        logger.info("event bus: reconnected")
+        # in its own task: a flush waiting for the connection need not wait for the caches
+        self._after_reconnect = asyncio.ensure_future(self._reconnected())
+
+    def _on_notify(self, connection, pid, channel, payload: str) -> None:
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            logger.warning("event bus: dropping malformed payload")
+            return
+        self._dispatch(message["e"], message["o"])
+
+    async def _send(self, events: List[list]) -> None:
+        if not self._connected():
+            await asyncio.wait([self._reconnect_soon()], timeout=self.SEND_RECONNECT_TIMEOUT)
+            if not self._connected():
+                raise ConnectionError("event bus connection is down")
+        for chunk in self._chunks(events):
+            await self._conn.execute("SELECT pg_notify($1, $2)", self.channel, chunk)
+            BUS_BATCHES.inc()
+
+    def _chunks(self, events: List[list]):
+        batch: List[str] = []
+        size = 0
+        for event in events:
+            encoded = json.dumps(event, separators=(",", ":"), default=str)
+            if batch and size + len(encoded) > MAX_PAYLOAD_BYTES:
+                yield self._envelope(batch)
+                batch, size = [], 0
+            batch.append(encoded)
+            size += len(encoded) + 1
+        if batch:
+            yield self._envelope(batch)
+
+    def _envelope(self, encoded_events: List[str]) -> str:
+        return '{"o":%s,"e":[%s]}' % (json.dumps(self.worker_id), ",".join(encoded_events))
+
+
+def _asyncpg_dsn(url: str) -> str:
+    # asyncpg wants a plain libpq-style URL without the SQLAlchemy driver suffix
+    scheme, rest = url.split("://", 1)
+    return "postgresql://" + rest
+
+
+def _build_bus() -> EventBus:
+    flush_interval = settings.EVENT_BUS_FLUSH_MS / 1000
+    backend = settings.EVENT_BUS_BACKEND
+    if not backend:
+        backend = "postgres" if (settings.DATABASE_URL or "").startswith("postgres") else "memory"
+    if backend == "postgres":
+        return PostgresEventBus(_asyncpg_dsn(settings.DATABASE_URL), settings.EVENT_BUS_CHANNEL, flush_interval)
+    return InProcessEventBus(flush_interval)
+
+
+bus = _build_bus()
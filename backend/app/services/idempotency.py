@@ -0,0 +1,136 @@
+"""
+Idempotency-Key support for ride creation and queue join/pop.
+
+A client that retries one of these POSTs with the same `Idempotency-Key` header gets the
+response of the first attempt back (marked `Idempotent-Replayed: true`) instead of a second
+ride, join or pop. Keys are scoped to the caller and the operation, and a key reused with a
+different body is rejected with 422.
+
+Lookups go, cheapest first, through:
+
+  1. this worker's recent responses (memory, IDEMPOTENCY_CACHE_SIZE, TTL IDEMPOTENCY_TTL)
+  2. a request with the same key still running in this worker: wait for it, then look again
+  3. the idempotency_keys table, claimed inside the request's own transaction
+     (crud/idempotency_crud.py), which also covers retries landing on another worker
+
+Only successful responses are stored; a request that fails leaves no key, so its retry runs
+again. Expired keys are purged by the scheduler every IDEMPOTENCY_PURGE_INTERVAL seconds.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException, Response, status
+from pydantic import BaseModel
+from starlette.requests import HTTPConnection
+
+from app.config import settings
+from app.crud import idempotency_crud
+from app.crud.idempotency_crud import IdempotentRequest, StoredResponse
+from app.database import db_session, run_db
+from app.services.scheduler import Scheduler
+from app.utils.auth import token_rate_key
+from app.utils.cache import TTLCache
+from app.utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+KEY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+REPLAYS = REGISTRY.counter("idempotency_replays_total", "Requests answered with the stored response of their key")
+PURGED = REGISTRY.counter("idempotency_keys_purged_total", "Expired idempotency keys deleted")
+
+# batches per purge run; a larger backlog drains over the following runs
+MAX_PURGE_BATCHES = 20
+
+_responses = TTLCache(maxsize=settings.IDEMPOTENCY_CACHE_SIZE, ttl=settings.IDEMPOTENCY_TTL, name="idempotency")
+_running: Dict[Tuple[str, str], asyncio.Future] = {}
+
+
+def caller(connection: HTTPConnection) -> str:
+    """
+    Whose keys these are on a route that takes no login (queue pops): the subject of a bearer
+    token that verifies, else the client address, so two callers never share a key.
+    """
+    scheme, _, token = connection.headers.get("authorization", "").partition(" ")
+    if token and scheme.lower() == "bearer":
+        subject = token_rate_key(token)
+        if subject is not None:
+            return subject
+    return "ip:" + (connection.client.host if connection.client else "unknown")
+
+
+def request_for(key: Optional[str], scope: str, payload: Any,
+                render: Callable[[Any], BaseModel]) -> Optional[IdempotentRequest]:
+    """The keyed request for an `Idempotency-Key` header value (None without one)."""
+    if key is None:
+        return None
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"{KEY_HEADER} must be 1 to {MAX_KEY_LENGTH} characters")
+    body = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return IdempotentRequest(scope, key, hashlib.sha256(body.encode()).hexdigest(), render)
+
+
+def _replay(stored: StoredResponse, source: str) -> Response:
+    REPLAYS.inc(source=source)
+    return Response(content=stored.body, status_code=stored.status_code, media_type="application/json",
+                    headers={REPLAYED_HEADER: "true"})
+
+
+async def run(request: Optional[IdempotentRequest], call: Callable[[], Awaitable[Any]]):
+    """
+    Run `call()` (which hands `request` to the CRUD function) unless the key already has a
+    response; returns the result, or the stored response as a Response.
+    """
+    if request is None:
+        return await call()
+    cache_key = (request.scope, request.key)
+    while True:
+        stored = _responses.get(cache_key)
+        if stored is not None:
+            return _replay(request.check(stored), "memory")
+        running = _running.get(cache_key)
+        if running is None:
+            break
+        # a duplicate of a request in flight here: its response (if it succeeds) is ours
+        await asyncio.wait([running])
+
+    done = _running[cache_key] = asyncio.get_running_loop().create_future()
+    try:
+        result = await call()
+    finally:
+        del _running[cache_key]
+        done.set_result(None)
+    if isinstance(result, StoredResponse):
+        _responses.set(cache_key, result)
+        return _replay(result, "db")
+    if request.response is not None:
+        _responses.set(cache_key, request.response)
+    return result
+
+
+# ---------------- Purge ----------------
+async def purge_expired() -> int:
+    older_than = datetime.utcnow() - timedelta(seconds=settings.IDEMPOTENCY_TTL)
+    total = 0
+    # one short transaction per batch, as in queue_maintenance.archive_history
+    for _ in range(MAX_PURGE_BATCHES):
+        async with db_session() as db:
+            deleted = await run_db(db, idempotency_crud.purge_expired, older_than, settings.IDEMPOTENCY_PURGE_BATCH)
+        total += deleted
+        PURGED.inc(deleted)
+        if deleted < settings.IDEMPOTENCY_PURGE_BATCH:
+            break
+    if total:
+        logger.info("purged %d expired idempotency keys", total)
+    return total
+
+
+def schedule(scheduler: Scheduler) -> None:
+    scheduler.every(settings.IDEMPOTENCY_PURGE_INTERVAL, "idempotency_purge", purge_expired)
@@ -0,0 +1,137 @@
+"""
+Driver live-location pipeline.
+
+    POST /drivers/me/location -> ingest() -> driver_locations (memory, utils/locations.py)
+    every LOCATION_FLUSH_INTERVAL s -> flush() -> one bulk UPDATE of the dirty drivers
+                                             -> the same batch to other workers over the bus
+
+A ping costs a dict update and, at most, a grid-cell move; no DB round trip.
+Nearby queries are answered from memory by every worker.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from time import perf_counter
+from typing import Iterable, List, Optional, Tuple
+
+from app.config import settings
+from app.crud import driver_crud
+from app.database import db_session, run_db
+from app.services.event_bus import bus
+from app.utils.locations import DriverLocation, driver_locations
+from app.utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+POINTS_RECEIVED = REGISTRY.counter("location_points_received_total", "GPS points received by the ingest endpoint")
+POINTS_IGNORED = REGISTRY.counter("location_points_ignored_total", "Pings ignored because a newer point was already stored")
+ROWS_FLUSHED = REGISTRY.counter("location_rows_flushed_total", "Driver positions written to the DB")
+FLUSH_SECONDS = REGISTRY.histogram("location_flush_seconds", "Duration of one bulk location flush")
+REGISTRY.gauge("location_drivers_tracked", "Drivers held in the in-memory location index",
+               callback=lambda: {(): len(driver_locations)})
+REGISTRY.gauge("location_dirty_drivers", "Drivers with a position not yet flushed to the DB",
+               callback=lambda: {(): driver_locations.dirty_count()})
+
+# rows per bus event; ~60 bytes each keeps an event well under the NOTIFY payload limit
+BUS_CHUNK = 100
+# device clocks run ahead; a point from the future would block every later real ping
+MAX_CLOCK_SKEW = timedelta(seconds=30)
+
+_flush_task: Optional[asyncio.Task] = None
+
+
+def _utc(recorded_at: Optional[datetime], now: datetime) -> datetime:
+    if recorded_at is None:
+        return now
+    if recorded_at.tzinfo is not None:
+        recorded_at = recorded_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return min(recorded_at, now + MAX_CLOCK_SKEW)
+
+
+# ---------------- Ingest ----------------
+def ingest(driver_id: int, points: Iterable) -> bool:
+    """
+    Record GPS points (objects with lat, lng, recorded_at) for one driver. Only the newest
+    point of the batch matters; returns False if an even newer point was already stored.
+    """
+    now = datetime.utcnow()
+    latest: Optional[Tuple[datetime, float, float]] = None
+    count = 0
+    for point in points:
+        count += 1
+        ts = _utc(point.recorded_at, now)
+        if latest is None or ts >= latest[0]:
+            latest = (ts, point.lat, point.lng)
+    if latest is None:
+        return False
+    POINTS_RECEIVED.inc(count)
+    stored = driver_locations.update(DriverLocation(driver_id, latest[1], latest[2], latest[0]))
+    if not stored:
+        POINTS_IGNORED.inc()
+    return stored
+
+
+def nearby(lat: float, lng: float, radius_m: float, limit: int = 50) -> List[Tuple[float, DriverLocation]]:
+    return driver_locations.within(lat, lng, radius_m, limit)
+
+
+# ---------------- Flush ----------------
+async def flush() -> int:
+    """Write every dirty position in one bulk UPDATE and share the batch with the other workers."""
+    locations = driver_locations.drain_dirty()
+    if not locations:
+        return 0
+    start = perf_counter()
+    try:
+        async with db_session() as db:
+            await run_db(db, driver_crud.bulk_update_locations, locations)
+    except Exception:
+        driver_locations.restore_dirty(locations)
+        logger.exception("location flush failed for %d drivers; will retry", len(locations))
+        return 0
+    FLUSH_SECONDS.observe(perf_counter() - start)
+    ROWS_FLUSHED.inc(len(locations))
+    for i in range(0, len(locations), BUS_CHUNK):
+        bus.publish("location", [[loc.driver_id, loc.lat, loc.lng, loc.recorded_at.isoformat()]
+                                 for loc in locations[i:i + BUS_CHUNK]])
+    return len(locations)
+
+
+def _apply_remote_locations(rows: list, local: bool) -> None:
+    if local:
+        return
+    # already persisted by the publishing worker
+    driver_locations.update_many(
+        (DriverLocation(row[0], row[1], row[2], datetime.fromisoformat(row[3])) for row in rows),
+        dirty=False,
+    )
+
+
+bus.subscribe("location", _apply_remote_locations)
+
+
+async def _flush_loop(interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await flush()
+            driver_locations.prune()
+        except Exception:
+            logger.exception("location flush loop iteration failed")
+
+
+# ---------------- Lifecycle ----------------
+async def start() -> None:
+    global _flush_task
+    if _flush_task is None:
+        _flush_task = asyncio.ensure_future(_flush_loop(settings.LOCATION_FLUSH_INTERVAL))
+
+
+async def stop() -> None:
+    """Stop the flush loop and write whatever is still pending."""
+    global _flush_task
+    if _flush_task is not None:
+        _flush_task.cancel()
+        await asyncio.gather(_flush_task, return_exceptions=True)
+        _flush_task = None
+    await flush()
@@ -0,0 +1,85 @@
+"""
+Schema management for `python -m app.cli migrate`; the app itself never creates or alters tables.
+
+Postgres: an empty database gets sql/schema.sql (kept in sync with the migrations)
+and every file in sql/migrations is recorded as applied; otherwise the migrations
+missing from `schema_migrations` run in file order, each recorded once it has
+committed. The files manage their own transactions, so they run on an autocommit
+connection, under an advisory lock so two deploys never migrate at once. The
+migrations are idempotent (IF NOT EXISTS), so a database migrated by hand before
+this command existed can simply be migrated again.
+
+Other dialects (SQLite for development, tests and benches) get Base.metadata.create_all.
+"""
+from pathlib import Path
+from typing import List
+
+from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
+
+from app.config import settings
+
+SQL_DIR = Path(__file__).resolve().parents[2] / "sql"
+SCHEMA_FILE = SQL_DIR / "schema.sql"
+MIGRATIONS_DIR = SQL_DIR / "migrations"
+# pg_advisory_lock key, next to the queue maintenance keys in stand_crud
+MIGRATE_LOCK_KEY = 0x48410003
+
+
+def migration_files() -> List[Path]:
+    return sorted(MIGRATIONS_DIR.glob("*.sql"))
+
+
+def _create_all() -> None:
+    from app import model  # noqa: F401  (registers the tables)
+    from app.database import Base, engine
+
+    Base.metadata.create_all(bind=engine)
+
+
+def migrate(dry_run: bool = False) -> List[str]:
+    """Bring the schema up to date; returns what was (or, with `dry_run`, would be) applied."""
+    # own connection outside the app's pool: autocommit must not leak into pooled connections
+    migrate_engine = create_engine(settings.DATABASE_URL, poolclass=NullPool)
+    try:
+        if migrate_engine.dialect.name != "postgresql":
+            if not dry_run:
+                _create_all()
+            return ["create_all"]
+        connection = migrate_engine.raw_connection()
+        try:
+            connection.driver_connection.autocommit = True
+            cursor = connection.cursor()
+            cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATE_LOCK_KEY,))
+            return _apply_pending(cursor, dry_run)
+        finally:
+            connection.close()  # ends the session, releasing the advisory lock
+    finally:
+        migrate_engine.dispose()
+
+
+def _apply_pending(cursor, dry_run: bool) -> List[str]:
+    cursor.execute("SELECT to_regclass('users') IS NULL, to_regclass('schema_migrations') IS NOT NULL")
+    fresh, tracked = cursor.fetchone()
+    applied = set()
+    if tracked:
+        cursor.execute("SELECT version FROM schema_migrations")
+        applied = {version for (version,) in cursor.fetchall()}
+    files = migration_files()
+    if fresh:
+        plan = [(SCHEMA_FILE, [f.stem for f in files])]
+    else:
+        plan = [(f, [f.stem]) for f in files if f.stem not in applied]
+    if dry_run:
+        return [path.name for path, _ in plan]
+
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        " version text PRIMARY KEY,"
+        " applied_at timestamp NOT NULL DEFAULT (now() AT TIME ZONE 'utc'))"
+    )
+    for path, versions in plan:
+        cursor.execute(path.read_text())
+        for version in versions:
+            cursor.execute("INSERT INTO schema_migrations (version) VALUES (%s) ON CONFLICT DO NOTHING", (version,))
+    return [path.name for path, _ in plan]
@@ -0,0 +1,78 @@
+"""
+Ride and queue events pushed to WebSocket subscribers.
+
+CRUD code calls these after its transaction has committed. Events travel over
+the event bus (services/event_bus.py) so they reach sockets held by any worker;
+publishing only buffers them, so it is cheap and never blocks the caller.
+"""
+from app.services.event_bus import bus
+from app.utils.queue import stand_queues
+from app.utils.websocket_manager import manager
+
+
+def _send(channel: str, message: dict, key=None) -> None:
+    # bus-level key (per channel) coalesces within a flush window; the socket-level
+    # key coalesces whatever is still waiting in a slow client's outbox
+    bus.publish("ws", {"channel": channel, "message": message, "key": key},
+                key=(channel, *key) if key else None)
+
+
+def _deliver_ws(event: dict, local: bool) -> None:
+    key = event.get("key")
+    manager.publish(event["channel"], event["message"], tuple(key) if key else None)
+
+
+def _deliver_queue_snapshot(stand_id: int, local: bool) -> None:
+    channel = f"stand:{stand_id}"
+    if not manager.subscriber_count(channel):
+        return
+    drivers = [e.driver_id for e in stand_queues.entries(stand_id)]
+    manager.publish(channel, {"type": "queue_changed", "stand_id": stand_id, "drivers": drivers},
+                    key=("queue", stand_id))
+
+
+bus.subscribe("ws", _deliver_ws)
+bus.subscribe("queue_changed", _deliver_queue_snapshot)
+
+
+def _ride_payload(ride) -> dict:
+    return {
+        "id": ride.id,
+        "user_id": ride.user_id,
+        "driver_id": ride.driver_id,
+        "start_location": ride.start_location,
+        "end_location": ride.end_location,
+        "status": ride.status,
+        "requested_at": ride.requested_at.isoformat() if ride.requested_at else None,
+    }
+
+
+# ---------------- Rides ----------------
+def ride_assigned(ride) -> None:
+    """A driver was assigned to `ride`: tell the driver and the rider."""
+    payload = _ride_payload(ride)
+    _send(f"driver:{ride.driver_id}", {"type": "ride_assigned", "ride": payload})
+    _send(f"user:{ride.user_id}", {"type": "ride_updated", "ride": payload}, key=("ride", ride.id))
+
+
+def ride_updated(ride) -> None:
+    payload = _ride_payload(ride)
+    _send(f"user:{ride.user_id}", {"type": "ride_updated", "ride": payload}, key=("ride", ride.id))
+    if ride.driver_id:
+        _send(f"driver:{ride.driver_id}", {"type": "ride_updated", "ride": payload}, key=("ride", ride.id))
+
+
+# ---------------- Queues ----------------
+def queue_expired(driver_id: int, stand_id: int) -> None:
+    """The driver's waiting row was expired for lack of heartbeats; the app should rejoin."""
+    _send(f"driver:{driver_id}", {"type": "queue_expired", "stand_id": stand_id})
+
+
+def queue_changed(stand_id: int) -> None:
+    """
+    Push the current queue order of a stand. Each worker builds the snapshot from its
+    own (bus-synchronised) queue cache, so only the stand id crosses the bus and a
+    burst of joins/pops on one stand collapses into a single event per flush window.
+    Drivers derive their own position from the snapshot.
+    """
+    bus.publish("queue_changed", stand_id, key=stand_id)
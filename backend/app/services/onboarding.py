@@ -0,0 +1,136 @@
+"""
+Bulk onboarding of stands, drivers and users (POST .../bulk and `python -m app.cli onboard`).
+
+A batch is validated as a set instead of row by row:
+
+  1. every row against the create schema
+  2. duplicates inside the batch (driver phone, user email): the first occurrence wins
+  3. one query per key for what already exists (stand ids, phones, emails)
+  4. the passwords of the rows left are hashed in parallel on the password pool
+  5. one multi-row INSERT ... ON CONFLICT DO NOTHING RETURNING; a phone or email
+     registered by someone else between 3 and 5 is missing from RETURNING and is
+     reported like one found in 3
+
+A failing row never aborts the batch: the result lists the created rows (in input
+order) and an error per rejected row, by its index in the input.
+"""
+from typing import Callable, Dict, List, Type
+
+from fastapi import HTTPException, status
+from pydantic import BaseModel, ValidationError
+
+from app.config import settings
+from app.crud import driver_crud, stand_crud, user_crud
+from app.database import DBSession, run_db
+from app.schemas import AutoStandCreate, DriverCreate, UserCreate
+from app.utils.security import hash_passwords_async
+
+
+def check_batch_size(rows: list) -> None:
+    if len(rows) > settings.ONBOARDING_MAX_ROWS:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f"At most {settings.ONBOARDING_MAX_ROWS} rows per request")
+
+
+class _Batch:
+    """Rows of one request still in the running, by input index, and the errors of the rest."""
+
+    def __init__(self, model: Type[BaseModel], rows: List[dict]):
+        self.valid: Dict[int, BaseModel] = {}
+        self.errors: Dict[int, str] = {}
+        for index, row in enumerate(rows):
+            try:
+                self.valid[index] = model.model_validate(row)
+            except ValidationError as exc:
+                error = exc.errors()[0]
+                field = ".".join(str(part) for part in error["loc"])
+                self.errors[index] = f"{field}: {error['msg']}" if field else error["msg"]
+
+    def reject(self, index: int, detail: str) -> None:
+        del self.valid[index]
+        self.errors[index] = detail
+
+    def reject_duplicates(self, key: Callable[[BaseModel], str], detail: str) -> None:
+        seen = set()
+        for index, item in list(self.valid.items()):
+            value = key(item)
+            if value in seen:
+                self.reject(index, detail)
+            seen.add(value)
+
+    def result(self, created: list) -> dict:
+        errors = [{"index": index, "detail": detail} for index, detail in sorted(self.errors.items())]
+        return {"created": created, "errors": errors}
+
+
+def _registered(batch: _Batch, created: list, key: Callable, detail: str) -> list:
+    """Input-ordered created rows; valid rows missing from RETURNING lost a unique-key race."""
+    by_key = {key(row): row for row in created}
+    ordered = []
+    for index, item in list(batch.valid.items()):
+        row = by_key.get(key(item))
+        if row is None:
+            batch.reject(index, detail)
+        else:
+            ordered.append(row)
+    return ordered
+
+
+# ---------------- Stands ----------------
+async def onboard_stands(db: DBSession, rows: List[dict]) -> dict:
+    batch = _Batch(AutoStandCreate, rows)
+    created = await run_db(db, stand_crud.insert_stands, [item.model_dump() for item in batch.valid.values()])
+    return batch.result(created)
+
+
+# ---------------- Drivers ----------------
+def _driver_lookups(db, stand_ids, phones):
+    found = stand_crud.existing_stand_ids(db, stand_ids), driver_crud.existing_phones(db, phones)
+    # ends the read transaction, so no connection sits idle in it while the passwords are hashed
+    db.rollback()
+    return found
+
+
+async def onboard_drivers(db: DBSession, rows: List[dict]) -> dict:
+    batch = _Batch(DriverCreate, rows)
+    batch.reject_duplicates(lambda item: item.phone, "Phone repeated in batch")
+    stand_ids, phones = await run_db(db, _driver_lookups, {item.stand_id for item in batch.valid.values()},
+                                     [item.phone for item in batch.valid.values()])
+    for index, item in list(batch.valid.items()):
+        if item.stand_id not in stand_ids:
+            batch.reject(index, "AutoStand (stand_id) does not exist")
+        elif item.phone in phones:
+            batch.reject(index, "Phone already registered")
+
+    hashes = await hash_passwords_async([item.password for item in batch.valid.values()])
+    inserts = [
+        {"name": item.name, "phone": item.phone, "stand_id": item.stand_id,
+         "is_available": item.is_available, "password": password_hash}
+        for item, password_hash in zip(batch.valid.values(), hashes)
+    ]
+    created = await run_db(db, driver_crud.insert_drivers, inserts)
+    return batch.result(_registered(batch, created, lambda r: r.phone, "Phone already registered"))
+
+
+# ---------------- Users ----------------
+def _user_lookups(db, emails):
+    found = user_crud.existing_emails(db, emails)
+    db.rollback()  # as in _driver_lookups
+    return found
+
+
+async def onboard_users(db: DBSession, rows: List[dict]) -> dict:
+    batch = _Batch(UserCreate, rows)
+    batch.reject_duplicates(lambda item: item.email, "Email repeated in batch")
+    emails = await run_db(db, _user_lookups, [item.email for item in batch.valid.values()])
+    for index, item in list(batch.valid.items()):
+        if item.email in emails:
+            batch.reject(index, "Email already registered")
+
+    hashes = await hash_passwords_async([item.password for item in batch.valid.values()])
+    inserts = [
+        {"name": item.name, "email": item.email, "password": password_hash}
+        for item, password_hash in zip(batch.valid.values(), hashes)
+    ]
+    created = await run_db(db, user_crud.insert_users, inserts)
+    return batch.result(_registered(batch, created, lambda r: r.email, "Email already registered"))
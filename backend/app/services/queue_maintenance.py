@@ -0,0 +1,56 @@
+"""
+Periodic stand_queue housekeeping, run by the scheduler (see services/scheduler.py).
+
+  - expiry: waiting rows of drivers without a heartbeat for QUEUE_HEARTBEAT_TIMEOUT
+    seconds become `expired`, so pops only reach drivers whose app is alive
+  - archive: finished rows (assigned / left / expired) move to stand_queue_history
+    in batches, so stand_queue only holds the live queue plus a short tail
+
+`python -m app.cli queue-maintenance` runs both once, for deployments that prefer cron.
+"""
+import logging
+from datetime import datetime, timedelta
+
+from app.config import settings
+from app.crud import stand_crud
+from app.database import db_session, run_db
+from app.services.scheduler import Scheduler
+from app.utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+EXPIRED = REGISTRY.counter("queue_entries_expired_total", "Waiting queue rows expired for missing heartbeats")
+ARCHIVED = REGISTRY.counter("queue_rows_archived_total", "Finished queue rows moved to stand_queue_history")
+
+# batches per archive run; a larger backlog drains over the following runs
+MAX_ARCHIVE_BATCHES = 20
+
+
+async def expire_stale() -> int:
+    cutoff = datetime.utcnow() - timedelta(seconds=settings.QUEUE_HEARTBEAT_TIMEOUT)
+    async with db_session() as db:
+        expired = await run_db(db, stand_crud.expire_stale_waiting, cutoff)
+    if expired:
+        EXPIRED.inc(expired)
+        logger.info("expired %d stale queue entries", expired)
+    return expired
+
+
+async def archive_history() -> int:
+    older_than = datetime.utcnow() - timedelta(seconds=settings.QUEUE_ARCHIVE_MIN_AGE)
+    total = 0
+    # one short transaction per batch, so the table is never locked for long
+    for _ in range(MAX_ARCHIVE_BATCHES):
+        async with db_session() as db:
+            moved = await run_db(db, stand_crud.archive_finished, older_than, settings.QUEUE_ARCHIVE_BATCH)
+        total += moved
+        ARCHIVED.inc(moved)
+        if moved < settings.QUEUE_ARCHIVE_BATCH:
+            break
+    return total
+
+
+def schedule(scheduler: Scheduler) -> None:
+    if settings.QUEUE_HEARTBEAT_TIMEOUT > 0:
+        scheduler.every(settings.QUEUE_EXPIRY_INTERVAL, "queue_expiry", expire_stale)
+    scheduler.every(settings.QUEUE_ARCHIVE_INTERVAL, "queue_archive", archive_history)
@@ -0,0 +1,139 @@
+"""
+Which stands a new ride may draw its driver from, in order of preference.
+
+ride_crud claims the oldest waiting driver of the first candidate stand that has
+one, in a single statement, so a ride only stays `pending` when none of the
+candidates has anyone waiting.
+
+  - explicit `stand_id`: that stand first, then the stands nearest to the pickup
+    point (or to the requested stand when no pickup point is given)
+  - pickup point only: the nearest stands with waiting drivers
+  - neither: no candidates (the ride is created unassigned)
+
+With ASSIGNMENT_BATCH_WINDOW_MS > 0, `batch_matcher` collects rides for that long
+per candidate-stand list (i.e. per stand or neighbourhood) and assigns each
+group in one transaction instead of one transaction and row lock per ride; see
+BatchMatcher.
+"""
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.crud import ride_crud
+from app.crud.idempotency_crud import IdempotentRequest
+from app.database import db_session, run_db
+from app.schemas import RideCreate
+from app.utils.availability import driver_availability
+from app.utils.metrics import REGISTRY
+from app.utils.queue import stand_queues
+from app.utils.stand_index import stand_index
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = REGISTRY.histogram("ride_batch_size", "Rides assigned per batched transaction",
+                                buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+BATCH_SECONDS = REGISTRY.histogram("ride_batch_seconds", "Duration of one batched assignment transaction")
+
+
+def _has_waiting(stand_id: int) -> bool:
+    # before the queue cache is loaded every stand counts; the DB query skips empty ones anyway.
+    # Waiting drivers who went unavailable do not count (ride_crud's claims pass over them).
+    if not stand_queues.ready:
+        return True
+    unavailable = driver_availability.unavailable()
+    if not unavailable:
+        return stand_queues.size(stand_id) > 0
+    return stand_queues.peek(stand_id, skip=unavailable) is not None
+
+
+def nearest_stands(lat: float, lng: float, limit: Optional[int] = None,
+                   max_radius_m: Optional[float] = None, waiting_only: bool = True):
+    """(distance_m, stand_id) of the nearest stands, optionally only those with waiting drivers."""
+    return stand_index.nearest(
+        lat, lng,
+        k=limit or settings.ASSIGNMENT_MAX_STANDS,
+        max_radius_m=max_radius_m or settings.ASSIGNMENT_MAX_RADIUS_M,
+        predicate=_has_waiting if waiting_only else None,
+    )
+
+
+def candidate_stands(stand_id: Optional[int], pickup_lat: Optional[float], pickup_lng: Optional[float]) -> List[int]:
+    if pickup_lat is None or pickup_lng is None:
+        origin = stand_index.location(stand_id) if stand_id else None
+    else:
+        origin = (pickup_lat, pickup_lng)
+
+    candidates = [stand_id] if stand_id else []
+    if origin is not None:
+        candidates += [sid for _, sid in nearest_stands(*origin, limit=settings.ASSIGNMENT_MAX_STANDS + 1)
+                       if sid != stand_id]
+    return candidates[:settings.ASSIGNMENT_MAX_STANDS]
+
+
+# ---------------- Batched matching ----------------
+class BatchMatcher:
+    """
+    Groups concurrent ride requests that share the same candidate stands and assigns each
+    group in one transaction (ride_crud.create_rides_batch).
+
+    A group is flushed `window` seconds after its first ride arrives, or as soon as it holds
+    `max_batch` rides. Inside a group, rides keep their arrival order and drivers are taken
+    exactly as consecutive single pops would take them, so stand_queue stays FIFO.
+    Runs on the event loop; `submit()` awaits the caller's own result.
+    """
+
+    def __init__(self, window: float, max_batch: int):
+        self.window = window
+        self.max_batch = max_batch
+        self._groups: Dict[Tuple[int, ...], List[Tuple[RideCreate, Optional[IdempotentRequest], asyncio.Future]]] = {}
+
+    async def submit(self, ride: RideCreate, idempotency: Optional[IdempotentRequest] = None):
+        stand_ids = tuple(candidate_stands(ride.stand_id, ride.pickup_lat, ride.pickup_lng))
+        if not stand_ids:
+            # nothing to pop, nothing to contend on
+            async with db_session() as db:
+                return await run_db(db, ride_crud.create_ride, ride, idempotency)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        group = self._groups.get(stand_ids)
+        if group is None:
+            group = self._groups[stand_ids] = []
+            loop.call_later(self.window, self._flush, stand_ids, group)
+        group.append((ride, idempotency, future))
+        if len(group) >= self.max_batch:
+            self._flush(stand_ids, group)
+        return await future
+
+    def _flush(self, stand_ids: Tuple[int, ...], group: list) -> None:
+        # the timer of a group that already left on size must not flush its successor early
+        if self._groups.get(stand_ids) is group:
+            del self._groups[stand_ids]
+            asyncio.ensure_future(self._assign(list(stand_ids), group))
+
+    async def _assign(self, stand_ids: List[int], group: list) -> None:
+        start = asyncio.get_running_loop().time()
+        try:
+            async with db_session() as db:
+                keys = [idempotency for _, idempotency, _ in group]
+                results = await run_db(db, ride_crud.create_rides_batch, [ride for ride, _, _ in group], stand_ids,
+                                       keys if any(keys) else None)
+        except Exception as exc:
+            logger.exception("batched assignment of %d rides failed", len(group))
+            results = [exc] * len(group)
+        BATCH_SIZE.observe(len(group))
+        BATCH_SECONDS.observe(asyncio.get_running_loop().time() - start)
+        for (_, _, future), result in zip(group, results):
+            if future.done():  # caller went away; the ride itself is already stored
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+batch_matcher = BatchMatcher(
+    window=settings.ASSIGNMENT_BATCH_WINDOW_MS / 1000,
+    max_batch=settings.ASSIGNMENT_BATCH_MAX,
+)
@@ -0,0 +1,75 @@
+"""
+In-process asyncio scheduler for periodic maintenance jobs.
+
+Each job is an async callable run every `interval` seconds in its own task; a run
+that fails is logged and counted, and the job simply runs again next time. Runs
+of one job never overlap (the next sleep starts when the run ends). Every worker
+runs the same jobs; jobs that must not run twice at once take a Postgres advisory
+lock (database.try_advisory_xact_lock) and skip the round when another worker has it.
+"""
+import asyncio
+import logging
+from time import perf_counter
+from typing import Awaitable, Callable, Dict, Optional
+
+from app.utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+JOB_RUNS = REGISTRY.counter("scheduler_job_runs_total", "Scheduled job runs by outcome")
+JOB_SECONDS = REGISTRY.histogram("scheduler_job_seconds", "Duration of scheduled job runs")
+
+
+class Job:
+    __slots__ = ("name", "interval", "fn", "task")
+
+    def __init__(self, name: str, interval: float, fn: Callable[[], Awaitable]):
+        self.name = name
+        self.interval = interval
+        self.fn = fn
+        self.task: Optional[asyncio.Task] = None
+
+
+class Scheduler:
+    def __init__(self):
+        self._jobs: Dict[str, Job] = {}
+
+    def every(self, interval: float, name: str, fn: Callable[[], Awaitable]) -> None:
+        """Register `fn` to run every `interval` seconds; a non-positive interval disables it."""
+        if interval > 0:
+            self._jobs[name] = Job(name, interval, fn)
+
+    async def run_once(self, name: str):
+        job = self._jobs[name]
+        start = perf_counter()
+        try:
+            result = await job.fn()
+        except Exception:
+            JOB_RUNS.inc(job=name, outcome="error")
+            logger.exception("scheduled job %s failed", name)
+            return None
+        finally:
+            JOB_SECONDS.observe(perf_counter() - start, job=name)
+        JOB_RUNS.inc(job=name, outcome="ok")
+        return result
+
+    async def _loop(self, job: Job) -> None:
+        while True:
+            await asyncio.sleep(job.interval)
+            await self.run_once(job.name)
+
+    async def start(self) -> None:
+        for job in self._jobs.values():
+            if job.task is None:
+                job.task = asyncio.ensure_future(self._loop(job))
+
+    async def stop(self) -> None:
+        tasks = [job.task for job in self._jobs.values() if job.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for job in self._jobs.values():
+            job.task = None
+
+
+scheduler = Scheduler()
@@ -0,0 +1,230 @@
+"""
+Worker warm-up, started by the FastAPI lifespan and reported by /health/ready.
+
+Importing the app does no I/O (create_engine only configures the pool; schema
+changes go through `python -m app.cli migrate`), so a worker binds its port
+right away and /health/live answers while these steps run in the background:
+
+  1. event_bus:   start cross-worker delivery (Postgres LISTEN) before the caches
+                  are read, so no change published meanwhile is missed
+  2. pool:        open DB_POOL_SIZE connections of the engine requests will use
+  3. caches:      stand queues, stand index, driver locations and availability
+  4. hot_queries: run the hot read paths once with ids that match nothing (and the
+                  claim UPDATEs, rolled back), which fills SQLAlchemy's compiled-statement
+                  cache
+  5. serializers: build the pydantic-core list serializers of the paginated routes
+
+A failing step (DB down or slow) is retried with backoff until it succeeds or the
+worker shuts down; the process stays live, only not ready. Until then the request
+paths fall back to the DB as they do with an empty cache (`stand_queues.ready`);
+queue changes made while the queue cache loads are replayed onto it (utils/queue.py).
+After the event bus reconnects, the caches it feeds (except driver locations) are
+read again the same way, since events sent while it was down are lost.
+"""
+import asyncio
+import logging
+import os
+from time import monotonic, perf_counter
+from typing import Dict, Optional
+
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import async_engine, db_session, engine, run_db
+from app.services.event_bus import bus
+from app.utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# process start as seen by the first import of the app (interpreter startup itself is not included)
+_imported_at = monotonic()
+
+
+class WarmupState:
+    def __init__(self):
+        self.phase = "starting"  # starting -> warming -> ready -> stopping
+        self.steps: Dict[str, float] = {}  # step -> seconds (last successful attempt)
+        self.attempts = 0
+        self.error: Optional[str] = None
+        self.ready_after: Optional[float] = None  # seconds from import to ready
+
+    @property
+    def ready(self) -> bool:
+        return self.phase == "ready"
+
+    def as_dict(self) -> dict:
+        return {"status": self.phase, "steps": {k: round(v, 4) for k, v in self.steps.items()},
+                "attempts": self.attempts, "error": self.error,
+                "ready_after_seconds": None if self.ready_after is None else round(self.ready_after, 4),
+                "pid": os.getpid()}
+
+
+state = WarmupState()
+_task: Optional[asyncio.Task] = None
+
+REGISTRY.gauge("app_ready", "1 once warm-up has finished, 0 while warming or stopping",
+               lambda: {(): 1 if state.ready else 0})
+REGISTRY.gauge("app_warmup_step_seconds", "Duration of each warm-up step",
+               lambda: {(("step", step),): seconds for step, seconds in state.steps.items()})
+REGISTRY.gauge("app_ready_after_seconds", "Seconds from app import to ready",
+               lambda: {} if state.ready_after is None else {(): state.ready_after})
+
+
+# ---------------- Steps ----------------
+async def _start_event_bus() -> None:
+    await bus.start()
+
+
+async def _prewarm_pool() -> int:
+    size = settings.DB_POOL_SIZE
+    if async_engine is not None:
+        if async_engine.dialect.name == "sqlite":
+            return 0
+
+        # all held at once, or the first ones would be handed out again
+        connections = await asyncio.gather(*(async_engine.connect().start() for _ in range(size)))
+        for connection in connections:
+            await connection.close()
+        return size
+    if engine.dialect.name == "sqlite":
+        return 0
+
+    def touch_all():
+        connections = [engine.connect() for _ in range(size)]  # all held at once, as above
+        for connection in connections:
+            connection.close()  # back to the pool, still open
+
+    await asyncio.to_thread(touch_all)
+    return size
+
+
+def _load_caches(db) -> None:
+    from app.crud import driver_crud, stand_crud
+
+    stand_crud.load_queue_cache(db)
+    stand_crud.load_stand_index(db)
+    driver_crud.load_location_cache(db, settings.LOCATION_STALE_SECONDS)
+    driver_crud.load_availability_cache(db)
+
+
+def _reload_caches(db) -> None:
+    from app.crud import driver_crud, stand_crud
+
+    # not the location cache: its rebuild would drop points not flushed yet, and drivers report again anyway
+    stand_crud.load_queue_cache(db)
+    stand_crud.load_stand_index(db)
+    driver_crud.load_availability_cache(db)
+
+
+def _run_hot_queries(db) -> None:
+    from app.crud import driver_crud, ride_crud, stand_crud, user_crud
+
+    # sentinel ids match no row; lookups that raise 404 have still compiled their statement
+    calls = [
+        (driver_crud.get_driver_by_id, 0), (driver_crud.get_driver_by_phone, ""),
+        (user_crud.get_user_by_id, 0), (user_crud.get_user_by_email, ""),
+        (stand_crud.get_stand, 0), (stand_crud.get_queue_position, 0, 0),
+        (ride_crud.get_ride_by_id, 0),
+        (ride_crud.get_active_rides, None, 0), (ride_crud.get_active_rides, 0, None),
+        (stand_crud.get_stands, 1), (driver_crud.get_drivers, 1),
+        (user_crud.get_users, 1), (ride_crud.get_rides, 1),
+    ]
+    for fn, *args in calls:
+        try:
+            fn(db, *args)
+        except HTTPException:
+            pass
+    # the pop claims: cached head by id, DB fallback through the locked subquery
+    stand_crud.warm_pop_claims(db)
+
+
+async def _reload_after_reconnect(max_backoff: float = 30.0) -> None:
+    # events published while the bus was down never arrive: read the caches they feed again
+    backoff = 0.5
+    while True:
+        try:
+            await _in_session(_reload_caches)
+            return
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.warning("cache reload after event bus reconnect failed, retrying in %.1fs: %r", backoff, exc)
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, max_backoff)
+
+
+bus.on_reconnect(_reload_after_reconnect)
+
+
+def _build_serializers() -> None:
+    from app.schemas import DriverResponse, RideResponse, UserResponse
+    from app.utils.serialization import dump_list
+
+    for model in (DriverResponse, RideResponse, UserResponse):
+        dump_list(model, [])
+
+
+async def _in_session(fn) -> None:
+    async with db_session() as db:
+        await run_db(db, fn)
+        if isinstance(db, AsyncSession):
+            await db.rollback()
+
+
+STEPS = (
+    ("event_bus", _start_event_bus),
+    ("pool", _prewarm_pool),
+    ("caches", lambda: _in_session(_load_caches)),
+    ("hot_queries", lambda: _in_session(_run_hot_queries)),
+    ("serializers", lambda: asyncio.to_thread(_build_serializers)),
+)
+
+
+# ---------------- Runner ----------------
+async def warm_up(max_backoff: float = 30.0) -> None:
+    state.phase = "warming"
+    for name, step in STEPS:
+        backoff = 0.5
+        while True:
+            state.attempts += 1
+            start = perf_counter()
+            try:
+                await step()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                state.error = f"{name}: {exc!r}"
+                logger.warning("warm-up step %s failed, retrying in %.1fs: %r", name, backoff, exc)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, max_backoff)
+                continue
+            state.steps[name] = perf_counter() - start
+            break
+    state.error = None
+    state.ready_after = monotonic() - _imported_at
+    state.phase = "ready"
+    logger.info("worker ready %.3fs after import (%s)", state.ready_after,
+                ", ".join(f"{k} {v * 1000:.1f}ms" for k, v in state.steps.items()))
+
+
+def start() -> asyncio.Task:
+    global _task
+    _task = asyncio.ensure_future(warm_up())
+    return _task
+
+
+async def wait_ready() -> None:
+    """Wait for the warm-up started by the lifespan (for scripts running the app in-process)."""
+    if _task is not None:
+        await asyncio.shield(_task)
+
+
+async def stop() -> None:
+    """Mark the worker not ready (load balancers drain it) and cancel a warm-up still running."""
+    global _task
+    state.phase = "stopping"
+    if _task is not None:
+        _task.cancel()
+        await asyncio.gather(_task, return_exceptions=True)
+        _task = None
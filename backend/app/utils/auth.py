@@ -1,4 +1,6 @@
+from dataclasses import dataclass
 from datetime import datetime, timedelta
+from time import perf_counter
 from typing import Optional
 
 from jose import jwt, JWTError
@@ -6,11 +8,14 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 
-from app.database import get_db
+from app.database import db_session, run_db, DBSession
 from app import model
 from app.schemas import TokenData
 from app.config import settings
-from app.utils.security import verify_password
+from app.utils.security import verify_password_async
+from app.utils.cache import TTLCache
+from app.utils.profiling import record_phase
+from app.services.event_bus import bus
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
 
@@ -22,6 +27,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 def decode_access_token(token: str) -> dict:
+    start = perf_counter()
     try:
         payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
         return payload
@@ -31,45 +37,168 @@ def decode_access_token(token: str) -> dict:
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    finally:
+        record_phase("jwt", perf_counter() - start)
 
-# Dependency to get current user (role = "user")
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+# Rate-limit key of a bearer token ("user:7", "driver:3"), None when it does not verify
+# (services/admission.py then keys the request by client IP)
+def token_rate_key(token: str) -> Optional[str]:
+    try:
+        payload = decode_access_token(token)
+    except HTTPException:
+        return None
+    if payload.get("sub") is None or payload.get("role") not in ("user", "driver"):
+        return None
+    return f"{payload['role']}:{payload['sub']}"
+
+# ---------------- Principals ----------------
+# Lightweight snapshots of the authenticated user/driver. They are what the
+# dependencies below return, so they can be cached across requests and sessions
+# (unlike ORM rows). Fields other than `id` are None when built from token claims only.
+@dataclass(frozen=True)
+class UserPrincipal:
+    id: int
+    name: Optional[str] = None
+    email: Optional[str] = None
+
+@dataclass(frozen=True)
+class DriverPrincipal:
+    id: int
+    name: Optional[str] = None
+    phone: Optional[str] = None
+    stand_id: Optional[int] = None
+
+principal_cache = TTLCache(maxsize=settings.AUTH_PRINCIPAL_CACHE_SIZE, ttl=settings.AUTH_PRINCIPAL_CACHE_TTL, name="principals")
+
+def invalidate_principal(role: str, principal_id: int) -> None:
+    """Drop a cached principal here and in the other workers; called by the CRUD layer when the row changes or is deleted."""
+    principal_cache.invalidate((role, int(principal_id)))
+    bus.publish("principal", [role, int(principal_id)])
+
+def _invalidate_remote_principal(key, local: bool) -> None:
+    if not local:
+        principal_cache.invalidate((key[0], key[1]))
+
+bus.subscribe("principal", _invalidate_remote_principal)
+
+def _load_user(db: Session, user_id: int):
+    user = db.query(model.User).filter(model.User.id == user_id).first()
+    return UserPrincipal(id=user.id, name=user.name, email=user.email) if user else None
+
+def _load_driver(db: Session, driver_id: int):
+    driver = db.query(model.Driver).filter(model.Driver.id == driver_id).first()
+    return DriverPrincipal(id=driver.id, name=driver.name, phone=driver.phone, stand_id=driver.stand_id) if driver else None
+
+def _token_subject(token: str, expected_role: str) -> int:
     payload = decode_access_token(token)
     sub = payload.get("sub")
     role = payload.get("role")
-    if sub is None or role != "user":
+    if sub is None or role != expected_role:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid authentication credentials")
-    user = db.query(model.User).filter(model.User.id == int(sub)).first()
+    return int(sub)
+
+def _load_released(db: Session, loader, principal_id: int):
+    # release the connection in the loading thread itself: on a cold cache, a burst of misses
+    # can occupy every threadpool worker waiting on the pool, and a release that needed one
+    # more threadpool hop (session close) would never get to run
+    try:
+        return loader(db, principal_id)
+    finally:
+        db.rollback()
+
+# Only a cache miss opens a (short-lived) session, so authenticated routes that never
+# touch the DB themselves (location pings, WebSockets) do not check out a connection.
+async def _cached_principal(role: str, principal_id: int, loader):
+    key = (role, principal_id)
+    principal = principal_cache.get(key)
+    if principal is None:
+        # an update or delete that invalidates the key while this load runs makes its row stale
+        generation = principal_cache.begin_load(key)
+        try:
+            async with db_session() as db:
+                principal = await run_db(db, _load_released, loader, principal_id)
+        finally:
+            if principal is None:
+                principal_cache.finish_load(key, generation)
+            else:
+                principal_cache.finish_load(key, generation, principal)
+    return principal
+
+# Dependency to get current user (role = "user")
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    user = await _cached_principal("user", _token_subject(token, "user"), _load_user)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
     return user
 
 # Dependency to get current driver (role = "driver")
-def get_current_driver(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    payload = decode_access_token(token)
-    sub = payload.get("sub")
-    role = payload.get("role")
-    if sub is None or role != "driver":
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid authentication credentials")
-    driver = db.query(model.Driver).filter(model.Driver.id == int(sub)).first()
+async def get_current_driver(token: str = Depends(oauth2_scheme)):
+    driver = await _cached_principal("driver", _token_subject(token, "driver"), _load_driver)
     if not driver:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Driver not found")
     return driver
 
+# Principal for a raw token (WebSocket handshakes, where the OAuth2 header dependency does not apply)
+async def principal_from_token(token: str):
+    payload = decode_access_token(token)
+    role = payload.get("role")
+    if payload.get("sub") is None or role not in ("user", "driver"):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid authentication credentials")
+    loader = _load_user if role == "user" else _load_driver
+    principal = await _cached_principal(role, int(payload["sub"]), loader)
+    if not principal:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid authentication credentials")
+    return role, principal
+
+# Admin-only routes (bulk onboarding): a user whose email is listed in ADMIN_EMAILS
+def _admin_emails() -> set:
+    return {email.strip().lower() for email in settings.ADMIN_EMAILS.split(",") if email.strip()}
+
+async def get_current_admin(token: str = Depends(oauth2_scheme)) -> UserPrincipal:
+    user = await get_current_user(token)
+    if not user.email or user.email.lower() not in _admin_emails():
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin only")
+    return user
+
+# Either role, for routes open to riders and drivers alike: ("user" | "driver", principal)
+async def get_current_principal(token: str = Depends(oauth2_scheme)):
+    return await principal_from_token(token)
+
+# Id-only variants: with AUTH_TRUST_TOKEN_CLAIMS the signed claims are enough and no
+# lookup happens at all; otherwise they behave like the full dependencies above.
+async def get_current_user_id(token: str = Depends(oauth2_scheme)) -> UserPrincipal:
+    if settings.AUTH_TRUST_TOKEN_CLAIMS:
+        return UserPrincipal(id=_token_subject(token, "user"))
+    return await get_current_user(token)
+
+async def get_current_driver_id(token: str = Depends(oauth2_scheme)) -> DriverPrincipal:
+    if settings.AUTH_TRUST_TOKEN_CLAIMS:
+        return DriverPrincipal(id=_token_subject(token, "driver"))
+    return await get_current_driver(token)
+
+def _detached(db: Session, row):
+    # end the read transaction so the pooled connection is released while the
+    # (slow, possibly queued) password check runs; the loaded row stays usable
+    if row is not None:
+        db.expunge(row)
+    db.rollback()
+    return row
+
 # Utility to authenticate with email/password for user
-def authenticate_user_by_email(db: Session, email: str, password: str):
-    user = db.query(model.User).filter(model.User.email == email).first()
+# (the argon2 verify runs in the bounded password pool, see utils/security.py)
+async def authenticate_user_by_email(db: DBSession, email: str, password: str):
+    user = await run_db(db, lambda s: _detached(s, s.query(model.User).filter(model.User.email == email).first()))
     if not user:
         return None
-    if not verify_password(password, user.password):
+    if not await verify_password_async(password, user.password):
         return None
     return user
 
 # Utility to authenticate driver by phone/password
-def authenticate_driver_by_phone(db: Session, phone: str, password: str):
-    driver = db.query(model.Driver).filter(model.Driver.phone == phone).first()
+async def authenticate_driver_by_phone(db: DBSession, phone: str, password: str):
+    driver = await run_db(db, lambda s: _detached(s, s.query(model.Driver).filter(model.Driver.phone == phone).first()))
     if not driver:
         return None
-    if not verify_password(password, driver.password):
+    if not await verify_password_async(password, driver.password):
         return None
     return driver
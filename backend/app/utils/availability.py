@@ -0,0 +1,121 @@
+"""
+In-memory driver availability and last-seen store.
+
+Availability toggles and heartbeats only touch this store: the latest value per
+driver is kept as dirty, and the availability service drains it into bulk
+UPDATEs every AVAILABILITY_FLUSH_INTERVAL seconds, so the DB sees at most one
+write per driver per interval however often drivers toggle or ping.
+
+Queue pops and ride assignment read `unavailable()` instead of `drivers.is_available`:
+drivers who went unavailable while waiting keep their place in the queue but are
+passed over. Only those drivers need remembering (joining a queue makes a driver
+available), so the set is pruned down to drivers still waiting.
+
+Like the stand queues this is per process: rebuilt from the DB at startup, with
+other workers' toggles arriving over the event bus (topic "availability").
+"""
+from datetime import datetime
+from threading import Lock
+from typing import Callable, Dict, FrozenSet, Iterable, Optional, Tuple
+
+from app.services.event_bus import bus
+
+
+class AvailabilityStore:
+    def __init__(self):
+        self._unavailable: FrozenSet[int] = frozenset()  # replaced, never mutated: readers need no lock
+        self._dirty_available: Dict[int, bool] = {}
+        self._dirty_seen: Dict[int, datetime] = {}
+        self._lock = Lock()
+
+    # ---------------- Writes ----------------
+    def set(self, driver_id: int, available: bool, dirty: bool = True) -> None:
+        """
+        Record a toggle to flush (`dirty`), or one already persisted elsewhere (a queue join,
+        another worker), which supersedes a toggle still pending here.
+        """
+        with self._lock:
+            if (driver_id in self._unavailable) == available:
+                self._unavailable = (self._unavailable - {driver_id} if available
+                                     else self._unavailable | {driver_id})
+            if dirty:
+                self._dirty_available[driver_id] = available
+            else:
+                self._dirty_available.pop(driver_id, None)
+
+    def touch(self, driver_id: int, seen_at: datetime) -> None:
+        """A heartbeat: the driver's last_seen_at, written at the next flush."""
+        with self._lock:
+            if seen_at > self._dirty_seen.get(driver_id, seen_at.min):
+                self._dirty_seen[driver_id] = seen_at
+
+    def remove(self, driver_id: int) -> None:
+        with self._lock:
+            self._unavailable = self._unavailable - {driver_id}
+            self._dirty_available.pop(driver_id, None)
+            self._dirty_seen.pop(driver_id, None)
+
+    def rebuild(self, unavailable: Iterable[int]) -> None:
+        """Replace the unavailable set (dirty values not yet flushed are kept and re-applied)."""
+        with self._lock:
+            ids = set(unavailable)
+            for driver_id, available in self._dirty_available.items():
+                (ids.discard if available else ids.add)(driver_id)
+            self._unavailable = frozenset(ids)
+
+    def prune(self, waiting: Callable[[int], bool]) -> int:
+        """Forget unavailable drivers no longer waiting in a queue (nothing to pass over)."""
+        with self._lock:
+            stale = {d for d in self._unavailable if not waiting(d) and d not in self._dirty_available}
+            if stale:
+                self._unavailable = self._unavailable - stale
+        return len(stale)
+
+    # ---------------- Flush ----------------
+    def drain_dirty(self) -> Tuple[Dict[int, bool], Dict[int, datetime]]:
+        with self._lock:
+            drained = self._dirty_available, self._dirty_seen
+            self._dirty_available, self._dirty_seen = {}, {}
+            return drained
+
+    def restore_dirty(self, available: Dict[int, bool], seen: Dict[int, datetime]) -> None:
+        """Put back a drained batch whose write failed; newer values recorded meanwhile win."""
+        with self._lock:
+            self._dirty_available = {**available, **self._dirty_available}
+            for driver_id, seen_at in seen.items():
+                if seen_at > self._dirty_seen.get(driver_id, seen_at.min):
+                    self._dirty_seen[driver_id] = seen_at
+
+    # ---------------- Reads ----------------
+    def unavailable(self) -> FrozenSet[int]:
+        """Snapshot of the drivers to pass over (cheap: the set is replaced on change, not copied)."""
+        return self._unavailable
+
+    def pending(self, driver_id: int) -> Optional[bool]:
+        """Availability recorded here but not flushed to the DB yet, if any."""
+        return self._dirty_available.get(driver_id)
+
+    def dirty_count(self) -> int:
+        return len(self._dirty_available) + len(self._dirty_seen)
+
+
+driver_availability = AvailabilityStore()
+
+
+def share(driver_id: int, available: Optional[bool]) -> None:
+    """Tell the other workers about a change (None: the driver was deleted)."""
+    bus.publish("availability", [driver_id, available], key=driver_id)
+
+
+def _apply_remote(event: list, local: bool) -> None:
+    if local:
+        return
+    driver_id, available = event
+    # persisted by the publishing worker
+    if available is None:
+        driver_availability.remove(driver_id)
+    else:
+        driver_availability.set(driver_id, available, dirty=False)
+
+
+bus.subscribe("availability", _apply_remote)
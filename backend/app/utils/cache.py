@@ -0,0 +1,126 @@
+"""
+Thread-safe LRU cache with a per-entry TTL and hit/miss counters.
+
+A value loaded while its key is invalidated is stale before it is stored: loads that
+can overlap a write take a generation with `begin_load` and store with `finish_load`,
+which drops the value if the key was invalidated in between.
+"""
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+_MISSING = object()
+
+
+class TTLCache:
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0, name: str = "cache"):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (expires_at, value)
+        self._lock = Lock()
+        # keys with loads in flight -> [generation, loads]; bumped by every invalidation of the key
+        self._loading: Dict[Hashable, List[int]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = monotonic()
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING or item[0] <= now:
+                if item is not _MISSING:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_set(self, key: Hashable, loader: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        """Return the cached value or call `loader()`; `None` results are not cached."""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            if value is not None:
+                self.set(key, value, ttl)
+        return value
+
+    # ---------------- Guarded loads ----------------
+    def begin_load(self, key: Hashable) -> int:
+        """Start loading `key`; pass the returned generation to `finish_load`."""
+        with self._lock:
+            loading = self._loading.setdefault(key, [0, 0])
+            loading[1] += 1
+            return loading[0]
+
+    def finish_load(self, key: Hashable, generation: int, value: Any = _MISSING,
+                    ttl: Optional[float] = None) -> bool:
+        """
+        End a load started with `begin_load`, storing `value` (if given) only when the key was
+        not invalidated since. Returns whether it was stored.
+        """
+        with self._lock:
+            loading = self._loading[key]
+            loading[1] -= 1
+            if not loading[1]:
+                del self._loading[key]
+            fresh = loading[0] == generation
+        if fresh and value is not _MISSING:
+            self.set(key, value, ttl)
+            return True
+        return False
+
+    def _bump(self, key: Hashable) -> None:
+        loading = self._loading.get(key)
+        if loading is not None:
+            loading[0] += 1
+
+    # ---------------- Invalidation ----------------
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+            self._bump(key)
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        with self._lock:
+            keys = [k for k in self._data if predicate(k)]
+            for k in keys:
+                del self._data[k]
+            for k in self._loading:
+                if predicate(k):
+                    self._bump(k)
+        return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            for k in self._loading:
+                self._bump(k)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,133 @@
+"""
+Great-circle distance and an in-memory uniform grid spatial index.
+
+`SpatialGrid` buckets points into square cells of `cell_metres` (measured along
+a meridian) keyed by integer (row, col). A radius query only scans the cells
+overlapping the query's bounding box and then filters by exact haversine
+distance, so both moving a point and querying a neighbourhood stay cheap no
+matter how many points are indexed:
+
+  - upsert:  O(1) (no bucket change while a point stays inside its cell)
+  - remove:  O(1)
+  - within:  O(cells in the bounding box + points in them)
+
+The grid is not thread-safe; owners wrap it in their own lock.
+"""
+import math
+from typing import Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+EARTH_RADIUS_M = 6371008.8
+METRES_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180
+
+
+def haversine_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance between two WGS84 points in metres."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GridPoint:
+    __slots__ = ("key", "lat", "lng", "value", "cell")
+
+    def __init__(self, key: Hashable, lat: float, lng: float, value, cell: Tuple[int, int]):
+        self.key = key
+        self.lat = lat
+        self.lng = lng
+        self.value = value
+        self.cell = cell
+
+
+class SpatialGrid:
+    def __init__(self, cell_metres: float = 500.0):
+        self.cell_metres = cell_metres
+        self._cell_deg = cell_metres / METRES_PER_DEGREE
+        self._points: Dict[Hashable, GridPoint] = {}
+        self._cells: Dict[Tuple[int, int], Set[Hashable]] = {}
+
+    def __len__(self):
+        return len(self._points)
+
+    def __contains__(self, key: Hashable):
+        return key in self._points
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return int(math.floor(lat / self._cell_deg)), int(math.floor(lng / self._cell_deg))
+
+    def get(self, key: Hashable) -> Optional[GridPoint]:
+        return self._points.get(key)
+
+    def points(self) -> List[GridPoint]:
+        return list(self._points.values())
+
+    def upsert(self, key: Hashable, lat: float, lng: float, value=None) -> None:
+        cell = self._cell(lat, lng)
+        point = self._points.get(key)
+        if point is None:
+            self._points[key] = GridPoint(key, lat, lng, value, cell)
+            self._cells.setdefault(cell, set()).add(key)
+            return
+        if point.cell != cell:
+            self._discard_from_cell(point)
+            self._cells.setdefault(cell, set()).add(key)
+            point.cell = cell
+        point.lat, point.lng, point.value = lat, lng, value
+
+    def remove(self, key: Hashable) -> Optional[GridPoint]:
+        point = self._points.pop(key, None)
+        if point is not None:
+            self._discard_from_cell(point)
+        return point
+
+    def clear(self) -> None:
+        self._points = {}
+        self._cells = {}
+
+    def _discard_from_cell(self, point: GridPoint) -> None:
+        bucket = self._cells.get(point.cell)
+        if bucket is not None:
+            bucket.discard(point.key)
+            if not bucket:
+                del self._cells[point.cell]
+
+    def within(self, lat: float, lng: float, radius_m: float,
+               predicate: Optional[Callable[[GridPoint], bool]] = None) -> List[Tuple[float, GridPoint]]:
+        """(distance, point) pairs within `radius_m` of (lat, lng), nearest first."""
+        if not self._points:
+            return []
+        dlat = radius_m / METRES_PER_DEGREE
+        # longitude degrees shrink with cos(lat); clamp near the poles
+        dlng = min(dlat / max(math.cos(math.radians(lat)), 1e-6), 180.0)
+        row_lo, col_lo = self._cell(lat - dlat, lng - dlng)
+        row_hi, col_hi = self._cell(lat + dlat, lng + dlng)
+
+        found: List[Tuple[float, GridPoint]] = []
+        cells = self._cells
+        if (row_hi - row_lo + 1) * (col_hi - col_lo + 1) > len(cells):
+            # huge radius over a sparse grid: walking the occupied cells is cheaper
+            candidates = (c for c in cells if row_lo <= c[0] <= row_hi and col_lo <= c[1] <= col_hi)
+        else:
+            candidates = ((r, c) for r in range(row_lo, row_hi + 1) for c in range(col_lo, col_hi + 1))
+        for cell in candidates:
+            for key in cells.get(cell, ()):
+                point = self._points[key]
+                if predicate is not None and not predicate(point):
+                    continue
+                distance = haversine_m(lat, lng, point.lat, point.lng)
+                if distance <= radius_m:
+                    found.append((distance, point))
+        found.sort(key=lambda item: item[0])
+        return found
+
+    def nearest(self, lat: float, lng: float, k: int = 1, max_radius_m: float = 50000.0,
+                predicate: Optional[Callable[[GridPoint], bool]] = None) -> List[Tuple[float, GridPoint]]:
+        """Up to `k` nearest points within `max_radius_m`, by widening the search radius."""
+        radius = self.cell_metres
+        while True:
+            radius = min(radius, max_radius_m)
+            found = self.within(lat, lng, radius, predicate)
+            if len(found) >= k or radius >= max_radius_m:
+                return found[:k]
+            radius *= 2
@@ -0,0 +1,123 @@
+"""
+In-process admission primitives: per-client token buckets and a priority load shedder.
+
+Both are per worker, like the caches: N workers admit N times the configured
+rates and concurrency. services/admission.py decides what a request costs.
+"""
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import Dict, Hashable, Optional
+
+from app.config import settings
+
+# request priorities, most important first
+CRITICAL = "critical"  # ride booking, queue pops and joins: never shed
+NORMAL = "normal"
+LOW = "low"  # reads: shed first
+PRIORITIES = (CRITICAL, NORMAL, LOW)
+
+
+class RateLimiter:
+    """
+    Token buckets per key, in a bounded LRU: a bucket holds up to `burst` tokens and refills
+    at `rate` tokens per second; a request takes one. An evicted bucket comes back full,
+    which is what an idle client's bucket would be anyway.
+    """
+
+    def __init__(self, maxsize: int = 100000, name: str = "rate_limiter"):
+        self.maxsize = maxsize
+        self.name = name
+        self._buckets: "OrderedDict[Hashable, list]" = OrderedDict()  # key -> [tokens, updated_at]
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def take(self, key: Hashable, rate: float, burst: float) -> float:
+        """Take a token for `key`: 0 if there was one, else the seconds until there will be."""
+        now = monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [burst, now]
+                if len(self._buckets) > self.maxsize:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0.0
+            return (1 - bucket[0]) / rate if rate > 0 else float("inf")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+class LoadShedder:
+    """
+    Concurrency limits by priority, driven by how long requests wait for a DB connection.
+
+      - critical requests are always admitted
+      - normal and low ones only while fewer than `max_in_flight` requests run (0 = no cap)
+      - while the smoothed pool wait is at least `shed_wait` seconds, low ones only while
+        fewer than `low_in_flight` low requests run
+
+    The pool wait is an exponential average of checkout waits (database.py reports every
+    checkout) that also halves every `half_life` seconds without checkouts, so shedding
+    stops once the pool recovers even if the shed reads were the ones checking out.
+    Admission runs on the event loop; only `observe_wait` is called from other threads.
+    """
+
+    def __init__(self, max_in_flight: int, low_in_flight: int, shed_wait: float,
+                 half_life: float = 1.0, alpha: float = 0.2):
+        self.max_in_flight = max_in_flight
+        self.low_in_flight = low_in_flight
+        self.shed_wait = shed_wait
+        self.half_life = half_life
+        self.alpha = alpha
+        self.in_flight: Dict[str, int] = {priority: 0 for priority in PRIORITIES}
+        self._wait = 0.0
+        self._wait_at = monotonic()
+        self._lock = Lock()
+
+    # ---------------- Pool wait ----------------
+    def _decayed(self, now: float) -> float:
+        return self._wait * 0.5 ** ((now - self._wait_at) / self.half_life)
+
+    def observe_wait(self, seconds: float) -> None:
+        now = monotonic()
+        with self._lock:
+            wait = self._decayed(now)
+            self._wait = wait + self.alpha * (seconds - wait)
+            self._wait_at = now
+
+    def pool_wait(self) -> float:
+        with self._lock:
+            return self._decayed(monotonic())
+
+    # ---------------- Admission ----------------
+    def acquire(self, priority: str) -> Optional[str]:
+        """Admit a request (call `release` when it ends), or return why it is shed."""
+        if priority != CRITICAL:
+            if self.max_in_flight and sum(self.in_flight.values()) >= self.max_in_flight:
+                return "in_flight"
+            if (priority == LOW and self.in_flight[LOW] >= self.low_in_flight
+                    and self.pool_wait() >= self.shed_wait):
+                return "pool_wait"
+        self.in_flight[priority] += 1
+        return None
+
+    def release(self, priority: str) -> None:
+        self.in_flight[priority] -= 1
+
+
+rate_limiter = RateLimiter(maxsize=settings.RATE_LIMIT_MAX_CLIENTS, name="rate_limits")
+load_shedder = LoadShedder(
+    max_in_flight=settings.ADMISSION_MAX_IN_FLIGHT,
+    low_in_flight=settings.ADMISSION_LOW_PRIORITY_IN_FLIGHT,
+    shed_wait=settings.ADMISSION_SHED_POOL_WAIT_MS / 1000,
+)
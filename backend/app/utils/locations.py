@@ -0,0 +1,116 @@
+"""
+In-memory store of the latest known position of every driver.
+
+GPS pings only touch this store: the newest point per driver is kept in a
+`SpatialGrid` (utils/geo.py) and the driver is marked dirty. The location
+service drains the dirty set into one bulk UPDATE every LOCATION_FLUSH_INTERVAL
+seconds, so the DB sees at most one write per driver per interval however
+often drivers report. Points older than what is already stored (out-of-order or
+replayed pings) are ignored.
+
+Like the stand queues this is per process: rebuilt from `drivers` at startup,
+with other workers' points arriving over the event bus.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.config import settings
+from app.utils.geo import SpatialGrid
+
+
+@dataclass(frozen=True)
+class DriverLocation:
+    driver_id: int
+    lat: float
+    lng: float
+    recorded_at: datetime  # naive UTC
+
+
+class LocationStore:
+    def __init__(self, cell_metres: float = 500.0, stale_seconds: float = 120.0):
+        self.stale_seconds = stale_seconds
+        self._grid = SpatialGrid(cell_metres)
+        self._dirty: Dict[int, DriverLocation] = {}
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._grid)
+
+    # ---------------- Writes ----------------
+    def update(self, location: DriverLocation, dirty: bool = True) -> bool:
+        """Store `location` unless a newer point is already known. Returns whether it was stored."""
+        with self._lock:
+            return self._update(location, dirty)
+
+    def update_many(self, locations: Iterable[DriverLocation], dirty: bool = True) -> int:
+        with self._lock:
+            return sum(self._update(loc, dirty) for loc in locations)
+
+    def _update(self, location: DriverLocation, dirty: bool) -> bool:
+        current = self._grid.get(location.driver_id)
+        if current is not None and current.value.recorded_at >= location.recorded_at:
+            return False
+        self._grid.upsert(location.driver_id, location.lat, location.lng, location)
+        if dirty:
+            self._dirty[location.driver_id] = location
+        return True
+
+    def remove(self, driver_id: int) -> None:
+        with self._lock:
+            self._grid.remove(driver_id)
+            self._dirty.pop(driver_id, None)
+
+    def rebuild(self, locations: Iterable[DriverLocation]) -> None:
+        with self._lock:
+            self._grid.clear()
+            self._dirty = {}
+            for loc in locations:
+                self._update(loc, dirty=False)
+
+    def prune(self) -> int:
+        """Forget drivers that stopped reporting (already flushed, older than stale_seconds)."""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.stale_seconds)
+        with self._lock:
+            stale = [p.key for p in self._grid.points()
+                     if p.value.recorded_at < cutoff and p.key not in self._dirty]
+            for key in stale:
+                self._grid.remove(key)
+        return len(stale)
+
+    # ---------------- Flushing ----------------
+    def drain_dirty(self) -> List[DriverLocation]:
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        return list(dirty.values())
+
+    def restore_dirty(self, locations: Iterable[DriverLocation]) -> None:
+        """Put back points whose flush failed, unless a newer point is already pending."""
+        with self._lock:
+            for loc in locations:
+                if loc.driver_id not in self._dirty and loc.driver_id in self._grid:
+                    self._dirty[loc.driver_id] = loc
+
+    def dirty_count(self) -> int:
+        return len(self._dirty)
+
+    # ---------------- Reads ----------------
+    def get(self, driver_id: int) -> Optional[DriverLocation]:
+        with self._lock:
+            point = self._grid.get(driver_id)
+            return None if point is None else point.value
+
+    def within(self, lat: float, lng: float, radius_m: float,
+               limit: Optional[int] = None) -> List[Tuple[float, DriverLocation]]:
+        """(distance, location) of fresh drivers within `radius_m`, nearest first."""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.stale_seconds)
+        with self._lock:
+            found = self._grid.within(lat, lng, radius_m, lambda p: p.value.recorded_at >= cutoff)
+        return [(distance, point.value) for distance, point in found[:limit]]
+
+
+driver_locations = LocationStore(
+    cell_metres=settings.LOCATION_GRID_CELL_METRES,
+    stale_seconds=settings.LOCATION_STALE_SECONDS,
+)
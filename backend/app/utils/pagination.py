@@ -0,0 +1,78 @@
+"""
+Keyset (cursor) pagination for the list endpoints.
+
+A page is `WHERE (sort key) > (last key of the previous page) ORDER BY sort key
+LIMIT n + 1`: an index range scan that costs the same on page 1000 as on page 1,
+unlike OFFSET which reads and discards every skipped row. The extra row only
+tells whether another page exists.
+
+The cursor handed to clients is the last row's sort key as JSON in urlsafe
+base64. It is opaque to them: list routes keep returning a plain JSON list and
+put the next cursor in the `X-Next-Cursor` response header (absent on the last
+page); clients pass it back as `?cursor=` together with the same filters.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Callable, List, NamedTuple, Optional, Sequence
+
+from fastapi import HTTPException, Response, status
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Query
+
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class Page(NamedTuple):
+    items: list
+    next_cursor: Optional[str]
+
+
+def encode_cursor(values: Sequence) -> str:
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, types: Sequence[Callable]) -> tuple:
+    """Inverse of encode_cursor; `types` converts each key part (e.g. int, datetime.fromisoformat)."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(types):
+            raise ValueError
+        return tuple(convert(v) for convert, v in zip(types, values))
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def paginate(query: Query, columns: List, types: Sequence[Callable], limit: int,
+             cursor: Optional[str] = None, descending: bool = False, skip: int = 0) -> Page:
+    """
+    Keyset page of `query` ordered by `columns` (the last one must be unique, e.g. the id).
+    `skip` is the deprecated OFFSET paging, honoured only without a cursor.
+    """
+    if cursor:
+        key = decode_cursor(cursor, types)
+        if len(columns) == 1:
+            after = columns[0] < key[0] if descending else columns[0] > key[0]
+        else:
+            after = tuple_(*columns) < tuple_(*key) if descending else tuple_(*columns) > tuple_(*key)
+        query = query.filter(after)
+    order = [c.desc() for c in columns] if descending else [c.asc() for c in columns]
+    query = query.order_by(*order)
+    if skip and not cursor:
+        query = query.offset(skip)
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return Page(rows, None)
+    last = rows[limit - 1]
+    return Page(rows[:limit], encode_cursor([getattr(last, c.key) for c in columns]))
+
+
+def set_next_cursor(response: Response, page: Page) -> list:
+    """Expose the page's cursor on the response and return its items."""
+    if page.next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = page.next_cursor
+    return page.items
@@ -0,0 +1,186 @@
+"""
+Always-on request profiling, exported through the metrics registry.
+
+ProfilingMiddleware (pure ASGI, so streaming responses pass through untouched)
+gives each HTTP request a RequestProfile in a ContextVar. The context is copied
+into threadpool calls and AsyncSession.run_sync greenlets, so the engine's
+cursor events (instrument_engine) find the profile of the request that issued
+the statement. When the request finishes, it records:
+
+  - http_request_duration_seconds{method,route,status}: route is the path template
+  - http_request_db_queries / http_request_db_seconds{route}: SQL statements per request
+  - http_request_phase_seconds{route,phase}: time in jwt / password / serialize
+  - db_n_plus_one_total{route}: requests that ran one statement at least
+    PROFILING_N_PLUS_ONE_THRESHOLD times (logged once per route and statement)
+
+Per statement the hooks only update the request's profile; the histograms are
+observed once, when the request ends. StackSampler is the opt-in part: a thread that samples
+every thread's stack for a while (GET /metrics/profile) and returns folded stacks
+for flamegraph.pl or speedscope.
+"""
+import logging
+import sys
+import threading
+from collections import Counter as Tally
+from contextvars import ContextVar
+from time import perf_counter, sleep
+from typing import Dict, Optional
+
+from sqlalchemy import event
+
+from app.config import settings
+from app.utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+UNMATCHED_ROUTE = "unmatched"
+
+REQUEST_SECONDS = REGISTRY.histogram("http_request_duration_seconds", "HTTP request latency by route template")
+REQUEST_QUERIES = REGISTRY.histogram("http_request_db_queries", "SQL statements executed per HTTP request",
+                                     buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 1000))
+REQUEST_DB_SECONDS = REGISTRY.histogram("http_request_db_seconds", "Time per HTTP request spent in SQL statements")
+PHASE_SECONDS = REGISTRY.histogram("http_request_phase_seconds", "Time per HTTP request spent in a phase "
+                                   "(jwt, password, serialize)")
+N_PLUS_ONE = REGISTRY.counter("db_n_plus_one_total", "Requests that repeated one SQL statement at least "
+                              "PROFILING_N_PLUS_ONE_THRESHOLD times")
+
+
+class RequestProfile:
+    __slots__ = ("queries", "query_seconds", "statements", "phases")
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.statements: Dict[str, int] = {}  # SQL text -> executions
+        self.phases: Dict[str, float] = {}
+
+
+_current: ContextVar[Optional[RequestProfile]] = ContextVar("request_profile", default=None)
+
+
+def current_profile() -> Optional[RequestProfile]:
+    return _current.get()
+
+
+def record_phase(phase: str, seconds: float) -> None:
+    """Add `seconds` to `phase` of the current request (no-op outside a request)."""
+    profile = _current.get()
+    if profile is not None:
+        profile.phases[phase] = profile.phases.get(phase, 0.0) + seconds
+
+
+# ---------------- SQL statements ----------------
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._profiling_start = perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # statements outside a request (background jobs) are left to their own job metrics
+    profile = _current.get()
+    if profile is not None:
+        profile.queries += 1
+        profile.query_seconds += perf_counter() - context._profiling_start
+        # statements are parameterised, so a loop of per-row lookups repeats the same text
+        profile.statements[statement] = profile.statements.get(statement, 0) + 1
+
+
+def instrument_engine(target_engine) -> None:
+    """Time every statement on `target_engine` (a sync Engine; pass AsyncEngine.sync_engine)."""
+    event.listen(target_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(target_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# ---------------- Middleware ----------------
+_reported_n_plus_one = set()
+
+
+def _route_of(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or UNMATCHED_ROUTE
+
+
+def _finish(scope, profile: RequestProfile, status_code: int, elapsed: float) -> None:
+    route = _route_of(scope)
+    REQUEST_SECONDS.observe(elapsed, method=scope["method"], route=route, status=status_code)
+    REQUEST_QUERIES.observe(profile.queries, route=route)
+    REQUEST_DB_SECONDS.observe(profile.query_seconds, route=route)
+    for phase, seconds in profile.phases.items():
+        PHASE_SECONDS.observe(seconds, route=route, phase=phase)
+    if not profile.statements:
+        return
+    statement, count = max(profile.statements.items(), key=lambda item: item[1])
+    if count >= settings.PROFILING_N_PLUS_ONE_THRESHOLD:
+        N_PLUS_ONE.inc(route=route)
+        if (route, statement) not in _reported_n_plus_one:
+            _reported_n_plus_one.add((route, statement))
+            logger.warning("possible N+1 on %s %s: %d executions of %s",
+                           scope["method"], route, count, " ".join(statement.split())[:300])
+
+
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        profile = RequestProfile()
+        token = _current.set(profile)
+        status_code = 500
+        start = perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _current.reset(token)
+            _finish(scope, profile, status_code, perf_counter() - start)
+
+
+# ---------------- Stack sampler ----------------
+class StackSampler:
+    """Samples the stacks of all other threads every `interval` seconds into folded-stack counts."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.running = False
+
+    def _frames(self, frame) -> str:
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def sample(self, seconds: float, interval: float) -> Tally:
+        """Block for `seconds` sampling; run it in a thread. Raises RuntimeError if a run is in progress."""
+        with self._lock:
+            if self.running:
+                raise RuntimeError("a profile is already being taken")
+            self.running = True
+        stacks = Tally()
+        me = threading.get_ident()
+        try:
+            deadline = perf_counter() + seconds
+            while perf_counter() < deadline:
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id != me:
+                        stacks[self._frames(frame)] += 1
+                sleep(interval)
+        finally:
+            self.running = False
+        return stacks
+
+
+sampler = StackSampler()
+
+
+def folded(stacks: Tally) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
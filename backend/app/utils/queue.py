@@ -0,0 +1,309 @@
+"""
+In-memory per-stand FIFO queue engine.
+
+The `stand_queue` table stays the source of truth; stand_crud writes through to it
+and then mirrors the change here, so queue reads and position lookups never hit
+the DB. Each stand keeps an append-only slot list in join order plus a Fenwick
+tree counting removed slots, which gives:
+
+  - join:      O(log n); O(n) for a join that arrives after a later one
+  - pop head:  O(1) amortised (head slots are consumed, the tree is not touched)
+  - remove:    O(log n)
+  - position:  O(log n)
+
+The cache is per process: it is rebuilt from `waiting` rows at startup, and
+writes made by other workers arrive over the event bus (see stand_crud). Changes
+applied while a rebuild reads the table are journaled and replayed onto the
+rebuilt queues, and reads go to the DB (`ready` is False) until it is done.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from threading import Lock
+from typing import AbstractSet, Dict, Iterable, List, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class QueueEntry:
+    id: int
+    stand_id: int
+    driver_id: int
+    joined_at: datetime
+    status: str = "waiting"
+
+
+# ---------------- Fenwick tree ----------------
+class _Fenwick:
+    """Growable binary indexed tree (1-based internally)."""
+
+    def __init__(self):
+        self._tree = [0]
+
+    def __len__(self):
+        return len(self._tree) - 1
+
+    def prefix(self, i: int) -> int:
+        # sum of values at positions [0, i)
+        total = 0
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def append(self, value: int = 0) -> None:
+        i = len(self._tree)
+        # node i covers (i - lowbit(i), i]; fill it from the existing prefix sums
+        self._tree.append(self.prefix(i - 1) - self.prefix(i - (i & -i)) + value)
+
+    def add(self, pos: int, delta: int) -> None:
+        i = pos + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+
+# ---------------- Single stand ----------------
+def _order(entry: QueueEntry):
+    # FIFO order, as the DB pops: oldest join first, row id breaking ties
+    return entry.joined_at, entry.id
+
+
+class _StandQueue:
+    # compact once this many consumed/removed slots sit in front of the head
+    COMPACT_THRESHOLD = 1024
+
+    def __init__(self):
+        self._slots: List[Optional[QueueEntry]] = []
+        self._removed = _Fenwick()
+        self._head = 0
+        self._slot_of: Dict[int, int] = {}  # driver_id -> slot index
+
+    def __len__(self):
+        return len(self._slot_of)
+
+    def __contains__(self, driver_id: int):
+        return driver_id in self._slot_of
+
+    def get(self, driver_id: int) -> Optional[QueueEntry]:
+        slot = self._slot_of.get(driver_id)
+        return None if slot is None else self._slots[slot]
+
+    def push(self, entry: QueueEntry) -> None:
+        """Add the entry in join order: at the back, unless a later join is already queued."""
+        if self._slots and _order(entry) < self._last:
+            # a join that reached this worker after a later one (event bus batches from
+            # several workers interleave): lay the queue out again, O(n) but rare
+            self._relayout(self.entries() + [entry])
+        else:
+            self._append(entry)
+
+    def _append(self, entry: QueueEntry) -> None:
+        self._slot_of[entry.driver_id] = len(self._slots)
+        self._slots.append(entry)
+        self._removed.append(0)
+        self._last = _order(entry)
+
+    def peek(self, skip: AbstractSet[int] = frozenset()) -> Optional[QueueEntry]:
+        """Oldest entry whose driver is not in `skip` (O(1) unless heads are skipped)."""
+        self._skip_removed()
+        for i in range(self._head, len(self._slots)):
+            entry = self._slots[i]
+            if entry is not None and entry.driver_id not in skip:
+                return entry
+        return None
+
+    def pop(self) -> Optional[QueueEntry]:
+        entry = self.peek()
+        if entry is None:
+            return None
+        del self._slot_of[entry.driver_id]
+        self._slots[self._head] = None
+        self._head += 1
+        self._maybe_compact()
+        return entry
+
+    def remove(self, driver_id: int) -> Optional[QueueEntry]:
+        slot = self._slot_of.pop(driver_id, None)
+        if slot is None:
+            return None
+        entry = self._slots[slot]
+        if slot == self._head:
+            self._slots[slot] = None
+            self._head += 1
+        else:
+            self._slots[slot] = None
+            self._removed.add(slot, 1)
+        self._maybe_compact()
+        return entry
+
+    def position(self, driver_id: int) -> Optional[int]:
+        """1-based rank of the driver in the queue, or None if not waiting."""
+        slot = self._slot_of.get(driver_id)
+        if slot is None:
+            return None
+        removed_before = self._removed.prefix(slot) - self._removed.prefix(self._head)
+        return slot - self._head - removed_before + 1
+
+    def entries(self) -> List[QueueEntry]:
+        return [e for e in self._slots[self._head:] if e is not None]
+
+    def _skip_removed(self) -> None:
+        while self._head < len(self._slots) and self._slots[self._head] is None:
+            self._head += 1
+
+    def _maybe_compact(self) -> None:
+        if self._head < self.COMPACT_THRESHOLD or self._head * 2 < len(self._slots):
+            return
+        self._relayout(self.entries())
+
+    def _relayout(self, live: List[QueueEntry]) -> None:
+        self._slots = []
+        self._removed = _Fenwick()
+        self._head = 0
+        self._slot_of = {}
+        for entry in sorted(live, key=_order):
+            self._append(entry)
+
+
+# ---------------- Engine ----------------
+class StandQueueEngine:
+    """Thread-safe registry of per-stand queues, plus a driver -> stand index."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._stands: Dict[int, _StandQueue] = {}
+        self._stand_of: Dict[int, int] = {}  # driver_id -> stand_id
+        self.ready = False
+        # changes made while rebuilds are running: ("push", entry) / ("remove", driver_id, joined_before)
+        self._journal: Optional[List[Tuple]] = None
+        self._rebuilding = 0
+
+    # ---------------- Rebuild ----------------
+    def begin_rebuild(self) -> int:
+        """
+        Call before reading the `waiting` rows for `rebuild`, and pass it what this returns:
+        every change from now on is replayed onto the rebuilt queues, so a join or pop that
+        commits while the rows are read is not lost. Until the rebuild ends the cache is not
+        `ready` and the request paths read the DB.
+        """
+        with self._lock:
+            self.ready = False
+            if self._journal is None:
+                self._journal = []
+            self._rebuilding += 1
+            return len(self._journal)
+
+    def rebuild(self, entries: Iterable[QueueEntry], since: Optional[int] = None) -> None:
+        """Replace the whole cache with `waiting` rows (any order), then replay changes journaled since `since`."""
+        stands: Dict[int, _StandQueue] = {}
+        stand_of: Dict[int, int] = {}
+        for entry in sorted(entries, key=_order):
+            if entry.driver_id in stand_of:
+                continue
+            stands.setdefault(entry.stand_id, _StandQueue()).push(entry)
+            stand_of[entry.driver_id] = entry.stand_id
+        with self._lock:
+            self._stands = stands
+            self._stand_of = stand_of
+            if since is not None:
+                for op, *args in self._journal[since:]:
+                    if op == "push":
+                        self._push(*args)
+                    else:
+                        self._remove(*args)
+                self._end_rebuild()
+            if not self._rebuilding:
+                self.ready = True
+
+    def abort_rebuild(self) -> None:
+        """End a rebuild whose rows could not be read; the cache stays not `ready`."""
+        with self._lock:
+            self._end_rebuild()
+
+    def _end_rebuild(self) -> None:
+        self._rebuilding -= 1
+        if not self._rebuilding:
+            self._journal = None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._stands = {}
+            self._stand_of = {}
+            self.ready = False
+
+    # ---------------- Changes ----------------
+    def push(self, entry: QueueEntry) -> None:
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append(("push", entry))
+            self._push(entry)
+
+    def _push(self, entry: QueueEntry) -> None:
+        stand_id = self._stand_of.get(entry.driver_id)
+        if stand_id is not None:
+            cached = self._stands[stand_id].get(entry.driver_id)
+            # row ids grow: an older (or the same) row never displaces the cached one, while a
+            # newer one means the driver rejoined before the old row's removal got here
+            if cached.id >= entry.id:
+                return
+            self._stands[stand_id].remove(entry.driver_id)
+        self._stands.setdefault(entry.stand_id, _StandQueue()).push(entry)
+        self._stand_of[entry.driver_id] = entry.stand_id
+
+    def peek(self, stand_id: int, skip: AbstractSet[int] = frozenset()) -> Optional[QueueEntry]:
+        with self._lock:
+            queue = self._stands.get(stand_id)
+            return queue.peek(skip) if queue else None
+
+    def pop(self, stand_id: int) -> Optional[QueueEntry]:
+        with self._lock:
+            queue = self._stands.get(stand_id)
+            entry = queue.pop() if queue else None
+            if entry:
+                del self._stand_of[entry.driver_id]
+                if self._journal is not None:
+                    self._journal.append(("remove", entry.driver_id, entry.joined_at))
+            return entry
+
+    def remove(self, driver_id: int, joined_before: Optional[datetime] = None) -> Optional[QueueEntry]:
+        """
+        Drop the driver's entry. With `joined_before`, only an entry that joined at or before
+        it: the removal of a popped row must not take out the row of a driver who has
+        already rejoined.
+        """
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append(("remove", driver_id, joined_before))
+            return self._remove(driver_id, joined_before)
+
+    def _remove(self, driver_id: int, joined_before: Optional[datetime]) -> Optional[QueueEntry]:
+        stand_id = self._stand_of.get(driver_id)
+        if stand_id is None:
+            return None
+        queue = self._stands[stand_id]
+        if joined_before is not None and queue.get(driver_id).joined_at > joined_before:
+            return None
+        del self._stand_of[driver_id]
+        return queue.remove(driver_id)
+
+    def get(self, driver_id: int) -> Optional[QueueEntry]:
+        with self._lock:
+            stand_id = self._stand_of.get(driver_id)
+            return None if stand_id is None else self._stands[stand_id].get(driver_id)
+
+    def position(self, stand_id: int, driver_id: int) -> Optional[int]:
+        with self._lock:
+            queue = self._stands.get(stand_id)
+            return queue.position(driver_id) if queue else None
+
+    def entries(self, stand_id: int) -> List[QueueEntry]:
+        with self._lock:
+            queue = self._stands.get(stand_id)
+            return queue.entries() if queue else []
+
+    def size(self, stand_id: int) -> int:
+        with self._lock:
+            queue = self._stands.get(stand_id)
+            return len(queue) if queue else 0
+
+
+stand_queues = StandQueueEngine()
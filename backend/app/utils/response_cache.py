@@ -0,0 +1,126 @@
+"""
+Read-through cache of rendered JSON responses for read-mostly resources (stands, driver profiles).
+
+Entries hold the serialized body and its ETag, so a hit skips the query and the
+serialization. Every response carries the ETag with `Cache-Control: no-cache`:
+clients revalidate with If-None-Match and get an empty 304 while the resource is
+unchanged. The CRUD layer invalidates entries after its commit (here and, over the
+event bus, in the other workers), and a render that was running when its entry was
+invalidated is served but not stored; the TTL only bounds staleness for writes made
+outside the app.
+"""
+import json
+from hashlib import blake2b
+from time import perf_counter
+from typing import Awaitable, Callable, Dict, Hashable, NamedTuple, Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+from app.config import settings
+from app.services.event_bus import bus
+from app.utils.cache import TTLCache
+from app.utils.metrics import REGISTRY
+from app.utils.profiling import record_phase
+
+CACHE_CONTROL = "no-cache"
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    etag: str
+    headers: Tuple[Tuple[str, str], ...] = ()
+
+
+stand_responses = TTLCache(maxsize=settings.RESPONSE_CACHE_STAND_SIZE, ttl=settings.RESPONSE_CACHE_STAND_TTL,
+                           name="stand_responses")
+driver_responses = TTLCache(maxsize=settings.RESPONSE_CACHE_DRIVER_SIZE, ttl=settings.RESPONSE_CACHE_DRIVER_TTL,
+                            name="driver_responses")
+CACHES = (stand_responses, driver_responses)
+
+
+def _cache_gauge(field: str):
+    return lambda: {(("cache", cache.name),): cache.stats()[field] for cache in CACHES}
+
+
+REGISTRY.gauge("response_cache_hits", "Response cache hits since start", _cache_gauge("hits"))
+REGISTRY.gauge("response_cache_misses", "Response cache misses since start", _cache_gauge("misses"))
+REGISTRY.gauge("response_cache_hit_ratio", "Response cache hits / lookups since start", _cache_gauge("hit_ratio"))
+REGISTRY.gauge("response_cache_entries", "Responses currently cached", _cache_gauge("size"))
+
+
+def render(content, headers: Optional[Dict[str, str]] = None) -> CachedResponse:
+    start = perf_counter()
+    body = json.dumps(jsonable_encoder(content), separators=(",", ":"), ensure_ascii=False).encode()
+    etag = '"' + blake2b(body, digest_size=12).hexdigest() + '"'
+    record_phase("serialize", perf_counter() - start)
+    return CachedResponse(body, etag, tuple((headers or {}).items()))
+
+
+def _not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [tag.strip() for tag in header.split(",")]
+    # weak comparison, as RFC 9110 prescribes for If-None-Match
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def respond(request: Request, entry: CachedResponse) -> Response:
+    headers = {"ETag": entry.etag, "Cache-Control": CACHE_CONTROL, **dict(entry.headers)}
+    if _not_modified(request, entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(entry.body, media_type="application/json", headers=headers)
+
+
+async def cached_response(request: Request, cache: TTLCache, key: Hashable,
+                          loader: Callable[[], Awaitable[CachedResponse]]) -> Response:
+    """Serve `key` from `cache`, rendering it with `loader()` on a miss (errors raised by the loader are not cached)."""
+    entry = cache.get(key)
+    if entry is None:
+        # a write that commits (and invalidates the key) while the loader runs makes this render stale
+        generation = cache.begin_load(key)
+        try:
+            entry = await loader()
+        except BaseException:
+            cache.finish_load(key, generation)
+            raise
+        cache.finish_load(key, generation, entry)
+    return respond(request, entry)
+
+
+# ---------------- Invalidation ----------------
+def _drop_stand(stand_id: Optional[int]) -> None:
+    # a new or renamed stand may shift any list page, so every page goes
+    stand_responses.invalidate_where(lambda key: key[0] == "list" or key == ("stand", stand_id))
+
+
+def _drop_driver(driver_id: int, phones) -> None:
+    driver_responses.invalidate(("driver", driver_id))
+    for phone in phones:
+        driver_responses.invalidate(("phone", phone))
+
+
+def invalidate_stand(stand_id: Optional[int] = None) -> None:
+    """Drop the cached stand and all stand list pages, here and in the other workers."""
+    _drop_stand(stand_id)
+    bus.publish("response_cache", ["stand", stand_id])
+
+
+def invalidate_driver(driver_id: int, *phones: str) -> None:
+    """Drop the cached driver profile (and its by-phone lookups for `phones`) everywhere."""
+    phones = [p for p in phones if p]
+    _drop_driver(driver_id, phones)
+    bus.publish("response_cache", ["driver", driver_id, phones])
+
+
+def _apply_remote_invalidation(event: list, local: bool) -> None:
+    if local:
+        return
+    if event[0] == "stand":
+        _drop_stand(event[1])
+    else:
+        _drop_driver(event[1], event[2])
+
+
+bus.subscribe("response_cache", _apply_remote_invalidation)
@@ -1,9 +1,143 @@
+import asyncio
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from time import perf_counter
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException, status
 from passlib.context import CryptContext
 
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+from app.config import settings
+from app.utils.metrics import REGISTRY
+from app.utils.profiling import record_phase
+
+pwd_context = CryptContext(
+    schemes=["argon2"],
+    deprecated="auto",
+    argon2__time_cost=settings.ARGON2_TIME_COST,
+    argon2__memory_cost=settings.ARGON2_MEMORY_COST,
+    argon2__parallelism=settings.ARGON2_PARALLELISM,
+)
 
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
+
+
+# ---------------- Bounded hashing pool ----------------
+# Argon2 is deliberately CPU and memory heavy. Requests hand it to a fixed-size
+# pool instead of running it on the event loop / request threadpool, and once
+# PASSWORD_HASH_MAX_PENDING jobs are running or queued new ones get a 503, so a
+# login burst cannot starve every other route.
+PASSWORD_JOBS = REGISTRY.histogram("password_hash_seconds", "Queue + compute time of password hash/verify jobs",
+                                   buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+PASSWORD_REJECTED = REGISTRY.counter("password_hash_rejected_total", "Password jobs rejected because the queue was full")
+PASSWORD_PENDING = REGISTRY.gauge("password_hash_pending", "Password jobs running or queued")
+PASSWORD_BULK_PENDING = REGISTRY.gauge("password_hash_bulk_pending", "Bulk onboarding hash jobs on the pool")
+
+_executor: Optional[Executor] = None
+_pending = 0
+# bulk onboarding: jobs on the pool (at most PASSWORD_HASH_BULK_WORKERS) and batches in progress
+_bulk_slots: Optional[Tuple[asyncio.AbstractEventLoop, asyncio.Semaphore]] = None
+_bulk_pending = 0
+_bulk_batches = 0
+
+def _lower_priority(increment: int) -> None:
+    try:
+        os.nice(increment)
+    except OSError:
+        pass
+
+def _get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        if settings.PASSWORD_HASH_EXECUTOR == "process":
+            _executor = ProcessPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS,
+                                            initializer=_lower_priority, initargs=(settings.PASSWORD_HASH_NICE,))
+        else:
+            _executor = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="pwhash")
+    return _executor
+
+def _get_bulk_slots() -> asyncio.Semaphore:
+    # one per event loop: a semaphore binds to the first loop that waits on it, and a later
+    # asyncio.run (a CLI command or test after the app) would fail on it
+    global _bulk_slots
+    loop = asyncio.get_running_loop()
+    if _bulk_slots is None or _bulk_slots[0] is not loop:
+        _bulk_slots = (loop, asyncio.Semaphore(settings.PASSWORD_HASH_BULK_WORKERS))
+    return _bulk_slots[1]
+
+def shutdown_password_pool() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+async def _run_password_job(op: str, fn, *args):
+    global _pending
+    if _pending >= settings.PASSWORD_HASH_MAX_PENDING:
+        PASSWORD_REJECTED.inc(op=op)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many concurrent logins, retry shortly",
+            headers={"Retry-After": "1"},
+        )
+    _pending += 1
+    PASSWORD_PENDING.set(_pending)
+    start = perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_get_executor(), fn, *args)
+    finally:
+        _pending -= 1
+        PASSWORD_PENDING.set(_pending)
+        elapsed = perf_counter() - start
+        PASSWORD_JOBS.observe(elapsed, op=op)
+        record_phase("password", elapsed)
+
+async def hash_password_async(password: str) -> str:
+    return await _run_password_job("hash", hash_password, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await _run_password_job("verify", verify_password, plain_password, hashed_password)
+
+async def hash_passwords_async(passwords: List[str]) -> List[str]:
+    """
+    Hash a batch (bulk onboarding) across the pool's workers, in order. Bulk jobs have their
+    own budget, outside the login one: every batch shares PASSWORD_HASH_BULK_WORKERS slots, so
+    a login queued meanwhile waits for at most that many hashes and finds the other workers
+    free, and beyond PASSWORD_HASH_BULK_MAX_BATCHES batches running or waiting a new one gets 503.
+    """
+    global _bulk_batches
+    if _bulk_batches >= settings.PASSWORD_HASH_BULK_MAX_BATCHES:
+        PASSWORD_REJECTED.inc(op="bulk_hash")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many onboarding batches in progress, retry shortly",
+            headers={"Retry-After": "5"},
+        )
+    loop = asyncio.get_running_loop()
+    executor = _get_executor()
+    slots = _get_bulk_slots()
+
+    async def one(password: str) -> str:
+        global _bulk_pending
+        async with slots:
+            _bulk_pending += 1
+            PASSWORD_BULK_PENDING.set(_bulk_pending)
+            start = perf_counter()
+            try:
+                return await loop.run_in_executor(executor, hash_password, password)
+            finally:
+                _bulk_pending -= 1
+                PASSWORD_BULK_PENDING.set(_bulk_pending)
+                PASSWORD_JOBS.observe(perf_counter() - start, op="bulk_hash")
+
+    _bulk_batches += 1
+    start = perf_counter()
+    try:
+        return await asyncio.gather(*(one(p) for p in passwords))
+    finally:
+        _bulk_batches -= 1
+        record_phase("password", perf_counter() - start)
@@ -0,0 +1,37 @@
+"""
+Single-pass JSON rendering of list pages.
+
+For a returned value FastAPI validates against response_model, dumps the result to
+Python objects and then json-encodes those. The large list routes skip the middle
+step: pydantic-core validates the ORM rows (from_attributes) and writes JSON bytes
+in one TypeAdapter.dump_json call. The routes keep their response_model, so the
+OpenAPI schema is unchanged.
+"""
+from functools import lru_cache
+from time import perf_counter
+from typing import List, Type
+
+from fastapi import Response
+from pydantic import BaseModel, TypeAdapter
+
+from app.utils.pagination import NEXT_CURSOR_HEADER, Page
+from app.utils.profiling import record_phase
+
+
+@lru_cache(maxsize=None)
+def _list_adapter(model: Type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(List[model])
+
+
+def dump_list(model: Type[BaseModel], items) -> bytes:
+    start = perf_counter()
+    adapter = _list_adapter(model)
+    body = adapter.dump_json(adapter.validate_python(items))
+    record_phase("serialize", perf_counter() - start)
+    return body
+
+
+def page_response(model: Type[BaseModel], page: Page) -> Response:
+    """JSON response of a keyset page, with its cursor in the X-Next-Cursor header."""
+    headers = {NEXT_CURSOR_HEADER: page.next_cursor} if page.next_cursor else None
+    return Response(dump_list(model, page.items), media_type="application/json", headers=headers)
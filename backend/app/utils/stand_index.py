@@ -0,0 +1,65 @@
+"""
+In-memory spatial index of auto stands.
+
+Stands rarely move, so the whole set lives in a `SpatialGrid` and pickup points
+resolve to their nearest stands without a DB round trip. stand_crud writes
+through on create/update and broadcasts the change on the event bus; the index
+is rebuilt from `autostands` at startup. Stands without coordinates are known
+(`stand_id in stand_index`) but not on the grid.
+"""
+from threading import Lock
+from typing import Callable, Iterable, List, Optional, Set, Tuple
+
+from app.config import settings
+from app.utils.geo import SpatialGrid
+
+
+class StandIndex:
+    def __init__(self, cell_metres: float = 500.0):
+        self._grid = SpatialGrid(cell_metres)
+        self._ids: Set[int] = set()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._grid)
+
+    def __contains__(self, stand_id: int) -> bool:
+        return stand_id in self._ids
+
+    def rebuild(self, stands: Iterable[Tuple[int, Optional[float], Optional[float]]]) -> None:
+        with self._lock:
+            self._grid.clear()
+            self._ids.clear()
+            for stand_id, lat, lng in stands:
+                self._ids.add(stand_id)
+                if lat is not None and lng is not None:
+                    self._grid.upsert(stand_id, lat, lng)
+
+    def upsert(self, stand_id: int, lat: Optional[float], lng: Optional[float]) -> None:
+        with self._lock:
+            self._ids.add(stand_id)
+            if lat is None or lng is None:
+                self._grid.remove(stand_id)
+            else:
+                self._grid.upsert(stand_id, lat, lng)
+
+    def remove(self, stand_id: int) -> None:
+        with self._lock:
+            self._ids.discard(stand_id)
+            self._grid.remove(stand_id)
+
+    def location(self, stand_id: int) -> Optional[Tuple[float, float]]:
+        with self._lock:
+            point = self._grid.get(stand_id)
+            return None if point is None else (point.lat, point.lng)
+
+    def nearest(self, lat: float, lng: float, k: int, max_radius_m: float,
+                predicate: Optional[Callable[[int], bool]] = None) -> List[Tuple[float, int]]:
+        """(distance, stand_id) of up to `k` stands within `max_radius_m`, nearest first."""
+        keep = None if predicate is None else (lambda point: predicate(point.key))
+        with self._lock:
+            found = self._grid.nearest(lat, lng, k, max_radius_m, keep)
+        return [(distance, point.key) for distance, point in found]
+
+
+stand_index = StandIndex(cell_metres=settings.LOCATION_GRID_CELL_METRES)
@@ -0,0 +1,229 @@
+"""
+WebSocket connection manager with per-driver, per-user and per-stand channels.
+
+Channels are plain strings: "driver:<id>", "user:<id>", "stand:<id>". Clients may add
+stand channels of existing stands themselves, up to `max_subscriptions` channels per
+connection.
+
+Every connection gets a bounded outbox drained by its own sender task, so a
+slow client never blocks publishers or other clients. Messages published with
+a `key` replace a not-yet-sent message with the same key (e.g. successive queue
+snapshots of one stand collapse into the latest). A client whose outbox still
+overflows is disconnected and expected to reconnect and resync.
+
+`publish()` is safe to call from any thread (sync CRUD code runs in the
+threadpool); delivery is always scheduled on the event loop.
+"""
+import asyncio
+import itertools
+import json
+from collections import OrderedDict
+from time import monotonic
+from typing import Dict, Hashable, Optional, Set
+
+from fastapi import WebSocket
+from starlette.websockets import WebSocketState
+
+from app.config import settings
+from app.utils.metrics import REGISTRY
+from app.utils.stand_index import stand_index
+
+WS_CONNECTIONS = REGISTRY.gauge("ws_connections", "Open WebSocket connections")
+WS_SENT = REGISTRY.counter("ws_messages_sent_total", "WebSocket messages delivered")
+WS_COALESCED = REGISTRY.counter("ws_messages_coalesced_total", "Pending messages replaced by a newer one with the same key")
+WS_SLOW_CLOSED = REGISTRY.counter("ws_slow_consumers_closed_total", "Connections closed because their outbox overflowed")
+
+# close code for "slow consumer / try again later"
+CLOSE_TRY_AGAIN_LATER = 1013
+
+
+class Connection:
+    def __init__(self, websocket: WebSocket, principal_id: int, role: str, max_pending: int):
+        self.websocket = websocket
+        self.principal_id = principal_id
+        self.role = role
+        self.channels: Set[str] = set()
+        self.last_seen = monotonic()
+        self._max_pending = max_pending
+        self._outbox: "OrderedDict[Hashable, dict]" = OrderedDict()
+        self._ready = asyncio.Event()
+        self._seq = itertools.count()
+        self.closed = False
+
+    def enqueue(self, message: dict, key: Optional[Hashable] = None) -> bool:
+        """Queue a message; returns False if the outbox overflowed."""
+        if key is not None and key in self._outbox:
+            self._outbox[key] = message
+            WS_COALESCED.inc()
+            return True
+        self._outbox[key if key is not None else ("seq", next(self._seq))] = message
+        self._ready.set()
+        return len(self._outbox) <= self._max_pending
+
+    async def sender(self) -> None:
+        while not self.closed:
+            await self._ready.wait()
+            while self._outbox:
+                _, message = self._outbox.popitem(last=False)
+                await self.websocket.send_json(message)
+                WS_SENT.inc()
+            self._ready.clear()
+
+
+class ConnectionManager:
+    def __init__(self, max_pending: int = 100, heartbeat_interval: float = 20.0, heartbeat_timeout: float = 60.0,
+                 max_subscriptions: int = 50):
+        self.max_pending = max_pending
+        self.max_subscriptions = max_subscriptions
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self._channels: Dict[str, Set[Connection]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    # ---------------- Lifecycle ----------------
+    def bind_loop(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+
+    async def connect(self, websocket: WebSocket, principal_id: int, role: str, channels) -> Connection:
+        await websocket.accept()
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        conn = Connection(websocket, principal_id, role, self.max_pending)
+        for channel in channels:
+            self.subscribe(conn, channel)
+        WS_CONNECTIONS.inc()
+        return conn
+
+    def disconnect(self, conn: Connection) -> None:
+        if conn.closed:
+            return
+        conn.closed = True
+        conn._ready.set()
+        for channel in list(conn.channels):
+            self.unsubscribe(conn, channel)
+        WS_CONNECTIONS.dec()
+
+    def subscribe(self, conn: Connection, channel: str) -> None:
+        self._channels.setdefault(channel, set()).add(conn)
+        conn.channels.add(channel)
+
+    def unsubscribe(self, conn: Connection, channel: str) -> None:
+        subscribers = self._channels.get(channel)
+        if subscribers is not None:
+            subscribers.discard(conn)
+            if not subscribers:
+                del self._channels[channel]
+        conn.channels.discard(channel)
+
+    def subscriber_count(self, channel: str) -> int:
+        return len(self._channels.get(channel, ()))
+
+    # ---------------- Publishing ----------------
+    def publish(self, channel: str, message: dict, key: Optional[Hashable] = None) -> None:
+        loop = self._loop
+        if loop is None or channel not in self._channels:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._deliver(channel, message, key)
+        else:
+            loop.call_soon_threadsafe(self._deliver, channel, message, key)
+
+    def _deliver(self, channel: str, message: dict, key: Optional[Hashable]) -> None:
+        for conn in list(self._channels.get(channel, ())):
+            if not conn.enqueue(message, key):
+                WS_SLOW_CLOSED.inc()
+                self.disconnect(conn)
+                asyncio.ensure_future(self._close(conn, CLOSE_TRY_AGAIN_LATER))
+
+    async def _close(self, conn: Connection, code: int) -> None:
+        if conn.websocket.application_state != WebSocketState.DISCONNECTED:
+            try:
+                await conn.websocket.close(code=code)
+            except RuntimeError:
+                pass
+
+    # ---------------- Serving ----------------
+    async def serve(self, conn: Connection) -> None:
+        """Run sender, heartbeat and receive loops until the client goes away."""
+        tasks = [
+            asyncio.ensure_future(conn.sender()),
+            asyncio.ensure_future(self._heartbeat(conn)),
+            asyncio.ensure_future(self._receive(conn)),
+        ]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.disconnect(conn)
+            await self._close(conn, 1000)
+
+    async def _heartbeat(self, conn: Connection) -> None:
+        while not conn.closed:
+            await asyncio.sleep(self.heartbeat_interval)
+            if monotonic() - conn.last_seen > self.heartbeat_timeout:
+                return
+            conn.enqueue({"type": "ping"}, key="ping")
+
+    async def _receive(self, conn: Connection) -> None:
+        while not conn.closed:
+            frame = await conn.websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                return
+            conn.last_seen = monotonic()
+            # a bad frame or message is answered, not fatal: the connection stays open
+            try:
+                message = json.loads(frame["text"]) if frame.get("text") is not None else None
+            except ValueError:
+                message = None
+            if message is None:
+                self._error(conn, "Expected a JSON text frame")
+            elif not isinstance(message, dict):
+                self._error(conn, "Expected a JSON object")
+            elif message.get("action") == "ping":
+                conn.enqueue({"type": "pong"}, key="pong")
+            elif message.get("action") in ("subscribe", "unsubscribe"):
+                self._client_subscription(conn, message["action"], message.get("channel"))
+            else:
+                self._error(conn, "Unknown action, expected subscribe, unsubscribe or ping")
+
+    def _client_subscription(self, conn: Connection, action: str, channel) -> None:
+        # clients may only (un)subscribe to public stand channels themselves, of stands that exist
+        stand_id = _stand_id(channel)
+        if stand_id is None or (action == "subscribe" and stand_id not in stand_index):
+            self._error(conn, "Channel must be stand:<id> of an existing stand")
+            return
+        channel = f"stand:{stand_id}"
+        if action == "unsubscribe":
+            self.unsubscribe(conn, channel)
+        elif channel in conn.channels or len(conn.channels) < self.max_subscriptions:
+            self.subscribe(conn, channel)
+        else:
+            self._error(conn, f"At most {self.max_subscriptions} subscriptions per connection")
+            return
+        conn.enqueue({"type": action + "d", "channel": channel})
+
+    @staticmethod
+    def _error(conn: Connection, detail: str) -> None:
+        # keyed: a client sending garbage in a loop has at most one error pending
+        conn.enqueue({"type": "error", "detail": detail}, key="error")
+
+
+def _stand_id(channel) -> Optional[int]:
+    """The stand of a "stand:<id>" channel name; None for anything else."""
+    if not isinstance(channel, str) or not channel.startswith("stand:"):
+        return None
+    ident = channel[len("stand:"):]
+    return int(ident) if len(ident) <= 18 and ident.isascii() and ident.isdigit() else None
+
+manager = ConnectionManager(
+    max_pending=settings.WS_SEND_QUEUE_SIZE,
+    heartbeat_interval=settings.WS_HEARTBEAT_INTERVAL,
+    heartbeat_timeout=settings.WS_HEARTBEAT_TIMEOUT,
+    max_subscriptions=settings.WS_MAX_SUBSCRIPTIONS,
+)
@@ -0,0 +1,279 @@
+"""
+Load test of the booking hot path: queue joins/leaves, ride bookings and pops.
+
+Seeds `--stands` stands, `--drivers` drivers and `--users` riders through the
+CRUD modules, then drives HTTP traffic for `--duration` seconds:
+
+  - one loop per driver: join its stand's queue, poll its position; once taken
+    (by a booking or a pop) start and complete any assigned ride, then rejoin;
+    now and then leave the queue instead
+  - `--riders` loops booking rides with a random `stand_id` (cancelling the ride
+    when no driver was free)
+  - `--poppers` loops calling POST /stands/{id}/pop on random stands
+
+Requests go to the app in-process by default, or to a running server with `--url`
+(point BENCH_DATABASE_URL at the same database; seeding resets it, so seed with
+`--seed-only` before starting the server and run with `--no-seed`). Run the
+server with SCHEDULER_ENABLED=false so queue expiry does not remove waiting rows
+mid-run.
+
+Prints throughput and p50/p95/p99 per operation, then checks the invariants
+against the database and exits non-zero when one fails:
+
+  - no driver holds two active rides at once
+  - every assignment seen by a client is exactly one `assigned` queue row
+    (no queue entry handed out twice)
+  - FIFO per stand: no row still waiting at the end was accepted before a row
+    that was assigned. The queue serves joins in the order they commit, which is
+    the row id order; joined_at is stamped before the INSERT waits for its lock,
+    so a pair only counts when the assigned row is also `--fifo-slack-ms` later
+
+    python -m bench.booking_load --stands 20 --drivers 400 --users 200 --riders 32 --poppers 4 --duration 30
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from functools import lru_cache
+
+os.environ.setdefault("SCHEDULER_ENABLED", "false")
+
+from bench.common import add_reset_argument, fmt, percentiles, reset_schema, start_app  # noqa: E402
+
+
+def _seed(args) -> None:
+    from app.crud import driver_crud, stand_crud, user_crud
+    from app.database import SessionLocal
+    from app.schemas import AutoStandCreate, DriverCreate, UserCreate
+    from app.utils.security import hash_password
+
+    reset_schema(args.reset)
+    password_hash = hash_password("bench")  # once: hashing is not what this measures
+    db = SessionLocal()
+    try:
+        for i in range(args.stands):
+            # a grid with ~1 km spacing, so fallback to the nearest stands has neighbours
+            stand_crud.create_stand(db, AutoStandCreate(name=f"Stand {i}", location="bench",
+                                                        latitude=9.95 + (i // 10) * 0.009,
+                                                        longitude=76.25 + (i % 10) * 0.009))
+        stand_ids = [s.id for s in stand_crud.get_stands(db, limit=args.stands).items]
+        for i in range(args.drivers):
+            driver_crud.create_driver(db, DriverCreate(name=f"Driver {i}", phone=f"bench-{i}", password="bench",
+                                                       stand_id=stand_ids[i % len(stand_ids)],
+                                                       is_available=True), password_hash)
+        for i in range(args.users):
+            user_crud.create_user(db, UserCreate(name=f"Rider {i}", email=f"rider{i}@bench.example",
+                                                 password="bench"), password_hash)
+    finally:
+        db.close()
+
+
+def _load_ids():
+    from app.database import SessionLocal
+    from app.model import AutoStand, Driver, User
+
+    db = SessionLocal()
+    try:
+        stands = [s for (s,) in db.query(AutoStand.id).order_by(AutoStand.id)]
+        drivers = db.query(Driver.id, Driver.stand_id).order_by(Driver.id).all()
+        users = [u for (u,) in db.query(User.id).order_by(User.id)]
+    finally:
+        db.close()
+    return stands, drivers, users
+
+
+class Stats:
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.codes = defaultdict(lambda: defaultdict(int))
+        self.popped_entries = []      # queue ids handed out by /pop
+        self.ride_drivers = []        # driver ids assigned by bookings
+
+    async def call(self, op: str, request, expected=(200,)):
+        start = time.perf_counter()
+        response = await request
+        self.samples[op].append(time.perf_counter() - start)
+        self.codes[op][response.status_code] += 1
+        if response.status_code in (429, 503) and "retry-after" in response.headers:
+            # rate limited or shed: back off like the apps do
+            await asyncio.sleep(float(response.headers["retry-after"]))
+        return response if response.status_code in expected else None
+
+
+@lru_cache(maxsize=None)
+def _auth(role: str, subject_id: int) -> dict:
+    from app.utils.auth import create_access_token
+
+    return {"Authorization": "Bearer " + create_access_token({"sub": str(subject_id), "role": role})}
+
+
+async def _drive_active(client, stats: Stats, headers) -> None:
+    active = await stats.call("active", client.get("/rides/rides/active", headers=headers))
+    for ride in (active.json() if active is not None else []):
+        if ride["status"] == "accepted":
+            await stats.call("start", client.post(f"/rides/rides/{ride['id']}/start", headers=headers))
+        await stats.call("complete", client.post(f"/rides/rides/{ride['id']}/complete", headers=headers))
+
+
+async def _driver_loop(client, stats: Stats, driver_id: int, stand_id: int, stop_at: float, rng, args):
+    headers = _auth("driver", driver_id)
+    while time.perf_counter() < stop_at:
+        if not await stats.call("join", client.post(f"/stands/{stand_id}/join", headers=headers)):
+            await asyncio.sleep(args.think)
+            continue
+        while time.perf_counter() < stop_at:
+            await asyncio.sleep(rng.uniform(0.5, 1.5) * args.think)
+            if rng.random() < args.leave_rate:
+                left = await stats.call("leave", client.post("/stands/me/leave", headers=headers), expected=(200, 404))
+                if left is not None and left.status_code == 404:
+                    # a booking took the entry first
+                    await _drive_active(client, stats, headers)
+                break
+            waiting = await stats.call("position", client.get(f"/stands/{stand_id}/queue/position", headers=headers),
+                                       expected=(200, 404))
+            if waiting is not None and waiting.status_code == 404:
+                # taken off the queue: drive whatever was assigned, then rejoin
+                await _drive_active(client, stats, headers)
+                break
+
+
+async def _rider_loop(client, stats: Stats, user_ids, stand_ids, stop_at: float, rng, args):
+    while time.perf_counter() < stop_at:
+        user_id = rng.choice(user_ids)
+        headers = _auth("user", user_id)
+        booked = await stats.call("book", client.post("/rides/rides/", headers=headers, json={
+            "user_id": user_id, "start_location": "bench", "end_location": "town", "stand_id": rng.choice(stand_ids)}))
+        if booked is not None:
+            ride = booked.json()
+            if ride["driver_id"]:
+                stats.ride_drivers.append(ride["driver_id"])
+            else:
+                await stats.call("cancel", client.post(f"/rides/rides/{ride['id']}/cancel", headers=headers))
+        await asyncio.sleep(rng.uniform(0.5, 1.5) * args.think)
+
+
+async def _popper_loop(client, stats: Stats, stand_ids, stop_at: float, rng, args):
+    while time.perf_counter() < stop_at:
+        popped = await stats.call("pop", client.post(f"/stands/{rng.choice(stand_ids)}/pop"), expected=(200, 404))
+        if popped is not None and popped.status_code == 200:
+            stats.popped_entries.append(popped.json()["queue_id"])
+        await asyncio.sleep(rng.uniform(0.5, 1.5) * args.think)
+
+
+def _check_invariants(stats: Stats, slack_ms: float) -> bool:
+    from sqlalchemy import func, select, union_all
+    from app.database import SessionLocal
+    from app.model import ACTIVE_RIDE_STATUSES, Ride, StandQueue, StandQueueHistory
+
+    queue = union_all(*(select(t.id, t.stand_id, t.driver_id, t.joined_at, t.status)
+                        for t in (StandQueue, StandQueueHistory))).subquery()
+    db = SessionLocal()
+    try:
+        doubled = db.execute(
+            select(Ride.driver_id).where(Ride.status.in_(ACTIVE_RIDE_STATUSES), Ride.driver_id.isnot(None))
+            .group_by(Ride.driver_id).having(func.count() > 1)
+        ).all()
+        assigned_rows = db.execute(select(func.count()).select_from(queue).where(queue.c.status == "assigned")).scalar()
+        ride_rows = db.execute(select(func.count()).select_from(Ride).where(Ride.driver_id.isnot(None))).scalar()
+        rows = db.execute(
+            select(queue.c.stand_id, queue.c.id, queue.c.joined_at, queue.c.status)
+            .where(queue.c.status.in_(("waiting", "assigned")))
+            .order_by(queue.c.stand_id, queue.c.id.desc())
+        ).all()
+    finally:
+        db.close()
+
+    # walk each stand newest row first, tracking the latest joined_at assigned after the current row
+    fifo_violations, stand, latest_assigned = [], None, None
+    for stand_id, _, joined_at, status in rows:
+        if stand_id != stand:
+            stand, latest_assigned = stand_id, None
+        if status == "assigned":
+            latest_assigned = max(latest_assigned or joined_at, joined_at)
+        elif (latest_assigned is not None and (latest_assigned - joined_at).total_seconds() * 1000 > slack_ms
+              and stand_id not in fifo_violations):
+            fifo_violations.append(stand_id)
+    seen = len(stats.popped_entries) + len(stats.ride_drivers)
+    checks = [
+        ("no driver with two active rides", not doubled, f"{len(doubled)} drivers"),
+        ("each pop handed out a distinct entry", len(set(stats.popped_entries)) == len(stats.popped_entries),
+         f"{len(stats.popped_entries) - len(set(stats.popped_entries))} repeats"),
+        ("client assignments == assigned queue rows", seen == assigned_rows,
+         f"pops {len(stats.popped_entries)} + bookings {len(stats.ride_drivers)} vs {assigned_rows} rows"),
+        ("booked drivers == rides with a driver", len(stats.ride_drivers) == ride_rows,
+         f"{len(stats.ride_drivers)} vs {ride_rows}"),
+        ("FIFO per stand", not fifo_violations, f"stands {fifo_violations[:10]}"),
+    ]
+    ok = True
+    for name, passed, detail in checks:
+        ok &= passed
+        print(f"  {'ok  ' if passed else 'FAIL'} {name:<42} {detail}")
+    return ok
+
+
+async def main(args) -> int:
+    import httpx
+
+    if not args.no_seed:
+        _seed(args)
+        if args.seed_only:
+            return 0
+    stand_ids, drivers, user_ids = _load_ids()
+    drivers = drivers[:args.active_drivers] if args.active_drivers else drivers
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+        app = None
+    else:
+        from app.main import app
+
+        stop_app = await start_app(app)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=args.timeout)
+
+    stats, rng = Stats(), random.Random(args.seed)
+    started = time.perf_counter()
+    stop_at = started + args.duration
+    async with client:
+        tasks = [_driver_loop(client, stats, d.id, d.stand_id, stop_at, random.Random(rng.random()), args)
+                 for d in drivers]
+        tasks += [_rider_loop(client, stats, user_ids, stand_ids, stop_at, random.Random(rng.random()), args)
+                  for _ in range(args.riders)]
+        tasks += [_popper_loop(client, stats, stand_ids, stop_at, random.Random(rng.random()), args)
+                  for _ in range(args.poppers)]
+        await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    if app is not None:
+        await stop_app()
+
+    total = sum(len(s) for s in stats.samples.values())
+    print(f"{len(stand_ids)} stands, {len(drivers)} driver loops, {args.riders} riders, {args.poppers} poppers, "
+          f"{elapsed:.1f}s: {total / elapsed:.1f} req/s")
+    for op, samples in stats.samples.items():
+        codes = " ".join(f"{code}:{n}" for code, n in sorted(stats.codes[op].items()))
+        print(f"  {op:<9} {len(samples) / elapsed:8.1f}/s  {fmt(percentiles(samples))}  [{codes}]")
+    print("invariants")
+    return 0 if _check_invariants(stats, args.fifo_slack_ms) else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_reset_argument(parser)
+    parser.add_argument("--stands", type=int, default=20)
+    parser.add_argument("--drivers", type=int, default=400)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--active-drivers", type=int, default=0, help="driver loops to run (0 = every driver)")
+    parser.add_argument("--riders", type=int, default=32, help="concurrent booking loops")
+    parser.add_argument("--poppers", type=int, default=4, help="concurrent /pop loops")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of traffic")
+    parser.add_argument("--think", type=float, default=0.2, help="mean pause between a loop's requests (seconds)")
+    parser.add_argument("--leave-rate", type=float, default=0.05, help="chance per poll that a driver leaves the queue")
+    parser.add_argument("--fifo-slack-ms", type=float, default=100.0)
+    parser.add_argument("--timeout", type=float, default=30.0, help="per-request timeout (seconds)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--url", help="base URL of a running server (default: in-process)")
+    parser.add_argument("--seed-only", action="store_true", help="seed the database and exit")
+    parser.add_argument("--no-seed", action="store_true", help="run against the already seeded database")
+    sys.exit(asyncio.run(main(parser.parse_args())))
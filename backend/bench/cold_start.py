@@ -0,0 +1,94 @@
+"""
+Worker cold start: time from spawning a uvicorn worker until it is live and ready.
+
+Each run migrates the database (a no-op after the first), spawns
+`uvicorn app.main:app` on a free port and polls /health/live and /health/ready
+every few milliseconds; the ready response carries the duration of each warm-up
+step. Also reports the bare `import app.main` time of a fresh interpreter, which
+is what every worker spawn and test run pays before the lifespan starts.
+
+    python -m bench.cold_start --runs 5
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+import bench.common  # noqa: F401  (DATABASE_URL / JWT_SECRET_KEY defaults)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _import_seconds() -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import app.main"], check=True)
+    return time.perf_counter() - start
+
+
+def _spawn(timeout: float, poll: float):
+    import httpx
+
+    port = _free_port()
+    env = dict(os.environ, SCHEDULER_ENABLED=os.environ.get("SCHEDULER_ENABLED", "false"))
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port),
+                               "--log-level", "warning"], env=env)
+    live = ready = None
+    body = {}
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=1.0) as client:
+            while time.perf_counter() - start < timeout:
+                try:
+                    if live is None and client.get("/health/live").status_code == 200:
+                        live = time.perf_counter() - start
+                    if live is not None:
+                        response = client.get("/health/ready")
+                        if response.status_code == 200:
+                            ready, body = time.perf_counter() - start, response.json()
+                            break
+                except httpx.TransportError:
+                    pass  # not listening yet
+                time.sleep(poll)
+    finally:
+        server.terminate()
+        server.wait()
+    return live, ready, body.get("steps", {})
+
+
+def main(args) -> int:
+    from app.services import migrations
+
+    migrations.migrate()
+    imports = [_import_seconds() for _ in range(args.runs)]
+    print(f"import app.main   min {min(imports) * 1000:7.1f}ms  max {max(imports) * 1000:7.1f}ms")
+
+    lives, readies, steps = [], [], defaultdict(list)
+    for _ in range(args.runs):
+        live, ready, run_steps = _spawn(args.timeout, args.poll_ms / 1000)
+        if ready is None:
+            print(f"worker not ready after {args.timeout}s")
+            return 1
+        lives.append(live)
+        readies.append(ready)
+        for step, seconds in run_steps.items():
+            steps[step].append(seconds)
+    print(f"spawn -> live     min {min(lives) * 1000:7.1f}ms  max {max(lives) * 1000:7.1f}ms")
+    print(f"spawn -> ready    min {min(readies) * 1000:7.1f}ms  max {max(readies) * 1000:7.1f}ms")
+    for step, samples in steps.items():
+        print(f"  {step:<15} min {min(samples) * 1000:7.1f}ms  max {max(samples) * 1000:7.1f}ms")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds to wait for readiness")
+    parser.add_argument("--poll-ms", type=float, default=5.0)
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,77 @@
+"""
+Shared helpers for the benchmark scripts in this directory.
+
+Run the scripts from `backend/` as modules, e.g. `python -m bench.login_bench`.
+DATABASE_URL and JWT_SECRET_KEY fall back to a local SQLite file and a dummy
+secret so a benchmark can run without any setup. For numbers that mean something,
+set BENCH_DATABASE_URL to a scratch Postgres database (it takes the place of
+DATABASE_URL). Seeding drops every table, so any other non-SQLite database is
+only reset with the script's --reset flag.
+"""
+import argparse
+import os
+import statistics
+from typing import Dict, List
+
+if os.environ.get("BENCH_DATABASE_URL"):
+    os.environ["DATABASE_URL"] = os.environ["BENCH_DATABASE_URL"]
+os.environ.setdefault("DATABASE_URL", "sqlite:///./bench.db")
+os.environ.setdefault("JWT_SECRET_KEY", "bench-secret")
+# every bench request comes from one client, which the per-client rate limits would throttle
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """p50/p95/p99/max of latency samples (seconds) in milliseconds."""
+    if not samples:
+        return {"n": 0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return ordered[min(int(len(ordered) * q), len(ordered) - 1)] * 1000
+
+    return {
+        "n": len(ordered),
+        "p50": statistics.median(ordered) * 1000,
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "max": ordered[-1] * 1000,
+    }
+
+
+def fmt(stats: Dict[str, float]) -> str:
+    return (f"n={stats['n']:<6} p50={stats['p50']:7.2f}ms p95={stats['p95']:7.2f}ms "
+            f"p99={stats['p99']:7.2f}ms max={stats['max']:7.2f}ms")
+
+
+def add_reset_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--reset", action="store_true",
+                        help="allow dropping every table of a DATABASE_URL that is neither SQLite "
+                             "nor BENCH_DATABASE_URL")
+
+
+def reset_schema(force: bool = False) -> None:
+    """
+    Drop and recreate all tables so every run starts from an empty DB. Refuses (exits) for a
+    database other than SQLite or BENCH_DATABASE_URL unless `force` (the --reset flag).
+    """
+    from app.database import Base, engine
+    from app import model  # noqa: F401  (registers the tables)
+
+    scratch = engine.dialect.name == "sqlite" or (
+        os.environ.get("BENCH_DATABASE_URL") == os.environ.get("DATABASE_URL"))
+    if not (scratch or force):
+        raise SystemExit(f"refusing to drop every table of {engine.url.render_as_string(hide_password=True)}: "
+                         "set BENCH_DATABASE_URL to a scratch database, or pass --reset")
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+
+async def start_app(app):
+    """Run the app's lifespan in-process and wait for its warm-up; returns the coroutine function that stops it."""
+    from app.services import warmup
+
+    lifespan = app.router.lifespan_context(app)
+    await lifespan.__aenter__()
+    await warmup.wait_ready()
+    return lambda: lifespan.__aexit__(None, None, None)
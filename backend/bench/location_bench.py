@@ -0,0 +1,133 @@
+"""
+Driver location pipeline: ingest rate, nearby-query latency and bulk flush cost.
+
+Three measurements, all in one process:
+  - in-memory ingest: location_service.ingest() called directly (the ceiling)
+  - HTTP ingest: concurrent drivers POSTing /drivers/drivers/me/location
+  - flush: one bulk UPDATE of every dirty driver, and GET nearby latency
+
+    python -m bench.location_bench --drivers 5000 --pings 200000 --clients 64 --duration 10
+"""
+import argparse
+import asyncio
+import random
+import time
+from types import SimpleNamespace
+
+from bench.common import add_reset_argument, fmt, percentiles, reset_schema, start_app
+
+# Kochi, roughly 20 x 20 km around the centre
+CENTRE = (9.9816, 76.2999)
+SPREAD = 0.09
+
+
+def _random_point(rng):
+    return CENTRE[0] + rng.uniform(-SPREAD, SPREAD), CENTRE[1] + rng.uniform(-SPREAD, SPREAD)
+
+
+def _ingest_in_memory(location_service, driver_ids, pings, rng):
+    points = [SimpleNamespace(lat=lat, lng=lng, recorded_at=None)
+              for lat, lng in (_random_point(rng) for _ in range(min(pings, 10000)))]
+    start = time.perf_counter()
+    for i in range(pings):
+        location_service.ingest(driver_ids[i % len(driver_ids)], (points[i % len(points)],))
+    return pings / (time.perf_counter() - start)
+
+
+async def _http_client(client, stop_at, headers, rng, samples, batch):
+    while time.perf_counter() < stop_at:
+        body = [dict(zip(("lat", "lng"), _random_point(rng))) for _ in range(batch)]
+        start = time.perf_counter()
+        r = await client.post("/drivers/drivers/me/location", json=body if batch > 1 else body[0], headers=headers)
+        assert r.status_code == 202, r.text
+        samples.append(time.perf_counter() - start)
+        # an in-process request that never touches the DB does not suspend; without this one
+        # client would hold the loop (over a real socket every request yields)
+        await asyncio.sleep(0)
+
+
+async def main(args):
+    import httpx
+    from app.main import app
+    from app.database import SessionLocal
+    from app.model import AutoStand, Driver, User
+    from app.services import location_service
+    from app.utils.auth import create_access_token
+    from app.utils.locations import driver_locations
+    from app.utils.security import hash_password
+
+    rng = random.Random(42)
+    reset_schema(args.reset)
+    db = SessionLocal()
+    stand = AutoStand(name="Bench stand", location="bench")
+    db.add(stand)
+    db.commit()
+    hashed = hash_password("secret")
+    db.add_all([Driver(name=f"d{i}", phone=f"bench-{i}", password=hashed, stand_id=stand.id)
+                for i in range(args.drivers)])
+    db.commit()
+    driver_ids = [d.id for d in db.query(Driver.id).all()]
+    rider = User(name="rider", email="rider@bench.example", password=hashed)  # nearby is for riders
+    db.add(rider)
+    db.commit()
+    rider_token = create_access_token({"sub": str(rider.id), "role": "user"})
+    db.close()
+
+    stop_app = await start_app(app)
+    # keep the background loop from flushing in the middle of a measurement
+    await location_service.stop()
+
+    rate = _ingest_in_memory(location_service, driver_ids, args.pings, rng)
+    print(f"in-memory ingest     {rate:,.0f} pings/s ({args.pings} pings, {len(driver_ids)} drivers)")
+
+    start = time.perf_counter()
+    flushed = await location_service.flush()
+    print(f"bulk flush           {flushed} drivers in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    query_samples = []
+    for _ in range(1000):
+        lat, lng = _random_point(rng)
+        start = time.perf_counter()
+        location_service.nearby(lat, lng, args.radius, 20)
+        query_samples.append(time.perf_counter() - start)
+    print(f"nearby {args.radius:.0f}m (memory) {fmt(percentiles(query_samples))}")
+
+    tokens = [create_access_token({"sub": str(i), "role": "driver"}) for i in driver_ids[:args.clients]]
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for batch in (1, args.batch):
+            samples = []
+            stop_at = time.perf_counter() + args.duration
+            await asyncio.gather(*[
+                _http_client(client, stop_at, {"Authorization": f"Bearer {t}"}, random.Random(i), samples, batch)
+                for i, t in enumerate(tokens)
+            ])
+            print(f"HTTP ingest batch={batch:<4} {len(samples) * batch / args.duration:,.0f} points/s  "
+                  f"{fmt(percentiles(samples))}")
+        lat, lng = CENTRE
+        samples = []
+        for _ in range(200):
+            start = time.perf_counter()
+            r = await client.get("/drivers/drivers/nearby", params={"lat": lat, "lng": lng, "radius": args.radius},
+                                 headers={"Authorization": f"Bearer {rider_token}"})
+            assert r.status_code == 200, r.text
+            samples.append(time.perf_counter() - start)
+        print(f"GET nearby (HTTP)    {fmt(percentiles(samples))}")
+
+    start = time.perf_counter()
+    flushed = await location_service.flush()
+    print(f"bulk flush           {flushed} drivers in {(time.perf_counter() - start) * 1000:.1f}ms")
+    print(f"tracked drivers      {len(driver_locations)}")
+    await stop_app()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_reset_argument(parser)
+    parser.add_argument("--drivers", type=int, default=5000)
+    parser.add_argument("--pings", type=int, default=200000, help="pings for the in-memory run")
+    parser.add_argument("--clients", type=int, default=64, help="concurrent HTTP drivers")
+    parser.add_argument("--batch", type=int, default=10, help="points per request in the batched HTTP run")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per HTTP run")
+    parser.add_argument("--radius", type=float, default=1000.0, help="nearby query radius in metres")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,83 @@
+"""
+Login throughput vs. latency of the other routes, in a single worker.
+
+Readers hit GET /stands/ continuously while login loops hammer
+POST /auth/driver/token. Prints reader latency without and with the login
+burst, logins/second and how many logins were shed with 503.
+
+    python -m bench.login_bench --duration 10 --logins 32 --readers 8
+"""
+import argparse
+import asyncio
+import time
+
+from bench.common import add_reset_argument, fmt, percentiles, reset_schema, start_app
+
+
+async def _reader(client, stop_at, samples):
+    while time.perf_counter() < stop_at:
+        start = time.perf_counter()
+        r = await client.get("/stands/")
+        assert r.status_code == 200, r.text
+        samples.append(time.perf_counter() - start)
+
+
+async def _login(client, stop_at, phone, samples, counts):
+    while time.perf_counter() < stop_at:
+        start = time.perf_counter()
+        r = await client.post("/auth/driver/token", json={"phone": phone, "password": "secret"})
+        counts[r.status_code] = counts.get(r.status_code, 0) + 1
+        if r.status_code == 503:
+            await asyncio.sleep(0.05)
+            continue
+        samples.append(time.perf_counter() - start)
+
+
+async def _phase(client, duration, readers, logins, phones):
+    stop_at = time.perf_counter() + duration
+    reader_samples, login_samples, counts = [], [], {}
+    tasks = [_reader(client, stop_at, reader_samples) for _ in range(readers)]
+    tasks += [_login(client, stop_at, phones[i % len(phones)], login_samples, counts) for i in range(logins)]
+    await asyncio.gather(*tasks)
+    return reader_samples, login_samples, counts
+
+
+async def main(args):
+    import httpx
+    from app.main import app
+    from app.database import SessionLocal
+    from app.model import AutoStand, Driver
+    from app.utils.security import hash_password
+
+    reset_schema(args.reset)
+    db = SessionLocal()
+    stand = AutoStand(name="Bench stand", location="bench")
+    db.add(stand)
+    db.commit()
+    hashed = hash_password("secret")
+    phones = [f"bench-{i}" for i in range(max(args.logins, 1))]
+    db.add_all([Driver(name=p, phone=p, password=hashed, stand_id=stand.id) for p in phones])
+    db.commit()
+    db.close()
+
+    stop_app = await start_app(app)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        idle, _, _ = await _phase(client, args.duration, args.readers, 0, phones)
+        busy, logins, counts = await _phase(client, args.duration, args.readers, args.logins, phones)
+    await stop_app()
+
+    print(f"readers only      GET /stands/   {fmt(percentiles(idle))}")
+    print(f"with login burst  GET /stands/   {fmt(percentiles(busy))}")
+    print(f"                  login          {fmt(percentiles(logins))}")
+    ok = counts.get(200, 0)
+    print(f"logins/s={ok / args.duration:.1f} ok={ok} shed_503={counts.get(503, 0)} other={sum(counts.values()) - ok - counts.get(503, 0)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_reset_argument(parser)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per phase")
+    parser.add_argument("--logins", type=int, default=32, help="concurrent login loops")
+    parser.add_argument("--readers", type=int, default=8, help="concurrent GET /stands/ loops")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,101 @@
+"""
+Peak-hour burst: per-ride assignment vs. the batched matcher.
+
+Each burst fires `--burst` ride requests at one stand at the same instant (a
+train arriving); `--bursts` bursts run back to back. Both modes start from the
+same seeded queue. Prints rides/second, assignment latency percentiles and two
+invariants: no driver assigned twice, and the assigned drivers are exactly the
+oldest waiting ones (FIFO).
+
+    python -m bench.matching_bench --drivers 3000 --burst 200 --bursts 10 --window-ms 20
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from bench.common import add_reset_argument, fmt, percentiles, reset_schema
+
+
+def _seed(drivers: int, users: int, reset: bool):
+    from app.database import SessionLocal
+    from app.model import AutoStand, Driver, StandQueue, User
+    from app.crud import stand_crud
+
+    reset_schema(reset)
+    db = SessionLocal()
+    stand = AutoStand(name="Station", location="bench")
+    db.add(stand)
+    db.commit()
+    stand_id = stand.id
+    db.add_all([User(name=f"u{i}", email=f"u{i}@bench", password="x") for i in range(users)])
+    db.add_all([Driver(name=f"d{i}", phone=f"bench-{i}", password="x", stand_id=stand_id) for i in range(drivers)])
+    db.commit()
+    driver_ids = [d for (d,) in db.query(Driver.id).order_by(Driver.id).all()]
+    user_ids = [u for (u,) in db.query(User.id).order_by(User.id).all()]
+    start = datetime.utcnow() - timedelta(hours=1)
+    db.add_all([StandQueue(stand_id=stand_id, driver_id=d, joined_at=start + timedelta(milliseconds=i), status="waiting")
+                for i, d in enumerate(driver_ids)])
+    db.commit()
+    stand_crud.load_queue_cache(db)
+    db.close()
+    return stand_id, driver_ids, user_ids
+
+
+async def _run(mode: str, args, submit):
+    from app.schemas import RideCreate
+
+    stand_id, driver_ids, user_ids = _seed(args.drivers, args.burst, args.reset)
+    samples, assigned = [], []
+
+    async def one(i):
+        ride = RideCreate(user_id=user_ids[i % len(user_ids)], start_location="station", end_location="town",
+                          stand_id=stand_id)
+        start = time.perf_counter()
+        result = await submit(ride)
+        samples.append(time.perf_counter() - start)
+        if result.driver_id:
+            assigned.append(result.driver_id)
+
+    started = time.perf_counter()
+    for _ in range(args.bursts):
+        await asyncio.gather(*[one(i) for i in range(args.burst)])
+    elapsed = time.perf_counter() - started
+
+    total = args.burst * args.bursts
+    expected = set(driver_ids[:min(total, len(driver_ids))])
+    print(f"{mode:<9} rides/s={total / elapsed:8.1f}  {fmt(percentiles(samples))}")
+    print(f"{'':<9} assigned={len(assigned)} duplicates={len(assigned) - len(set(assigned))} "
+          f"fifo={'ok' if set(assigned) == expected else 'VIOLATED'}")
+
+
+async def main(args):
+    from app.crud import ride_crud
+    from app.database import db_session, run_db
+    from app.services.ride_assignment import BatchMatcher
+    from app.services.event_bus import bus
+    from app.utils.websocket_manager import manager
+
+    manager.bind_loop(asyncio.get_running_loop())
+    await bus.start()
+
+    async def per_ride(ride):
+        async with db_session() as db:
+            return await run_db(db, ride_crud.create_ride, ride)
+
+    matcher = BatchMatcher(window=args.window_ms / 1000, max_batch=args.max_batch)
+
+    await _run("per-ride", args, per_ride)
+    await _run("batched", args, matcher.submit)
+    await bus.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_reset_argument(parser)
+    parser.add_argument("--drivers", type=int, default=3000, help="drivers waiting at the stand")
+    parser.add_argument("--burst", type=int, default=200, help="simultaneous ride requests per burst")
+    parser.add_argument("--bursts", type=int, default=10)
+    parser.add_argument("--window-ms", type=float, default=20.0, help="batch collection window")
+    parser.add_argument("--max-batch", type=int, default=64)
+    asyncio.run(main(parser.parse_args()))
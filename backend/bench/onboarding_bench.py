@@ -0,0 +1,96 @@
+"""
+Bulk onboarding vs. one sign-up request per driver.
+
+Creates `--drivers` drivers twice on an empty schema: once through
+`POST /drivers/drivers/` per row (`--concurrency` requests in flight), once through
+`POST /drivers/drivers/bulk` in batches of `--batch-size`. Prints rows/second and the
+SQL statements each path ran. Password hashing dominates both at the default Argon2
+cost; run with a cheap cost to see the DB side, e.g.
+
+    ARGON2_TIME_COST=1 ARGON2_MEMORY_COST=1024 ARGON2_PARALLELISM=1 \\
+        python -m bench.onboarding_bench --drivers 5000 --batch-size 1000
+"""
+import argparse
+import asyncio
+import os
+import time
+
+os.environ.setdefault("ADMIN_EMAILS", "admin@bench.example")
+
+from bench.common import add_reset_argument, reset_schema, start_app  # noqa: E402
+
+
+def _count_statements(engine, counter):
+    from sqlalchemy import event
+
+    event.listen(engine, "before_cursor_execute", lambda *args: counter.__setitem__(0, counter[0] + 1))
+
+
+async def _one_by_one(client, rows, concurrency):
+    pending = iter(rows)
+
+    async def worker():
+        for row in pending:
+            r = await client.post("/drivers/drivers/", json=row)
+            assert r.status_code == 200, r.text
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+def _admin_headers() -> dict:
+    from app.database import SessionLocal
+    from app.model import User
+    from app.utils.auth import create_access_token
+
+    with SessionLocal() as db:
+        admin = User(name="Bench admin", email="admin@bench.example", password="-")
+        db.add(admin)
+        db.commit()
+        return {"Authorization": "Bearer " + create_access_token({"sub": str(admin.id), "role": "user"})}
+
+
+async def _bulk(client, rows, batch_size):
+    headers = _admin_headers()
+    for offset in range(0, len(rows), batch_size):
+        r = await client.post("/drivers/drivers/bulk", json=rows[offset:offset + batch_size], headers=headers)
+        assert r.status_code == 200 and not r.json()["errors"], r.text
+
+
+async def main(args):
+    import httpx
+    from app.main import app
+    from app.database import SessionLocal, engine
+    from app.model import AutoStand
+
+    statements = [0]
+    _count_statements(engine, statements)
+    reset_schema(args.reset)
+    stop_app = await start_app(app)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for name, run in (("one by one", lambda rows: _one_by_one(client, rows, args.concurrency)),
+                          ("bulk", lambda rows: _bulk(client, rows, args.batch_size))):
+            reset_schema(args.reset)
+            with SessionLocal() as db:
+                stand = AutoStand(name="Bench stand", location="bench")
+                db.add(stand)
+                db.commit()
+                stand_id = stand.id
+            rows = [{"name": f"d{i}", "phone": f"bench-{i}", "stand_id": stand_id, "password": "secret"}
+                    for i in range(args.drivers)]
+            statements[0] = 0
+            start = time.perf_counter()
+            await run(rows)
+            elapsed = time.perf_counter() - start
+            print(f"{name:<11} {args.drivers} drivers in {elapsed:7.2f}s  {args.drivers / elapsed:8.0f} rows/s  "
+                  f"{statements[0]:6} SQL statements")
+    await stop_app()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_reset_argument(parser)
+    parser.add_argument("--drivers", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=8, help="sign-up requests in flight (one by one)")
+    asyncio.run(main(parser.parse_args()))
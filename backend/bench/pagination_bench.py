@@ -0,0 +1,84 @@
+"""
+List endpoints: OFFSET paging vs. keyset (cursor) paging at increasing depth.
+
+Seeds `--rides` rides, then times one page of ride_crud.get_rides at each depth
+both ways: `skip=depth` (the old OFFSET query) and the cursor of the row just
+before that depth. Keyset pages should cost the same at every depth; OFFSET
+pages grow with it. The filtered run pages the `completed` rides through
+ix_rides_status_requested_at_id.
+
+    python -m bench.pagination_bench --rides 200000 --page 100
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from bench.common import add_reset_argument, fmt, percentiles, reset_schema
+
+
+def _seed(rides: int, users: int, reset: bool):
+    from sqlalchemy import insert
+    from app.database import SessionLocal
+    from app.model import AutoStand, Ride, User
+
+    reset_schema(reset)
+    db = SessionLocal()
+    db.add(AutoStand(name="Bench stand", location="bench"))
+    db.add_all([User(name=f"u{i}", email=f"u{i}@bench", password="x") for i in range(users)])
+    db.commit()
+    user_ids = [u for (u,) in db.query(User.id).all()]
+    rng = random.Random(7)
+    start = datetime.utcnow() - timedelta(days=30)
+    for offset in range(0, rides, 10000):
+        db.execute(insert(Ride), [
+            {"user_id": rng.choice(user_ids), "start_location": "a", "end_location": "b",
+             "status": rng.choice(("pending", "accepted", "completed")),
+             "requested_at": start + timedelta(seconds=offset + i)}
+            for i in range(min(10000, rides - offset))
+        ])
+    db.commit()
+    db.close()
+
+
+def _time(fn, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return percentiles(samples)
+
+
+def main(args):
+    from app.crud import ride_crud
+    from app.database import SessionLocal
+    from app.utils.pagination import encode_cursor
+
+    _seed(args.rides, args.users, args.reset)
+    db = SessionLocal()
+    filters = [("all rides", {}), ("status=completed", {"status": "completed"})]
+    for label, flt in filters:
+        total = ride_crud.get_rides(db, limit=args.rides, **flt).items
+        print(f"{label}: {len(total)} rows")
+        depth = 0
+        while depth < len(total):
+            # the cursor a client would hold after paging down to `depth`
+            cursor = encode_cursor((total[depth - 1].requested_at, total[depth - 1].id)) if depth else None
+            offset = _time(lambda: ride_crud.get_rides(db, limit=args.page, skip=depth, **flt), args.repeat)
+            keyset = _time(lambda: ride_crud.get_rides(db, limit=args.page, cursor=cursor, **flt), args.repeat)
+            print(f"  depth {depth:>8}  offset {fmt(offset)}")
+            print(f"  {'':>14}  keyset {fmt(keyset)}")
+            depth = depth * 10 if depth else args.page * 10
+        db.expunge_all()
+    db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_reset_argument(parser)
+    parser.add_argument("--rides", type=int, default=200000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--page", type=int, default=100, help="rows per page")
+    parser.add_argument("--repeat", type=int, default=20, help="timed requests per depth")
+    main(parser.parse_args())
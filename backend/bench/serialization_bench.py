@@ -0,0 +1,108 @@
+"""
+Response serialization cost per item for a 1,000-row /drivers/ and /rides/ page.
+
+Loads one page of each through the CRUD layer, then times only the work done
+after the rows are loaded:
+
+  - dicts:   the old driver route, dicts built by hand under response_model=List[dict]
+             (serialize_response + JSONResponse)
+  - typed:   ORM rows under the typed response_model through FastAPI's own path
+  - orjson:  the same with ORJSONResponse (ORJSON_RESPONSES=true)
+  - page:    serialization.page_response, what the list routes now return
+             (validation and JSON encoding in one pydantic-core pass)
+
+    python -m bench.serialization_bench --items 1000 --repeat 50
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from bench.common import add_reset_argument, reset_schema
+
+
+def _seed(items: int, reset: bool) -> None:
+    from sqlalchemy import insert
+    from app.database import SessionLocal
+    from app.model import AutoStand, Driver, Ride, User
+
+    reset_schema(reset)
+    db = SessionLocal()
+    db.add(AutoStand(name="Bench stand", location="bench"))
+    db.add(User(name="Bench user", email="user@bench", password="x"))
+    db.commit()
+    db.execute(insert(Driver), [
+        {"name": f"Driver {i}", "phone": f"9{i:09d}", "password": "x", "stand_id": 1, "is_available": i % 2 == 0}
+        for i in range(items)
+    ])
+    start = datetime.utcnow() - timedelta(days=1)
+    db.execute(insert(Ride), [
+        {"user_id": 1, "driver_id": i + 1, "stand_id": 1, "start_location": "Stand road", "end_location": f"Block {i}",
+         "pickup_lat": 9.98, "pickup_lng": 76.28, "status": "completed", "requested_at": start + timedelta(seconds=i),
+         "accepted_at": start + timedelta(seconds=i + 5), "started_at": start + timedelta(seconds=i + 60),
+         "completed_at": start + timedelta(seconds=i + 900)}
+        for i in range(items)
+    ])
+    db.commit()
+    db.close()
+
+
+def _time(label: str, fn, items: int, repeat: int, rounds: int = 5) -> None:
+    body = fn()  # warm-up (schema build, caches)
+    best = float("inf")
+    # best round, as timeit does: slower rounds measure the machine, not the code
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        best = min(best, time.perf_counter() - start)
+    per_item = best / repeat / items * 1e6
+    print(f"  {label:<8} {per_item:6.2f} us/item  ({len(body) / items:.0f} bytes/item)")
+
+
+def main(args):
+    from fastapi.responses import JSONResponse, ORJSONResponse
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_response_field
+    from app.crud import driver_crud, ride_crud
+    from app.database import SessionLocal
+    from app.schemas import DriverResponse, RideResponse
+    from app.utils.pagination import Page
+    from app.utils.serialization import page_response
+
+    _seed(args.items, args.reset)
+    db = SessionLocal()
+    drivers = driver_crud.get_drivers(db, limit=args.items).items
+    rides = ride_crud.get_rides(db, limit=args.items).items
+    db.close()  # rows stay loaded; nothing below touches the DB
+
+    def render(field, content, response_class):
+        value = asyncio.run(serialize_response(field=field, response_content=content))
+        return response_class(value).body
+
+    dict_field = create_response_field(name="Response", type_=List[dict])
+    driver_field = create_response_field(name="Response", type_=List[DriverResponse])
+    ride_field = create_response_field(name="Response", type_=List[RideResponse])
+
+    def driver_dicts():
+        return [{"id": d.id, "name": d.name, "phone": d.phone, "stand_id": d.stand_id, "is_available": d.is_available}
+                for d in drivers]
+
+    print(f"/drivers/ ({len(drivers)} rows)")
+    _time("dicts", lambda: render(dict_field, driver_dicts(), JSONResponse), len(drivers), args.repeat)
+    _time("typed", lambda: render(driver_field, drivers, JSONResponse), len(drivers), args.repeat)
+    _time("orjson", lambda: render(driver_field, drivers, ORJSONResponse), len(drivers), args.repeat)
+    _time("page", lambda: page_response(DriverResponse, Page(drivers, None)).body, len(drivers), args.repeat)
+    print(f"/rides/ ({len(rides)} rows)")
+    _time("typed", lambda: render(ride_field, rides, JSONResponse), len(rides), args.repeat)
+    _time("orjson", lambda: render(ride_field, rides, ORJSONResponse), len(rides), args.repeat)
+    _time("page", lambda: page_response(RideResponse, Page(rides, None)).body, len(rides), args.repeat)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_reset_argument(parser)
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    main(parser.parse_args())
@@ -0,0 +1,24 @@
+-- Partial indexes on stand_queue for the hot queue paths.
+-- Only `waiting` rows are indexed, so the growing assigned/left history does not
+-- slow down pops, joins or position lookups.
+
+BEGIN;
+
+-- keep only the newest waiting row per driver before enforcing uniqueness
+UPDATE stand_queue sq
+SET status = 'left'
+WHERE sq.status = 'waiting'
+  AND EXISTS (
+    SELECT 1 FROM stand_queue newer
+    WHERE newer.driver_id = sq.driver_id
+      AND newer.status = 'waiting'
+      AND (newer.joined_at, newer.id) > (sq.joined_at, sq.id)
+  );
+
+CREATE INDEX IF NOT EXISTS ix_stand_queue_waiting
+  ON stand_queue (stand_id, joined_at, id) WHERE status = 'waiting';
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_stand_queue_driver_waiting
+  ON stand_queue (driver_id) WHERE status = 'waiting';
+
+COMMIT;
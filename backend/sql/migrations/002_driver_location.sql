@@ -0,0 +1,10 @@
+-- Last known driver position, bulk-written by the location flusher.
+-- Timestamps are naive UTC like the rest of the ORM-managed columns.
+
+BEGIN;
+
+ALTER TABLE drivers ADD COLUMN IF NOT EXISTS latitude double precision;
+ALTER TABLE drivers ADD COLUMN IF NOT EXISTS longitude double precision;
+ALTER TABLE drivers ADD COLUMN IF NOT EXISTS location_updated_at timestamp;
+
+COMMIT;
@@ -0,0 +1,12 @@
+-- Stand coordinates for the in-memory stand index, and the pickup point of a ride
+-- so assignment can fall back to the nearest stands with waiting drivers.
+
+BEGIN;
+
+ALTER TABLE autostands ADD COLUMN IF NOT EXISTS latitude double precision;
+ALTER TABLE autostands ADD COLUMN IF NOT EXISTS longitude double precision;
+
+ALTER TABLE rides ADD COLUMN IF NOT EXISTS pickup_lat double precision;
+ALTER TABLE rides ADD COLUMN IF NOT EXISTS pickup_lng double precision;
+
+COMMIT;
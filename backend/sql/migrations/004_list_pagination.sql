@@ -0,0 +1,20 @@
+-- Keyset pagination of the list endpoints (GET /users, /drivers, /rides, /stands).
+-- Each index is the equality filter followed by the sort key, so any page of a
+-- filtered list is a single index range scan. users/autostands page on the
+-- primary key alone.
+-- rides.stand_id records the stand a ride was dispatched from, for ?stand_id=.
+-- On a busy table, run the CREATE INDEX statements one by one with CONCURRENTLY
+-- (outside a transaction) instead.
+
+BEGIN;
+
+ALTER TABLE rides ADD COLUMN IF NOT EXISTS stand_id integer REFERENCES autostands(id);
+
+CREATE INDEX IF NOT EXISTS ix_drivers_stand_id_id ON drivers (stand_id, id);
+CREATE INDEX IF NOT EXISTS ix_rides_requested_at_id ON rides (requested_at, id);
+CREATE INDEX IF NOT EXISTS ix_rides_status_requested_at_id ON rides (status, requested_at, id);
+CREATE INDEX IF NOT EXISTS ix_rides_user_id_requested_at_id ON rides (user_id, requested_at, id);
+CREATE INDEX IF NOT EXISTS ix_rides_driver_id_requested_at_id ON rides (driver_id, requested_at, id);
+CREATE INDEX IF NOT EXISTS ix_rides_stand_id_requested_at_id ON rides (stand_id, requested_at, id);
+
+COMMIT;
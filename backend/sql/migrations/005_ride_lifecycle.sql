@@ -0,0 +1,31 @@
+-- Ride lifecycle: pending -> accepted -> ongoing -> completed, or cancelled before
+-- the trip starts. Each transition records its timestamp. Active rides get partial
+-- indexes so "my current ride" lookups do not scan a user's or driver's whole history.
+
+BEGIN;
+
+ALTER TABLE rides ADD COLUMN IF NOT EXISTS accepted_at timestamp;
+ALTER TABLE rides ADD COLUMN IF NOT EXISTS started_at timestamp;
+ALTER TABLE rides ADD COLUMN IF NOT EXISTS completed_at timestamp;
+ALTER TABLE rides ADD COLUMN IF NOT EXISTS cancelled_at timestamp;
+
+-- rides assigned before this migration were accepted when they were requested
+UPDATE rides SET accepted_at = requested_at
+WHERE status = 'accepted' AND driver_id IS NOT NULL AND accepted_at IS NULL;
+
+-- NOT VALID: enforced for new writes without scanning (or rejecting) old rows;
+-- run ALTER TABLE rides VALIDATE CONSTRAINT ck_rides_status once they are clean
+DO $$
+BEGIN
+  IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'ck_rides_status') THEN
+    ALTER TABLE rides ADD CONSTRAINT ck_rides_status
+      CHECK (status IN ('pending', 'accepted', 'ongoing', 'completed', 'cancelled')) NOT VALID;
+  END IF;
+END $$;
+
+CREATE INDEX IF NOT EXISTS ix_rides_user_active
+  ON rides (user_id) WHERE status IN ('pending', 'accepted', 'ongoing');
+CREATE INDEX IF NOT EXISTS ix_rides_driver_active
+  ON rides (driver_id) WHERE status IN ('pending', 'accepted', 'ongoing');
+
+COMMIT;
@@ -0,0 +1,28 @@
+-- Queue housekeeping (services/queue_maintenance.py): a driver heartbeat for expiring
+-- waiting rows of drivers whose app has died, and an archive table for finished rows.
+-- History keeps the original stand_queue ids and no foreign keys, so drivers and stands
+-- can still be deleted once their rows are archived.
+
+BEGIN;
+
+ALTER TABLE drivers ADD COLUMN IF NOT EXISTS last_seen_at timestamp;
+-- existing waiting drivers get one timeout of grace instead of being expired on the first run
+UPDATE drivers SET last_seen_at = now() AT TIME ZONE 'utc'
+WHERE last_seen_at IS NULL
+  AND id IN (SELECT driver_id FROM stand_queue WHERE status = 'waiting');
+
+CREATE TABLE IF NOT EXISTS stand_queue_history (
+  id integer PRIMARY KEY,
+  stand_id integer NOT NULL,
+  driver_id integer NOT NULL,
+  joined_at timestamptz,
+  status text NOT NULL,
+  archived_at timestamp DEFAULT (now() AT TIME ZONE 'utc')
+);
+
+CREATE INDEX IF NOT EXISTS ix_stand_queue_history_joined_at_id
+  ON stand_queue_history (joined_at, id);
+CREATE INDEX IF NOT EXISTS ix_stand_queue_history_stand_joined_at
+  ON stand_queue_history (stand_id, joined_at, id);
+
+COMMIT;
@@ -0,0 +1,20 @@
+-- Queue pops now pass over waiting drivers who are not available (services/availability_service.py),
+-- and joining a queue marks a driver available. Drivers already waiting joined when pops
+-- ignored availability, so they are marked available to keep their turn.
+--
+-- Data only, and only once: `migrate` re-applies every file to a database without
+-- schema_migrations, and by then a waiting driver may have gone unavailable on purpose.
+-- The column comment set below marks the update as done.
+
+BEGIN;
+
+UPDATE drivers SET is_available = true
+WHERE is_available IS NOT TRUE
+  AND id IN (SELECT driver_id FROM stand_queue WHERE status = 'waiting')
+  AND col_description('drivers'::regclass,
+                      (SELECT attnum FROM pg_attribute
+                       WHERE attrelid = 'drivers'::regclass AND attname = 'is_available')) IS NULL;
+
+COMMENT ON COLUMN drivers.is_available IS 'Queue pops pass over waiting drivers that are not available';
+
+COMMIT;
@@ -0,0 +1,19 @@
+-- Idempotency-Key support for ride booking and queue join/pop (crud/idempotency_crud.py):
+-- the response of a keyed request, stored in the same transaction as its work, so a retry
+-- is answered from here instead of creating another ride or popping another driver.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+  scope text NOT NULL,
+  key text NOT NULL,
+  fingerprint text NOT NULL,
+  status_code integer,
+  body text,
+  created_at timestamp DEFAULT (now() AT TIME ZONE 'utc'),
+  PRIMARY KEY (scope, key)
+);
+
+CREATE INDEX IF NOT EXISTS ix_idempotency_keys_created_at ON idempotency_keys (created_at);
+
+COMMIT;
@@ -0,0 +1,20 @@
+-- The ride lifecycle timestamps from 005 were created as timestamp while requested_at is
+-- timestamptz; convert them (their values are UTC) so all ride times compare alike.
+-- Columns that are already timestamptz (databases created from schema.sql) are left alone.
+
+BEGIN;
+
+DO $$
+DECLARE
+  col text;
+BEGIN
+  FOREACH col IN ARRAY ARRAY['accepted_at', 'started_at', 'completed_at', 'cancelled_at'] LOOP
+    IF EXISTS (SELECT 1 FROM information_schema.columns
+               WHERE table_name = 'rides' AND column_name = col
+                 AND data_type = 'timestamp without time zone') THEN
+      EXECUTE format('ALTER TABLE rides ALTER COLUMN %I TYPE timestamptz USING %I AT TIME ZONE ''utc''', col, col);
+    END IF;
+  END LOOP;
+END $$;
+
+COMMIT;
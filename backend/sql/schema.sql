@@ -9,7 +9,9 @@ CREATE TABLE IF NOT EXISTS users (
 CREATE TABLE IF NOT EXISTS autostands (
   id serial PRIMARY KEY,
   name text NOT NULL,
-  location text NOT NULL
+  location text NOT NULL,
+  latitude double precision,
+  longitude double precision
 );
 
 CREATE TABLE IF NOT EXISTS drivers (
@@ -19,7 +21,11 @@ CREATE TABLE IF NOT EXISTS drivers (
   password text NOT NULL,
   is_available boolean DEFAULT false,
   stand_id integer REFERENCES autostands(id),
-  created_at timestamptz DEFAULT now()
+  created_at timestamptz DEFAULT now(),
+  latitude double precision,
+  longitude double precision,
+  location_updated_at timestamp,
+  last_seen_at timestamp
 );
 
 CREATE TABLE IF NOT EXISTS rides (
@@ -28,8 +34,16 @@ CREATE TABLE IF NOT EXISTS rides (
   driver_id integer REFERENCES drivers(id),
   start_location text NOT NULL,
   end_location text NOT NULL,
-  status text DEFAULT 'pending',
-  requested_at timestamptz DEFAULT now()
+  pickup_lat double precision,
+  pickup_lng double precision,
+  stand_id integer REFERENCES autostands(id),
+  status text DEFAULT 'pending'
+    CONSTRAINT ck_rides_status CHECK (status IN ('pending', 'accepted', 'ongoing', 'completed', 'cancelled')),
+  requested_at timestamptz DEFAULT now(),
+  accepted_at timestamptz,
+  started_at timestamptz,
+  completed_at timestamptz,
+  cancelled_at timestamptz
 );
 
 CREATE TABLE IF NOT EXISTS stand_queue (
@@ -39,3 +53,58 @@ CREATE TABLE IF NOT EXISTS stand_queue (
   joined_at timestamptz DEFAULT now(),
   status text DEFAULT 'waiting'
 );
+
+-- finished stand_queue rows (assigned / left / expired), moved in batches by the scheduler
+CREATE TABLE IF NOT EXISTS stand_queue_history (
+  id integer PRIMARY KEY,
+  stand_id integer NOT NULL,
+  driver_id integer NOT NULL,
+  joined_at timestamptz,
+  status text NOT NULL,
+  archived_at timestamp DEFAULT (now() AT TIME ZONE 'utc')
+);
+
+-- responses of requests sent with an Idempotency-Key header, purged by the scheduler after IDEMPOTENCY_TTL
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+  scope text NOT NULL,
+  key text NOT NULL,
+  fingerprint text NOT NULL,
+  status_code integer,
+  body text,
+  created_at timestamp DEFAULT (now() AT TIME ZONE 'utc'),
+  PRIMARY KEY (scope, key)
+);
+
+-- waiting rows of a stand in FIFO order (pop / queue listing / position count)
+CREATE INDEX IF NOT EXISTS ix_stand_queue_waiting
+  ON stand_queue (stand_id, joined_at, id) WHERE status = 'waiting';
+
+-- one waiting row per driver
+CREATE UNIQUE INDEX IF NOT EXISTS uq_stand_queue_driver_waiting
+  ON stand_queue (driver_id) WHERE status = 'waiting';
+
+-- keyset pagination of the list endpoints: equality filter, then the sort key
+CREATE INDEX IF NOT EXISTS ix_drivers_stand_id_id ON drivers (stand_id, id);
+CREATE INDEX IF NOT EXISTS ix_rides_requested_at_id ON rides (requested_at, id);
+CREATE INDEX IF NOT EXISTS ix_rides_status_requested_at_id ON rides (status, requested_at, id);
+CREATE INDEX IF NOT EXISTS ix_rides_user_id_requested_at_id ON rides (user_id, requested_at, id);
+CREATE INDEX IF NOT EXISTS ix_rides_driver_id_requested_at_id ON rides (driver_id, requested_at, id);
+CREATE INDEX IF NOT EXISTS ix_rides_stand_id_requested_at_id ON rides (stand_id, requested_at, id);
+
+-- in-flight rides only ("my current ride" for riders and drivers)
+CREATE INDEX IF NOT EXISTS ix_rides_user_active
+  ON rides (user_id) WHERE status IN ('pending', 'accepted', 'ongoing');
+CREATE INDEX IF NOT EXISTS ix_rides_driver_active
+  ON rides (driver_id) WHERE status IN ('pending', 'accepted', 'ongoing');
+
+-- queue history exports: time range, optionally of one stand
+CREATE INDEX IF NOT EXISTS ix_stand_queue_history_joined_at_id
+  ON stand_queue_history (joined_at, id);
+CREATE INDEX IF NOT EXISTS ix_stand_queue_history_stand_joined_at
+  ON stand_queue_history (stand_id, joined_at, id);
+
+-- idempotency key purge: oldest first
+CREATE INDEX IF NOT EXISTS ix_idempotency_keys_created_at ON idempotency_keys (created_at);
+
+-- also marks migration 007's one-off data update as done
+COMMENT ON COLUMN drivers.is_available IS 'Queue pops pass over waiting drivers that are not available';